@@ -0,0 +1,172 @@
+import os
+import logging
+import pickle
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional
+from dotenv import load_dotenv
+
+from bar_store import last_trading_day
+from instrumentation import count_error
+from market_cache import CacheStats, LRUCache
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYTICS_CACHE_MAX_ENTRIES", "1024"))
+# Entries are replaced by version and epoch changes; the TTL only bounds memory for idle portfolios
+ANALYTICS_CACHE_TTL = int(os.getenv("ANALYTICS_CACHE_TTL", "86400"))
+# Shared tier and epochs for multi-worker deployments, e.g. redis://localhost:6379/0
+ANALYTICS_CACHE_REDIS_URL = os.getenv("ANALYTICS_CACHE_REDIS_URL")
+
+REDIS_PREFIX = "analytics"
+# Epoch bumped for every symbol at once, when daily bars or snapshots are written
+ALL_SYMBOLS = "*"
+
+
+class MarketEpochs:
+    """Counters bumped whenever the market data behind a symbol changes.
+
+    A portfolio's ETag includes only the epochs of the symbols it holds, so
+    a price change for one symbol leaves every other portfolio's cached
+    result valid.
+    """
+
+    def __init__(self, redis=None):
+        self.redis = redis
+        # In-process epochs restart from a new base, so an ETag issued before a restart never matches
+        self._epochs: Dict[str, int] = {ALL_SYMBOLS: time.time_ns()}
+        self._lock = threading.Lock()
+
+    def bump(self, symbols: Optional[Iterable[str]] = None):
+        """Advance the given symbols, or every symbol when None"""
+        fields = [ALL_SYMBOLS] if symbols is None else list(dict.fromkeys(symbols))
+        if not fields:
+            return
+        if self.redis is not None:
+            pipe = self.redis.pipeline(transaction=False)
+            for field in fields:
+                pipe.hincrby(f"{REDIS_PREFIX}:epochs", field, 1)
+            pipe.execute()
+            return
+        with self._lock:
+            for field in fields:
+                self._epochs[field] = self._epochs.get(field, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        """Every epoch, read before the data it will validate so a concurrent bump is never missed"""
+        if self.redis is not None:
+            return {field.decode(): int(value) for field, value in self.redis.hgetall(f"{REDIS_PREFIX}:epochs").items()}
+        with self._lock:
+            return dict(self._epochs)
+
+
+class AnalyticsCache:
+    """Portfolio analytics results, one entry per portfolio, validated by ETag.
+
+    The ETag covers everything a result is computed from: the portfolio's
+    ledger version (bumped by every holding or transaction write), the
+    market epochs of its symbols and the last trading day. A stale entry is
+    never served, because its ETag no longer matches; writers also drop the
+    entry so it does not sit in memory.
+    """
+
+    def __init__(self, max_entries: int = ANALYTICS_CACHE_MAX_ENTRIES, ttl: int = ANALYTICS_CACHE_TTL,
+                 redis_url: Optional[str] = ANALYTICS_CACHE_REDIS_URL):
+        self.stats = CacheStats()
+        self.memory = LRUCache(max_entries, self.stats)
+        self.ttl = ttl
+        self.redis = None
+        if redis_url:
+            import redis
+
+            self.redis = redis.Redis.from_url(redis_url)
+        self.epochs = MarketEpochs(self.redis)
+
+    def epochs_snapshot(self) -> Optional[Dict[str, int]]:
+        """Market epochs to build an ETag from, or None (no caching) when they cannot be read"""
+        try:
+            return self.epochs.snapshot()
+        except Exception as e:
+            logger.warning("Error reading market epochs: %s", e)
+            count_error("analytics_cache", e)
+            return None
+
+    @staticmethod
+    def etag(portfolio_id: int, version: int, symbols: Iterable[str], epochs: Dict[str, int]) -> str:
+        """Validator for a portfolio's state; epochs must be read before the holdings were loaded"""
+        held = sorted((symbol, epochs.get(symbol, 0)) for symbol in set(symbols))
+        state = (portfolio_id, version, last_trading_day().isoformat(), epochs.get(ALL_SYMBOLS, 0), held)
+        return '"' + hashlib.sha1(repr(state).encode()).hexdigest()[:20] + '"'
+
+    def get(self, portfolio_id: int, etag: str) -> Optional[Any]:
+        found, entry = self.memory.get(portfolio_id)
+        if not found and self.redis is not None:
+            try:
+                raw = self.redis.get(f"{REDIS_PREFIX}:result:{portfolio_id}")
+            except Exception as e:
+                logger.warning("Error reading analytics cache for portfolio %s: %s", portfolio_id, e)
+                count_error("analytics_cache", e)
+                raw = None
+            if raw is not None:
+                entry = pickle.loads(raw)
+                found = True
+                self.stats.record("persistent_hits")
+                self.memory.set(portfolio_id, entry, time.time() + self.ttl)
+        if found and entry[0] == etag:
+            self.stats.record("hits")
+            return entry[1]
+        if found:
+            self.stats.record("expirations")
+        self.stats.record("misses")
+        return None
+
+    def set(self, portfolio_id: int, etag: str, value: Any):
+        entry = (etag, value)
+        self.memory.set(portfolio_id, entry, time.time() + self.ttl)
+        if self.redis is not None:
+            try:
+                self.redis.set(f"{REDIS_PREFIX}:result:{portfolio_id}", pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL), ex=self.ttl)
+            except Exception as e:
+                logger.warning("Error writing analytics cache for portfolio %s: %s", portfolio_id, e)
+                count_error("analytics_cache", e)
+
+    def invalidate(self, portfolio_id: int):
+        self.memory.delete(portfolio_id)
+        if self.redis is not None:
+            try:
+                self.redis.delete(f"{REDIS_PREFIX}:result:{portfolio_id}")
+            except Exception as e:
+                logger.warning("Error invalidating analytics cache for portfolio %s: %s", portfolio_id, e)
+                count_error("analytics_cache", e)
+
+    def market_changed(self, symbols: Optional[Iterable[str]] = None):
+        """Record new prices for symbols (every symbol when None)"""
+        try:
+            self.epochs.bump(symbols)
+        except Exception as e:
+            # Without the bump, cached results could outlive the prices they were computed from
+            logger.warning("Error bumping market epochs, clearing analytics cache: %s", e)
+            count_error("analytics_cache", e)
+            self.memory.clear()
+
+    def get_stats(self) -> Dict:
+        stats = self.stats.as_dict()
+        stats["entries"] = len(self.memory)
+        stats["backend"] = "redis" if self.redis is not None else "memory"
+        return stats
+
+
+def if_none_match(header: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header matches etag (weak comparison, as RFC 9110 requires)"""
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+# Shared by the API and the writers of prices and snapshots in this process
+default_analytics_cache = AnalyticsCache()
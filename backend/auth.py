@@ -1,14 +1,21 @@
 import os
+import hmac
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 
-from database import get_db
+from database import SessionLocal
+from market_cache import CacheStats, LRUCache
 from models import User
 from schemas import TokenData
 
@@ -17,16 +24,110 @@ load_dotenv()
 SECRET_KEY = os.getenv("JWT_SECRET_KEY")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+# Bearer token that lets a metrics scraper read the stats endpoints without an admin login
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt cost factor; existing hashes with another cost are rehashed on the next login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Hashes allowed to wait for a worker; beyond that logins get 503 instead of queueing without bound
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+# Seconds a token subject's user row is reused without a query; bounds how long a deactivation
+# takes to reach other worker processes
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
+
+class TimingStats:
+    """Call counts and latencies of named operations"""
+
+    def __init__(self):
+        self._timings: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            timing = self._timings.setdefault(name, [0, 0.0, 0.0])
+            timing[0] += 1
+            timing[1] += seconds
+            timing[2] = max(timing[2], seconds)
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            return {
+                name: {"count": count, "mean_ms": round(total / count * 1000, 3), "max_ms": round(peak * 1000, 3)}
+                for name, (count, total, peak) in self._timings.items()
+            }
+
+
+class Principal:
+    """The authenticated user as handlers see it: a read-only copy of the fields they need.
+
+    It is shared between concurrent requests through the principal cache, so
+    it holds plain values rather than an ORM row bound to some session.
+    """
+
+    __slots__ = ("id", "username", "is_active", "is_admin")
+
+    def __init__(self, id: int, username: str, is_active: bool, is_admin: bool):
+        object.__setattr__(self, "id", id)
+        object.__setattr__(self, "username", username)
+        object.__setattr__(self, "is_active", is_active)
+        object.__setattr__(self, "is_admin", is_admin)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Principal is read-only")
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(user.id, user.username, user.is_active is not False, user.username in ADMIN_USERNAMES)
+
+
+auth_timings = TimingStats()
+# Principals by token subject
+principal_cache = LRUCache(PRINCIPAL_CACHE_MAX_ENTRIES, CacheStats())
+
+# bcrypt releases the GIL, so a few dedicated threads hash in parallel without touching the request threadpool
+hash_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_hash_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+async def _hashing(name: str, fn, *args):
+    """Run a bcrypt call on the hash executor, recording queue wait and hashing time"""
+    if not _hash_slots.acquire(blocking=False):
+        auth_timings.record("hash_rejected", 0.0)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many logins in progress, retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    submitted = time.perf_counter()
+    
+    def timed():
+        started = time.perf_counter()
+        auth_timings.record("hash_queue_wait", started - submitted)
+        try:
+            return fn(*args)
+        finally:
+            auth_timings.record(name, time.perf_counter() - started)
+    
+    try:
+        return await asyncio.wrap_future(hash_executor.submit(timed))
+    finally:
+        _hash_slots.release()
+
+async def aget_password_hash(password: str) -> str:
+    return await _hashing("password_hash", pwd_context.hash, password)
+
 def get_user(db: Session, username: str):
     return db.query(User).filter(User.username == username).first()
 
@@ -38,6 +139,23 @@ def authenticate_user(db: Session, username: str, password: str):
         return False
     return user
 
+async def aauthenticate_user(db: Session, username: str, password: str):
+    """authenticate_user with bcrypt on the hash executor; upgrades hashes made with another cost"""
+    user = await run_in_threadpool(get_user, db, username)
+    if not user or user.is_active is False:
+        return False
+    valid, new_hash = await _hashing("password_verify", pwd_context.verify_and_update, password, user.hashed_password)
+    if not valid:
+        return False
+    if new_hash:
+        user.hashed_password = new_hash
+        await run_in_threadpool(db.commit)
+    return user
+
+def invalidate_principal(username: str):
+    """Forget a cached user, e.g. after deactivating it"""
+    principal_cache.delete(username)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -48,7 +166,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+def get_user_from_token(db: Session, token: str) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -62,7 +180,49 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         token_data = TokenData(username=username)
     except JWTError:
         raise credentials_exception
-    user = get_user(db, username=token_data.username)
-    if user is None:
+    found, principal = principal_cache.get(token_data.username)
+    if found:
+        principal_cache.stats.record("hits")
+    else:
+        principal_cache.stats.record("misses")
+        user = get_user(db, username=token_data.username)
+        principal = Principal.from_user(user) if user is not None else None
+        if principal is not None:
+            principal_cache.set(token_data.username, principal, time.time() + PRINCIPAL_CACHE_TTL)
+    if principal is None or not principal.is_active:
         raise credentials_exception
-    return user
+    return principal
+
+def get_current_user(token: str = Depends(oauth2_scheme)) -> Principal:
+    started = time.perf_counter()
+    # A session of its own, opened only on a cache miss's query and closed straight after,
+    # so the lookup neither holds a connection for the request nor touches the handler's session
+    db = SessionLocal()
+    try:
+        principal = get_user_from_token(db, token)
+    finally:
+        db.close()
+    auth_timings.record("principal_lookup", time.perf_counter() - started)
+    return principal
+
+def auth_stats() -> Dict:
+    return {
+        "principal_cache": {**principal_cache.stats.as_dict(), "entries": len(principal_cache)},
+        "timings": auth_timings.as_dict(),
+        "bcrypt_rounds": BCRYPT_ROUNDS,
+        "hash_workers": PASSWORD_HASH_WORKERS,
+    }
+
+def require_admin(principal: Principal) -> Principal:
+    if not principal.is_admin:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
+    return principal
+
+async def get_current_admin(current_user: Principal = Depends(get_current_user)):
+    return require_admin(current_user)
+
+def get_stats_reader(token: str = Depends(oauth2_scheme)) -> Optional[Principal]:
+    """An admin, or None for a scraper presenting METRICS_TOKEN"""
+    if METRICS_TOKEN and hmac.compare_digest(token.encode(), METRICS_TOKEN.encode()):
+        return None
+    return require_admin(get_current_user(token))
@@ -0,0 +1,302 @@
+import os
+import json
+import argparse
+import itertools
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from indicators import rolling_mean, rsi
+from portfolio_analytics import PortfolioAnalytics
+from request_scheduler import Priority
+
+load_dotenv()
+
+BACKTEST_COST_BPS = float(os.getenv("BACKTEST_COST_BPS", "5"))
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", str(os.cpu_count() or 1)))
+TRADING_DAYS = 252
+
+
+def load_bars(analytics: PortfolioAnalytics, symbols: List[str], days: int, field: str = 'close',
+              priority: Priority = Priority.BATCH, histories: Optional[Dict[str, pd.DataFrame]] = None) -> pd.DataFrame:
+    """One bar field as a dates x symbols frame, from the price matrix when it covers the symbols.
+
+    histories may hold frames already fetched with afetch_histories.
+    """
+    symbols = list(dict.fromkeys(symbols))
+    matrix = analytics.price_matrix
+    if matrix.is_current() and matrix.covers(symbols):
+        if field == 'close':
+            dates, closes = matrix.closes(symbols, days)
+            return pd.DataFrame(np.asarray(closes, dtype=np.float64), index=dates, columns=symbols)
+        frames = {symbol: matrix.frame(symbol, days)[field] for symbol in symbols}
+    else:
+        if histories is None:
+            histories = {symbol: analytics.get_historical_data(symbol, days, priority) for symbol in symbols}
+        frames = {symbol: histories[symbol].tail(days)[field] for symbol in symbols
+                  if symbol in histories and not histories[symbol].empty}
+    frames = {symbol: values for symbol, values in frames.items() if not values.empty}
+    return pd.DataFrame(frames).sort_index().ffill() if frames else pd.DataFrame()
+
+
+def performance(equity: np.ndarray) -> Dict:
+    """Summary statistics of a daily equity curve starting at 1.0"""
+    returns = np.diff(equity) / equity[:-1]
+    years = max(len(returns) / TRADING_DAYS, 1 / TRADING_DAYS)
+    peaks = np.maximum.accumulate(equity)
+    volatility = returns.std(ddof=1) * np.sqrt(TRADING_DAYS) if len(returns) > 1 else 0.0
+    total = equity[-1] / equity[0] - 1
+    annual = (equity[-1] / equity[0]) ** (1 / years) - 1 if equity[-1] > 0 else -1.0
+    return {
+        "total_return": round(float(total) * 100, 2),
+        "annual_return": round(float(annual) * 100, 2),
+        "annual_volatility": round(float(volatility) * 100, 2),
+        "sharpe_ratio": round(float(returns.mean() * TRADING_DAYS / volatility), 3) if volatility > 0 else 0.0,
+        "max_drawdown": round(float((equity / peaks - 1).min()) * 100, 2),
+    }
+
+
+def replay_transactions(transactions: List[Dict], closes: pd.DataFrame, initial_cash: float = 0.0) -> pd.DataFrame:
+    """Daily market value, cash and P&L implied by a transaction history.
+
+    transactions are dicts with symbol, transaction_type (BUY/SELL), shares,
+    price and transaction_date. Trades on non-trading days count from the
+    next trading day. Cash starts at initial_cash and may go negative, which
+    represents money paid in from outside the portfolio.
+    """
+    if closes.empty:
+        return pd.DataFrame(columns=["market_value", "cash", "net_invested", "total_value", "pnl"])
+
+    dates = closes.index
+    columns = {symbol: i for i, symbol in enumerate(closes.columns)}
+    share_changes = np.zeros(closes.shape)
+    cash_changes = np.zeros(len(dates))
+
+    for tx in transactions:
+        when = pd.Timestamp(tx['transaction_date'])
+        if when.tzinfo is not None:
+            when = when.tz_convert(None)
+        row = min(dates.searchsorted(when.normalize()), len(dates) - 1)
+        sign = 1 if tx['transaction_type'] == "BUY" else -1
+        if tx['symbol'] in columns:
+            share_changes[row, columns[tx['symbol']]] += sign * tx['shares']
+        cash_changes[row] -= sign * tx['shares'] * tx['price']
+
+    shares = np.cumsum(share_changes, axis=0)
+    market_value = np.nansum(shares * closes.to_numpy(dtype=np.float64), axis=1)
+    net_invested = 0.0 - np.cumsum(cash_changes)
+    cash = initial_cash - net_invested
+    return pd.DataFrame({
+        "market_value": market_value,
+        "cash": cash,
+        "net_invested": net_invested,
+        "total_value": market_value + cash,
+        "pnl": market_value - net_invested,
+    }, index=dates)
+
+
+def ma_crossover(closes: np.ndarray, fast: int = 20, slow: int = 50) -> np.ndarray:
+    """Long while the fast moving average is above the slow one"""
+    with np.errstate(invalid='ignore'):
+        return (rolling_mean(closes, fast) > rolling_mean(closes, slow)).astype(np.float64)
+
+
+def rsi_reversion(closes: np.ndarray, window: int = 14, lower: float = 30, upper: float = 70) -> np.ndarray:
+    """Enter when RSI falls below lower and hold until it rises above upper"""
+    values = rsi(closes, window)
+    signal = np.full(closes.shape, np.nan)
+    signal[values < lower] = 1.0
+    signal[values > upper] = 0.0
+    # Carry the last entry/exit forward: pandas' ffill along the date axis
+    return pd.DataFrame(signal).ffill().fillna(0.0).to_numpy()
+
+
+def buy_and_hold(closes: np.ndarray) -> np.ndarray:
+    return np.isfinite(closes).astype(np.float64)
+
+
+STRATEGIES: Dict[str, Callable[..., np.ndarray]] = {
+    "ma_crossover": ma_crossover,
+    "rsi_reversion": rsi_reversion,
+    "buy_and_hold": buy_and_hold,
+}
+
+
+def run_signals(closes: np.ndarray, signals: np.ndarray, cost_bps: float = BACKTEST_COST_BPS) -> Dict:
+    """Vectorized backtest of 0/1 signals (dates x symbols).
+
+    A signal seen at one close is traded at that close and earns the next
+    day's return. Capital is split equally across the symbols held each day,
+    and turnover is charged cost_bps.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = np.nan_to_num(closes[1:] / closes[:-1] - 1, nan=0.0, posinf=0.0, neginf=0.0)
+    held = np.nan_to_num(signals[:-1], nan=0.0)
+    counts = held.sum(axis=1, keepdims=True)
+    weights = np.divide(held, counts, out=np.zeros_like(held), where=counts > 0)
+
+    turnover = np.abs(np.diff(weights, axis=0, prepend=np.zeros((1, weights.shape[1])))).sum(axis=1)
+    daily = (weights * returns).sum(axis=1) - turnover * cost_bps / 10000
+    equity = np.concatenate([[1.0], np.cumprod(1 + daily)])
+
+    entries = int(((held[1:] > 0) & (held[:-1] == 0)).sum() + (held[0] > 0).sum()) if len(held) else 0
+    return {
+        **performance(equity),
+        "trades": entries,
+        "exposure": round(float((counts[:, 0] > 0).mean()) * 100, 2) if len(counts) else 0.0,
+        "turnover": round(float(turnover.sum()), 2),
+        "equity": equity,
+    }
+
+
+def run_strategy(closes: pd.DataFrame, strategy: str, params: Optional[Dict] = None,
+                 cost_bps: float = BACKTEST_COST_BPS) -> Dict:
+    values = closes.to_numpy(dtype=np.float64)
+    signals = STRATEGIES[strategy](values, **(params or {}))
+    result = run_signals(values, signals, cost_bps)
+    result["equity"] = pd.Series(result["equity"], index=closes.index)
+    return result
+
+
+class Order:
+    def __init__(self, symbol: str, shares: float):
+        self.symbol = symbol
+        self.shares = shares
+
+
+class EventBacktester:
+    """Day-by-day, order-level simulation.
+
+    on_bar(backtester, day) is called after each close and returns orders,
+    which fill at the next day's open plus slippage and commission. Use it
+    for strategies that depend on fills, cash or position sizes; purely
+    signal-based strategies are much faster through run_signals.
+    """
+
+    def __init__(self, opens: pd.DataFrame, closes: pd.DataFrame, cash: float = 100000.0,
+                 commission: float = 0.0, slippage_bps: float = BACKTEST_COST_BPS):
+        self.dates = closes.index
+        self.symbols = list(closes.columns)
+        self.columns = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self.opens = opens.reindex(index=self.dates, columns=self.symbols).to_numpy(dtype=np.float64)
+        self.closes = closes.to_numpy(dtype=np.float64)
+        self.cash = cash
+        self.commission = commission
+        self.slippage = slippage_bps / 10000
+        self.positions = np.zeros(len(self.symbols))
+        self.fills: List[Dict] = []
+
+    def value(self, day: int) -> float:
+        return self.cash + float(np.nansum(self.positions * self.closes[day]))
+
+    def _fill(self, day: int, order: Order):
+        col = self.columns.get(order.symbol)
+        if col is None or order.shares == 0:
+            return
+        price = self.opens[day, col]
+        if not np.isfinite(price):
+            price = self.closes[day, col]
+        if not np.isfinite(price):
+            return
+        price *= 1 + self.slippage * np.sign(order.shares)
+        cost = order.shares * price + self.commission
+        if order.shares > 0 and cost > self.cash:
+            return  # Orders never borrow; rejected for lack of cash
+        shares = order.shares if order.shares > 0 else max(order.shares, -self.positions[col])
+        if shares == 0:
+            return
+        self.cash -= shares * price + self.commission
+        self.positions[col] += shares
+        self.fills.append({"date": self.dates[day].date().isoformat(), "symbol": order.symbol,
+                           "shares": round(float(shares), 4), "price": round(float(price), 4)})
+
+    def run(self, on_bar: Callable[["EventBacktester", int], List[Order]]) -> Dict:
+        equity = np.empty(len(self.dates))
+        pending: List[Order] = []
+        for day in range(len(self.dates)):
+            for order in pending:
+                self._fill(day, order)
+            equity[day] = self.value(day)
+            pending = on_bar(self, day) or []
+        result = performance(equity / equity[0])
+        result.update({"final_value": round(float(equity[-1]), 2), "fills": self.fills,
+                       "equity": pd.Series(equity, index=self.dates)})
+        return result
+
+
+def signal_orders(signals: np.ndarray) -> Callable[[EventBacktester, int], List[Order]]:
+    """on_bar callback that trades a signal matrix with equal-weight, whole-share targets"""
+    def on_bar(bt: EventBacktester, day: int) -> List[Order]:
+        held = np.nan_to_num(signals[day]) > 0
+        if not held.any() and not bt.positions.any():
+            return []
+        prices = bt.closes[day]
+        budget = bt.value(day) / max(held.sum(), 1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            targets = np.where(held & (prices > 0), np.floor(budget / prices), 0.0)
+        deltas = np.nan_to_num(targets) - bt.positions
+        # Sells first so their proceeds can fund the buys
+        order = np.argsort(deltas)
+        return [Order(bt.symbols[i], float(deltas[i])) for i in order if deltas[i] != 0]
+    return on_bar
+
+
+_sweep_closes: Optional[np.ndarray] = None
+
+
+def _init_sweep(closes: np.ndarray):
+    global _sweep_closes
+    _sweep_closes = closes
+
+
+def _sweep_one(task: Tuple[str, Dict, float]) -> Dict:
+    strategy, params, cost_bps = task
+    try:
+        result = run_signals(_sweep_closes, STRATEGIES[strategy](_sweep_closes, **params), cost_bps)
+    except Exception as e:
+        return {"params": params, "error": str(e)}
+    result.pop("equity")
+    return {"params": params, **result}
+
+
+def parameter_grid(grid: Dict[str, List]) -> List[Dict]:
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+
+def sweep(closes: pd.DataFrame, strategy: str, grid: Dict[str, List], cost_bps: float = BACKTEST_COST_BPS,
+          workers: int = BACKTEST_WORKERS) -> List[Dict]:
+    """Run a strategy for every parameter combination, best Sharpe first.
+
+    The closes are sent to each worker once (by the pool initializer), not
+    with every task.
+    """
+    values = closes.to_numpy(dtype=np.float64)
+    tasks = [(strategy, params, cost_bps) for params in parameter_grid(grid)]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)), initializer=_init_sweep, initargs=(values,),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(_sweep_one, tasks))
+    else:
+        _init_sweep(values)
+        results = [_sweep_one(task) for task in tasks]
+    return sorted(results, key=lambda r: -r.get("sharpe_ratio", float("-inf")))
+
+
+if __name__ == "__main__":
+    # python backtester.py ma_crossover AAPL MSFT --grid '{"fast": [10, 20], "slow": [50, 100]}'
+    parser = argparse.ArgumentParser(description="Sweep a signal strategy over stored price history")
+    parser.add_argument("strategy", choices=sorted(STRATEGIES))
+    parser.add_argument("symbols", nargs="+")
+    parser.add_argument("--grid", default="{}", help="JSON object of parameter name -> list of values")
+    parser.add_argument("--days", type=int, default=TRADING_DAYS * 10)
+    parser.add_argument("--cost-bps", type=float, default=BACKTEST_COST_BPS)
+    parser.add_argument("--workers", type=int, default=BACKTEST_WORKERS)
+    args = parser.parse_args()
+
+    closes = load_bars(PortfolioAnalytics(), args.symbols, args.days)
+    for result in sweep(closes, args.strategy, json.loads(args.grid), args.cost_bps, args.workers):
+        print(json.dumps(result))
@@ -0,0 +1,91 @@
+import io
+import os
+import json
+import math
+import numpy as np
+import pandas as pd
+from datetime import date
+from typing import Dict, Iterator, Optional, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Rows per page when the client does not ask for fewer
+HISTORY_PAGE_LIMIT = int(os.getenv("HISTORY_PAGE_LIMIT", "5000"))
+# Rows formatted per NDJSON write
+NDJSON_BLOCK_ROWS = 1000
+
+FORMATS = ("records", "columnar", "arrow", "ndjson")
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def page(df: pd.DataFrame, start: Optional[date] = None, end: Optional[date] = None,
+         cursor: Optional[date] = None, limit: int = HISTORY_PAGE_LIMIT) -> Tuple[pd.DataFrame, Optional[str]]:
+    """Rows in [start, end] after the cursor date, at most limit of them, plus the next cursor.
+
+    The cursor is the date of the last row already returned, so pages stay
+    stable while new bars are appended.
+    """
+    index = df.index.values
+    lo = np.searchsorted(index, np.datetime64(start), side="left") if start else 0
+    if cursor:
+        lo = max(lo, np.searchsorted(index, np.datetime64(cursor), side="right"))
+    hi = np.searchsorted(index, np.datetime64(end), side="right") if end else len(index)
+    stop = min(hi, lo + limit)
+    next_cursor = str(index[stop - 1].astype("datetime64[D]")) if stop < hi else None
+    return df.iloc[lo:stop], next_cursor
+
+
+def _dates(df: pd.DataFrame) -> np.ndarray:
+    return np.datetime_as_string(df.index.values, unit="D")
+
+
+def _column(values: np.ndarray) -> list:
+    """Float column as a list, NaN and infinities as None so the JSON stays valid"""
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    if not finite.all():
+        return np.where(finite, values, None).tolist()
+    return values.tolist()
+
+
+def columnar_json(meta: Dict, df: pd.DataFrame) -> bytes:
+    """One array per field, converted from the column buffers in bulk"""
+    payload = dict(meta)
+    payload["dates"] = _dates(df).tolist()
+    for column in df.columns:
+        payload[column] = _column(df[column].to_numpy())
+    return json.dumps(payload, separators=(",", ":")).encode()
+
+
+def arrow_ipc(df: pd.DataFrame, meta: Dict) -> bytes:
+    """Arrow IPC stream; numeric columns are handed to Arrow without copying"""
+    import pyarrow as pa
+
+    names = ["date", *df.columns]
+    arrays = [pa.array(df.index.values.astype("datetime64[D]"))]
+    arrays += [pa.array(df[column].to_numpy(dtype=np.float64)) for column in df.columns]
+    schema = pa.schema(
+        [pa.field(name, array.type) for name, array in zip(names, arrays)],
+        metadata={key: str(value) for key, value in meta.items() if value is not None},
+    )
+    batch = pa.RecordBatch.from_arrays(arrays, schema=schema)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue()
+
+
+def ndjson_lines(df: pd.DataFrame, block_rows: int = NDJSON_BLOCK_ROWS) -> Iterator[bytes]:
+    """One JSON object per row, formatted from column lists in blocks rather than a dict per row"""
+    columns = list(df.columns)
+    template = "{\"date\":\"%s\"," + ",".join(f"\"{column}\":%s" for column in columns) + "}\n"
+    dates = _dates(df)
+    values = [df[column].to_numpy(dtype=np.float64) for column in columns]
+    for lo in range(0, len(df), block_rows):
+        cells = [dates[lo:lo + block_rows].tolist()]
+        for column in values:
+            block = column[lo:lo + block_rows]
+            cells.append([repr(v) if math.isfinite(v) else "null" for v in block.tolist()])
+        yield "".join(template % row for row in zip(*cells)).encode()
@@ -0,0 +1,101 @@
+import pandas as pd
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import func, insert
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal
+from models import DailyBar
+from market_cache import MARKET_CLOSE_UTC_HOUR
+
+BAR_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+# TIME_SERIES_DAILY with outputsize=compact returns the latest 100 bars
+COMPACT_BARS = 100
+
+
+def last_trading_day(now: Optional[datetime] = None) -> date:
+    """Most recent weekday whose end-of-day bar should already be published"""
+    now = now or datetime.now(timezone.utc)
+    day = now.date()
+    if now.hour < MARKET_CLOSE_UTC_HOUR:
+        day -= timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def missing_trading_days(last: date, until: date) -> int:
+    """Number of weekdays after last up to and including until"""
+    if last >= until:
+        return 0
+    return int(pd.bdate_range(last + timedelta(days=1), until).size)
+
+
+class BarStore:
+    """Daily OHLCV bars persisted in the daily_bars table"""
+
+    def __init__(self, session_factory=None):
+        self.session_factory = session_factory or SessionLocal
+
+    def last_date(self, symbol: str) -> Optional[date]:
+        db = self.session_factory()
+        try:
+            return db.query(func.max(DailyBar.date)).filter(DailyBar.symbol == symbol).scalar()
+        finally:
+            db.close()
+
+    def read(self, symbol: str, start: Optional[date] = None, end: Optional[date] = None) -> pd.DataFrame:
+        """Read stored bars for a date window, indexed by date"""
+        db = self.session_factory()
+        try:
+            query = db.query(
+                DailyBar.date, DailyBar.open, DailyBar.high, DailyBar.low, DailyBar.close, DailyBar.volume
+            ).filter(DailyBar.symbol == symbol)
+            if start is not None:
+                query = query.filter(DailyBar.date >= start)
+            if end is not None:
+                query = query.filter(DailyBar.date <= end)
+            rows = query.order_by(DailyBar.date).all()
+        finally:
+            db.close()
+
+        if not rows:
+            return pd.DataFrame(columns=BAR_COLUMNS, dtype=float)
+        df = pd.DataFrame(rows, columns=['date'] + BAR_COLUMNS).set_index('date')
+        df.index = pd.to_datetime(df.index)
+        return df.astype(float)
+
+    def append(self, symbol: str, df: pd.DataFrame) -> int:
+        """Insert bars newer than the last stored one; returns rows written"""
+        if df is None or df.empty:
+            return 0
+        last = self.last_date(symbol)
+        if last is not None:
+            df = df[df.index.date > last]
+        if df.empty:
+            return 0
+
+        rows = [
+            {
+                "symbol": symbol,
+                "date": ts.date(),
+                "open": row[0],
+                "high": row[1],
+                "low": row[2],
+                "close": row[3],
+                "volume": row[4],
+            }
+            for ts, row in zip(df.index, df[BAR_COLUMNS].itertuples(index=False, name=None))
+        ]
+        db = self.session_factory()
+        try:
+            db.execute(insert(DailyBar), rows)
+            db.commit()
+        except IntegrityError:
+            # Another worker stored the same bars first
+            db.rollback()
+            return 0
+        finally:
+            db.close()
+        return len(rows)
@@ -0,0 +1,156 @@
+"""Deterministic stand-in for the Alpha Vantage query endpoint.
+
+Serves GLOBAL_QUOTE and TIME_SERIES_DAILY for any symbol. Prices are a
+random walk seeded by the symbol name and end on the last trading day, so
+the same symbol always gets the same bars and the app treats them as
+current. Point the app at it with ALPHA_VANTAGE_URL.
+
+    python -m benchmarks.fake_market --port 8765
+"""
+import json
+import time
+import zlib
+import argparse
+import threading
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+COMPACT_DAYS = 100
+FULL_DAYS = 2520
+
+
+@lru_cache(maxsize=256)
+def daily_bars(symbol: str, end: str, days: int = FULL_DAYS) -> Tuple[Tuple[str, float, float, float, float, int], ...]:
+    """(date, open, high, low, close, volume) rows, oldest first"""
+    rng = np.random.default_rng(zlib.crc32(symbol.upper().encode()))
+    dates = pd.bdate_range(end=end, periods=days)
+    drift, volatility = rng.uniform(-0.0002, 0.0008), rng.uniform(0.008, 0.03)
+    close = rng.uniform(20, 400) * np.cumprod(1 + rng.normal(drift, volatility, days))
+    opens = close * (1 + rng.normal(0, volatility / 4, days))
+    high = np.maximum(opens, close) * (1 + np.abs(rng.normal(0, volatility / 2, days)))
+    low = np.minimum(opens, close) * (1 - np.abs(rng.normal(0, volatility / 2, days)))
+    volume = rng.integers(100_000, 10_000_000, days)
+    return tuple(
+        (d.strftime("%Y-%m-%d"), round(o, 4), round(h, 4), round(l, 4), round(c, 4), int(v))
+        for d, o, h, l, c, v in zip(dates, opens, high, low, close, volume)
+    )
+
+
+def market_day() -> str:
+    # Imported here: the bar store opens the app database, which the server itself never uses
+    from bar_store import last_trading_day
+
+    return last_trading_day().isoformat()
+
+
+def time_series_daily(symbol: str, outputsize: str = "compact") -> Dict:
+    bars = daily_bars(symbol, market_day())
+    if outputsize != "full":
+        bars = bars[-COMPACT_DAYS:]
+    return {
+        "Meta Data": {"2. Symbol": symbol, "4. Output Size": outputsize.capitalize()},
+        "Time Series (Daily)": {
+            d: {"1. open": f"{o:.4f}", "2. high": f"{h:.4f}", "3. low": f"{l:.4f}", "4. close": f"{c:.4f}", "5. volume": str(v)}
+            for d, o, h, l, c, v in reversed(bars)
+        },
+    }
+
+
+def global_quote(symbol: str) -> Dict:
+    bars = daily_bars(symbol, market_day())
+    (_, _, _, _, previous, _), (_, _, _, _, price, volume) = bars[-2], bars[-1]
+    return {"Global Quote": {
+        "01. symbol": symbol,
+        "05. price": f"{price:.4f}",
+        "06. volume": str(volume),
+        "09. change": f"{price - previous:.4f}",
+        "10. change percent": f"{(price / previous - 1) * 100:.4f}%",
+    }}
+
+
+def respond(params: Dict[str, str]) -> Dict:
+    function, symbol = params.get("function"), (params.get("symbol") or "").upper()
+    if not symbol:
+        return {"Error Message": "Invalid API call: symbol is required"}
+    if function == "GLOBAL_QUOTE":
+        return global_quote(symbol)
+    if function == "TIME_SERIES_DAILY":
+        return time_series_daily(symbol, params.get("outputsize", "compact"))
+    return {"Error Message": f"Invalid API call: unsupported function {function}"}
+
+
+class FakeMarketServer:
+    """Threaded HTTP server for respond(), with per-function request counts and optional latency"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0):
+        self.latency = latency
+        self.requests: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                params = {key: values[-1] for key, values in parse_qs(urlparse(self.path).query).items()}
+                with server._lock:
+                    function = params.get("function", "")
+                    server.requests[function] = server.requests.get(function, 0) + 1
+                if server.latency:
+                    time.sleep(server.latency)
+                body = json.dumps(respond(params)).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/query"
+
+    def start(self) -> "FakeMarketServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def symbols(count: int, prefix: str = "BM") -> List[str]:
+    """Synthetic ticker names"""
+    return [f"{prefix}{i:03d}" for i in range(count)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic Alpha Vantage responses")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args()
+
+    server = FakeMarketServer(args.host, args.port, args.latency)
+    print(f"Serving fake market data at {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
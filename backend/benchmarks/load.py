@@ -0,0 +1,173 @@
+"""Load scenarios against a real API process backed by SQLite and the fake market server.
+
+The app runs under uvicorn in a subprocess so the benchmark client does not
+share its event loop or GIL. Each scenario sends a fixed number of requests
+from concurrent clients and reports throughput and latency percentiles.
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import subprocess
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from benchmarks.fake_market import symbols
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "benchmark-password"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class ApiServer:
+    """uvicorn serving main:app with the given environment"""
+
+    def __init__(self, env: Dict[str, str], port: Optional[int] = None):
+        self.env = {**os.environ, **env}
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._process: Optional[subprocess.Popen] = None
+
+    def start(self, timeout: float = 60) -> "ApiServer":
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--port", str(self.port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=self.env,
+        )
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"API server exited with code {self._process.returncode}")
+            try:
+                if httpx.get(f"{self.url}/", timeout=1).status_code == 200:
+                    return self
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise RuntimeError("API server did not start in time")
+
+    def stop(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    """Request count, error count, throughput and latency percentiles in milliseconds"""
+    result = {"requests": len(latencies) + errors, "errors": errors, "rps": round((len(latencies) + errors) / elapsed, 2) if elapsed else 0.0}
+    if latencies:
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        result.update(p50_ms=round(p50, 2), p95_ms=round(p95, 2), p99_ms=round(p99, 2), max_ms=round(max(latencies), 2))
+    return result
+
+
+async def scenario(client: httpx.AsyncClient, make_request: Callable[[int], Dict], requests: int, concurrency: int,
+                   expected: tuple = (200,)) -> Dict:
+    """Send requests built by make_request(i) from `concurrency` workers"""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await client.request(**make_request(i))
+                ok = response.status_code in expected
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append((time.perf_counter() - start) * 1000)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def seed(client: httpx.AsyncClient, users: int, holdings: int) -> List[Dict]:
+    """Register users, each with one portfolio of `holdings` synthetic symbols"""
+    names = symbols(holdings)
+    accounts = []
+    for u in range(users):
+        username = f"bench{u}"
+        response = await client.post("/register", json={"username": username, "email": f"{username}@example.com", "password": PASSWORD})
+        response.raise_for_status()
+        token = (await client.post("/token", data={"username": username, "password": PASSWORD})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        portfolio = (await client.post("/portfolios", json={"name": "Benchmark", "description": "load test"}, headers=headers)).json()
+        for i, symbol in enumerate(names):
+            response = await client.post(f"/portfolios/{portfolio['id']}/holdings", headers=headers, json={
+                "symbol": symbol, "company_name": symbol, "shares": 10 + i, "average_price": 100.0, "portfolio_id": portfolio["id"],
+            })
+            response.raise_for_status()
+        accounts.append({"username": username, "headers": headers, "portfolio_id": portfolio["id"], "symbols": names})
+    return accounts
+
+
+async def run_scenarios(url: str, users: int, holdings: int, requests: int, concurrency: int) -> Dict[str, Dict]:
+    limits = httpx.Limits(max_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        accounts = await seed(client, users, holdings)
+        results = {"seed": {"users": users, "holdings": holdings, "seconds": round(time.perf_counter() - start, 2)}}
+
+        def account(i: int) -> Dict:
+            return accounts[i % len(accounts)]
+
+        def analytics(i: int, headers: Optional[Dict] = None) -> Dict:
+            a = account(i)
+            return {"method": "GET", "url": f"/portfolios/{a['portfolio_id']}/analytics", "headers": {**a["headers"], **(headers or {})}}
+
+        # Cold: the first request per portfolio fetches histories and computes; later ones hit the cache
+        results["analytics_cold"] = await scenario(client, analytics, len(accounts), concurrency)
+        results["analytics_warm"] = await scenario(client, analytics, requests, concurrency)
+        etags = {}
+        for a in accounts:
+            response = await client.get(f"/portfolios/{a['portfolio_id']}/analytics", headers=a["headers"])
+            etags[a["portfolio_id"]] = response.headers.get("ETag", "")
+        results["analytics_not_modified"] = await scenario(
+            client, lambda i: analytics(i, {"If-None-Match": etags[account(i)["portfolio_id"]]}), requests, concurrency, expected=(304,))
+
+        results["overview"] = await scenario(client, lambda i: {"method": "GET", "url": "/overview", "headers": account(i)["headers"]}, requests, concurrency)
+        results["holdings"] = await scenario(client, lambda i: {
+            "method": "GET", "url": f"/portfolios/{account(i)['portfolio_id']}/holdings", "headers": account(i)["headers"],
+        }, requests, concurrency)
+        results["quotes"] = await scenario(client, lambda i: {
+            "method": "POST", "url": "/stocks/quotes", "json": {"symbols": account(i)["symbols"]}, "headers": account(i)["headers"],
+        }, requests, concurrency)
+        results["historical_columnar"] = await scenario(client, lambda i: {
+            "method": "GET", "url": f"/stock/{account(i)['symbols'][i % holdings]}/historical", "params": {"days": 252, "format": "columnar"},
+        }, requests, concurrency)
+        results["simulate"] = await scenario(client, lambda i: {
+            "method": "GET", "url": f"/portfolios/{account(i)['portfolio_id']}/simulate",
+            "params": {"days": 63, "paths": 2000, "seed": i}, "headers": account(i)["headers"],
+        }, max(1, requests // 10), concurrency)
+        results["login"] = await scenario(client, lambda i: {
+            "method": "POST", "url": "/token", "data": {"username": account(i)["username"], "password": PASSWORD},
+        }, max(1, requests // 10), concurrency)
+        return results
+
+
+def run(env: Dict[str, str], users: int = 10, holdings: int = 10, requests: int = 200, concurrency: int = 10) -> Dict[str, Dict]:
+    with ApiServer(env) as server:
+        return asyncio.run(run_scenarios(server.url, users, holdings, requests, concurrency))
@@ -0,0 +1,65 @@
+"""Microbenchmarks for the numeric hot paths: feature prep, portfolio metrics and risk.
+
+Histories come from the fake market server through PortfolioAnalytics, so
+the inputs are the frames the API computes on. The environment must point
+ALPHA_VANTAGE_URL at the server before the app modules are imported.
+"""
+import time
+import statistics
+from typing import Callable, Dict, List
+
+from benchmarks.fake_market import FULL_DAYS, symbols
+
+
+def timed(fn: Callable, repeat: int = 5, warmup: int = 1) -> Dict:
+    """Run fn repeatedly and summarise the wall time of each call in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    samples: List[float] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "repeat": repeat,
+        "min_ms": round(min(samples), 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "mean_ms": round(statistics.mean(samples), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+def run(holdings: int = 10, repeat: int = 5) -> Dict[str, Dict]:
+    from database import engine
+    from indicators import feature_frame
+    from market_cache import MarketDataCache
+    from ml_models import RiskAnalyzer, StockPredictor
+    from models import Base
+    from portfolio_analytics import PortfolioAnalytics
+
+    # The bar store persists fetched bars, so its tables must exist in the benchmark database
+    Base.metadata.create_all(bind=engine)
+    names = symbols(holdings)
+    # A private memory cache, so the quote benchmark is not served by earlier runs
+    analytics = PortfolioAnalytics(cache=MarketDataCache())
+    risk = RiskAnalyzer(analytics)
+    predictor = StockPredictor(analytics)
+
+    portfolio = [{"symbol": symbol, "shares": 10, "market_value": 1000.0 * (i + 1)} for i, symbol in enumerate(names)]
+    histories = {symbol: analytics.get_historical_data(symbol, None) for symbol in risk.history_symbols(portfolio)}
+    bars = histories[names[0]]
+    results = {}
+
+    def quote_fetch():
+        analytics.cache.invalidate("quote", names[0])
+        analytics.get_stock_price(names[0])
+
+    results["quote_fetch_cold"] = timed(quote_fetch, repeat)
+    results["feature_frame_500"] = timed(lambda: feature_frame(bars.tail(500)), repeat)
+    results[f"feature_frame_{FULL_DAYS}"] = timed(lambda: feature_frame(bars), repeat)
+    results["get_returns"] = timed(lambda: analytics.get_returns(names, 252, histories), repeat)
+    results["portfolio_metrics"] = timed(lambda: analytics.calculate_portfolio_metrics(portfolio, histories), repeat)
+    results["risk_assessment"] = timed(lambda: risk.assess_portfolio_risk(portfolio, histories), repeat)
+    results["train_model"] = timed(lambda: predictor.train_model(names[0], n_jobs=1), max(1, repeat // 2), warmup=0)
+    results["predict_price"] = timed(lambda: predictor.predict_price(names[0]), repeat)
+    return results
@@ -0,0 +1,131 @@
+"""Run the benchmark suite and save the results as JSON.
+
+    python -m benchmarks.run                       # micro and load, default sizes
+    python -m benchmarks.run --load --users 50 --holdings 20
+    python -m benchmarks.run --compare benchmarks/results/baseline.json
+
+Everything runs against a temporary SQLite database and the fake market
+server, so results are repeatable and no Alpha Vantage quota is used. With
+--compare, exits 1 when any benchmark got slower than the baseline by more
+than --threshold.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, List
+
+from benchmarks import load, micro
+from benchmarks.fake_market import FakeMarketServer
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+# The latency each kind of result is compared on
+COMPARED_METRICS = {"micro": "median_ms", "load": "p95_ms"}
+
+
+def benchmark_env(workdir: str, market_url: str) -> Dict[str, str]:
+    """App settings that isolate a run: its own database and caches, the fake market and no provider limits"""
+    return {
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'benchmark.db')}",
+        "JWT_SECRET_KEY": "benchmark",
+        "ALPHA_VANTAGE_API_KEY": "benchmark",
+        "ALPHA_VANTAGE_URL": market_url,
+        "ALPHA_VANTAGE_CALLS_PER_MINUTE": "0",
+        "ALPHA_VANTAGE_CALLS_PER_DAY": "0",
+        "MARKET_REFRESH_ENABLED": "false",
+        "MARKET_CACHE_DIR": os.path.join(workdir, "market_cache"),
+        "PRICE_MATRIX_DIR": os.path.join(workdir, "price_matrix"),
+        "MODEL_DIR": os.path.join(workdir, "models"),
+    }
+
+
+def metadata(args: argparse.Namespace) -> Dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "params": {"users": args.users, "holdings": args.holdings, "requests": args.requests,
+                   "concurrency": args.concurrency, "repeat": args.repeat},
+    }
+
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> List[str]:
+    """Benchmarks whose compared latency grew by more than threshold (0.2 = 20%)"""
+    regressions = []
+    for kind, metric in COMPARED_METRICS.items():
+        for name, current in results.get(kind, {}).items():
+            previous = baseline.get(kind, {}).get(name, {})
+            if metric not in current or not previous.get(metric):
+                continue
+            change = current[metric] / previous[metric] - 1
+            if change > threshold:
+                regressions.append(f"{kind}.{name}: {metric} {previous[metric]} -> {current[metric]} (+{change:.0%})")
+    return regressions
+
+
+def print_results(results: Dict):
+    for kind, metric in COMPARED_METRICS.items():
+        for name, values in results.get(kind, {}).items():
+            if metric in values:
+                extra = f"  {values['rps']} req/s, {values['errors']} errors" if "rps" in values else ""
+                print(f"{kind:5} {name:28} {metric} {values[metric]:>10}{extra}")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the analytics hot paths and API endpoints")
+    parser.add_argument("--micro", action="store_true", help="Only run the microbenchmarks")
+    parser.add_argument("--load", action="store_true", help="Only run the load scenarios")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--holdings", type=int, default=10, help="Holdings per user portfolio")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per load scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per microbenchmark")
+    parser.add_argument("--output", help="Results file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="Baseline results file to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+    run_micro, run_load = (args.micro or not args.load), (args.load or not args.micro)
+
+    results = {"meta": metadata(args)}
+    with tempfile.TemporaryDirectory(prefix="benchmark-") as workdir, FakeMarketServer() as market:
+        env = benchmark_env(workdir, market.url)
+        # App settings are read when its modules are first imported, by the microbenchmarks or the fake market
+        os.environ.update(env)
+        if run_load:
+            # Its own database file, so the API does not see bars stored by the microbenchmarks
+            load_env = {**env, "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'load.db')}"}
+            results["load"] = load.run(load_env, args.users, args.holdings, args.requests, args.concurrency)
+        if run_micro:
+            results["micro"] = micro.run(args.holdings, args.repeat)
+        results["meta"]["market_requests"] = dict(market.requests)
+
+    output = args.output or os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print_results(results)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
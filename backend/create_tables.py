@@ -1,4 +1,37 @@
-from models import Base, engine
+"""Create or migrate the schema: python create_tables.py
 
-# This command will create all tables defined in models.py
-Base.metadata.create_all(bind=engine)
+Run once per deploy, before starting the API workers. Creates missing
+tables, then adds columns (backfilling their defaults) and indexes that
+were added to existing tables since they were created, and normalizes
+data written before the current rules.
+"""
+from sqlalchemy import func, update
+
+from database import add_missing_columns, add_missing_indexes, engine
+from models import Base, Holding, Transaction
+
+
+def normalize_symbols(bind) -> int:
+    """Upper-case symbols stored as typed, before holdings and transactions were normalized on write"""
+    updated = 0
+    with bind.begin() as conn:
+        for table in (Holding.__table__, Transaction.__table__):
+            normalized = func.upper(func.trim(table.c.symbol))
+            updated += conn.execute(update(table).where(table.c.symbol != normalized).values(symbol=normalized)).rowcount
+    return updated
+
+
+def migrate(bind=engine) -> dict:
+    # This command will create all tables defined in models.py
+    Base.metadata.create_all(bind=bind)
+    return {
+        "columns": add_missing_columns(bind, Base.metadata),
+        "indexes": add_missing_indexes(bind, Base.metadata),
+        "symbols": normalize_symbols(bind),
+    }
+
+
+if __name__ == "__main__":
+    changes = migrate()
+    print(f"Schema is current: added {changes['columns']} columns and {changes['indexes']} indexes, "
+          f"normalized {changes['symbols']} symbols")
@@ -1,5 +1,6 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -7,9 +8,63 @@ from dotenv import load_dotenv
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
+# Optional read replica for read-only endpoints; unset means reads use the primary
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+# Async driver URL; derived from DATABASE_URL (asyncpg / aiosqlite) when unset
+DATABASE_ASYNC_URL = os.getenv("DATABASE_ASYNC_URL")
 
-engine = create_engine(DATABASE_URL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+# Seconds a request waits for a pooled connection before failing instead of hanging
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Per-statement limit on PostgreSQL; on SQLite, how long to wait for a write lock. 0 disables
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+
+def engine_options(url: str, is_async: bool = False) -> dict:
+    """Pool and timeout settings for a database URL"""
+    url = make_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    connect_args = {}
+    if url.get_backend_name() == "sqlite":
+        if DB_STATEMENT_TIMEOUT_MS:
+            connect_args["timeout"] = DB_STATEMENT_TIMEOUT_MS / 1000
+        if is_async or url.database in (None, "", ":memory:"):
+            # aiosqlite opens a connection per checkout, and an in-memory
+            # database only exists on its one connection: neither is sized
+            return {**options, "connect_args": connect_args}
+    else:
+        options["pool_recycle"] = DB_POOL_RECYCLE
+        if DB_STATEMENT_TIMEOUT_MS:
+            if is_async:
+                connect_args["server_settings"] = {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}
+            else:
+                connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    options.update(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        connect_args=connect_args,
+    )
+    return options
+
+
+def async_url(url: str) -> str:
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f"No async driver configured for {url.get_backend_name()}")
+    return url.set(drivername=driver).render_as_string(hide_password=False)
+
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+read_engine = create_engine(DATABASE_READ_URL, **engine_options(DATABASE_READ_URL)) if DATABASE_READ_URL else engine
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
 Base = declarative_base()
 
 def get_db():
@@ -18,3 +73,114 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def get_read_db():
+    """Session on the read replica (or the primary when none is configured); never commit through it"""
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# AsyncSession factories by read_only flag, created on first use so the async
+# driver is only needed by handlers that opt into it
+_async_sessions = {}
+
+def async_session_factory(read_only: bool = False):
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    if read_only and not DATABASE_READ_URL:
+        read_only = False
+    factory = _async_sessions.get(read_only)
+    if factory is None:
+        url = async_url(DATABASE_READ_URL) if read_only else (DATABASE_ASYNC_URL or async_url(DATABASE_URL))
+        async_engine = create_async_engine(url, **engine_options(url, is_async=True))
+        factory = _async_sessions[read_only] = async_sessionmaker(async_engine, expire_on_commit=False)
+    return factory
+
+async def get_async_db():
+    async with async_session_factory()() as db:
+        yield db
+
+async def get_async_read_db():
+    async with async_session_factory(read_only=True)() as db:
+        yield db
+
+async def dispose_engines():
+    """Close every pooled connection; called on application shutdown"""
+    for factory in _async_sessions.values():
+        await factory.kw["bind"].dispose()
+    engine.dispose()
+    if read_engine is not engine:
+        read_engine.dispose()
+
+def pool_stats() -> dict:
+    """Connection counts of the sync pools that track them (SQLite in-memory pools do not)"""
+    stats = {}
+    for name, bind in (("primary", engine), ("read", read_engine)):
+        pool = bind.pool
+        if (name == "read" and bind is engine) or not hasattr(pool, "checkedout"):
+            continue
+        stats[name] = {"size": pool.size(), "checked_out": pool.checkedout(), "overflow": pool.overflow()}
+    return stats
+
+def missing_columns(bind, metadata):
+    """(table, column) pairs declared on existing tables but missing from the database"""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {column['name'] for column in inspector.get_columns(table.name)}
+        missing += [(table, column) for column in table.columns if column.name not in present]
+    return missing
+
+def _default_sql(column) -> str:
+    default = column.server_default.arg
+    return default.text if hasattr(default, "text") else "'{}'".format(default.replace("'", "''"))
+
+def add_missing_columns(bind, metadata):
+    """Add columns declared on existing tables but missing from the database.
+
+    create_all only creates tables, so columns added to a model later are
+    applied here, by the migration command rather than at app startup. A
+    NOT NULL column needs a server default: it is added with it and existing
+    rows are backfilled with that value before the constraint applies.
+    """
+    missing = missing_columns(bind, metadata)
+    without_default = [f"{table.name}.{column.name}" for table, column in missing
+                       if not column.nullable and column.server_default is None]
+    if without_default:
+        raise RuntimeError(f"Cannot add NOT NULL columns without a server default: {', '.join(without_default)}")
+    with bind.begin() as conn:
+        for table, column in missing:
+            ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(bind.dialect)}"
+            if column.server_default is None:
+                conn.execute(text(ddl))
+                continue
+            default = _default_sql(column)
+            conn.execute(text(f"{ddl} DEFAULT {default}"))
+            # Most databases fill existing rows from the default already; make sure of it
+            conn.execute(text(f"UPDATE {table.name} SET {column.name} = {default} WHERE {column.name} IS NULL"))
+            if not column.nullable:
+                if bind.dialect.name == "sqlite":
+                    # SQLite cannot add a constraint to an existing column; the default keeps new rows filled
+                    continue
+                conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} SET NOT NULL"))
+    return len(missing)
+
+def add_missing_indexes(bind, metadata):
+    """Create indexes declared on existing tables but missing from the database"""
+    inspector = inspect(bind)
+    existing_tables = set(inspector.get_table_names())
+    created = 0
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in present:
+                index.create(bind)
+                created += 1
+    return created
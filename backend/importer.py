@@ -0,0 +1,262 @@
+import os
+import csv
+import io
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Union
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+import schemas
+from ledger import Ledger, default_ledger
+from models import Transaction
+
+load_dotenv()
+
+IMPORT_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "10000"))
+# Row errors listed in the summary; the total is always counted
+IMPORT_MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+FORMATS = ("csv", "parquet")
+
+# Broker export headers (lowercased, spaces to underscores) mapped to TransactionBase fields
+COLUMN_ALIASES = {
+    "ticker": "symbol",
+    "security": "symbol",
+    "action": "transaction_type",
+    "side": "transaction_type",
+    "type": "transaction_type",
+    "quantity": "shares",
+    "qty": "shares",
+    "units": "shares",
+    "trade_price": "price",
+    "fill_price": "price",
+    "date": "transaction_date",
+    "trade_date": "transaction_date",
+    "executed_at": "transaction_date",
+    "name": "company_name",
+    "description": "company_name",
+    # Holdings exports: each position becomes an opening BUY at its average cost
+    "avg_cost": "average_price",
+    "average_cost": "average_price",
+    "cost_basis_per_share": "average_price",
+}
+TYPE_ALIASES = {"BUY": "BUY", "BOT": "BUY", "BOUGHT": "BUY", "B": "BUY",
+                "SELL": "SELL", "SLD": "SELL", "SOLD": "SELL", "S": "SELL"}
+
+transactions_table = Transaction.__table__
+transaction_list = TypeAdapter(List[schemas.TransactionBase])
+INSERT_COLUMNS = ("portfolio_id", "symbol", "transaction_type", "shares", "price", "total_amount", "transaction_date")
+
+
+def detect_format(filename: Optional[str]) -> str:
+    if filename and filename.lower().endswith((".parquet", ".pq")):
+        return "parquet"
+    return "csv"
+
+
+def read_chunks(source: Union[str, BinaryIO], fmt: str = "csv", chunk_rows: int = IMPORT_CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+    """Yield the file as DataFrames of at most chunk_rows rows, never holding the whole file"""
+    if fmt == "csv":
+        yield from pd.read_csv(source, chunksize=chunk_rows, dtype=str, skipinitialspace=True)
+    elif fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+
+def normalize_chunk(chunk: pd.DataFrame) -> pd.DataFrame:
+    """Rename broker columns and clean values column-wise before per-row validation"""
+    columns = [str(c).strip().lower().replace(" ", "_") for c in chunk.columns]
+    chunk = chunk.set_axis([COLUMN_ALIASES.get(c, c) for c in columns], axis=1)
+    chunk = chunk.loc[:, ~chunk.columns.duplicated()]
+
+    if "transaction_type" not in chunk and "average_price" in chunk:
+        chunk = chunk.assign(transaction_type="BUY", price=chunk["average_price"])
+    out = pd.DataFrame(index=chunk.index)
+    for field in ("symbol", "transaction_type"):
+        values = chunk[field].astype("string").str.strip().str.upper() if field in chunk else pd.Series(pd.NA, index=chunk.index)
+        out[field] = values
+    out["transaction_type"] = out["transaction_type"].map(TYPE_ALIASES).fillna(out["transaction_type"])
+    for field in ("shares", "price"):
+        raw = chunk[field] if field in chunk else pd.Series(np.nan, index=chunk.index)
+        if raw.dtype == object:
+            raw = raw.str.replace(r"[$,\s]", "", regex=True)
+        out[field] = pd.to_numeric(raw, errors="coerce")
+    # Some brokers export sells as negative quantities
+    out["shares"] = out["shares"].abs()
+
+    if "transaction_date" in chunk:
+        raw = chunk["transaction_date"]
+        # Exports usually use one date format, parsed vectorized; only stragglers go element by element
+        dates = pd.to_datetime(raw, errors="coerce", utc=True)
+        retry = dates.isna() & raw.notna()
+        if retry.any():
+            dates[retry] = pd.to_datetime(raw[retry], errors="coerce", utc=True, format="mixed")
+        out["transaction_date"] = dates
+        out["bad_date"] = dates.isna() & raw.notna()
+    else:
+        out["transaction_date"] = pd.NaT
+        out["bad_date"] = False
+    out["company_name"] = chunk["company_name"].astype("string").str.strip() if "company_name" in chunk else pd.NA
+    return out
+
+
+def _present(values: pd.Series) -> List:
+    """Column as Python objects with missing values as None"""
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+def validate_chunk(chunk: pd.DataFrame, first_row: int, errors: List[Dict]) -> List[Dict]:
+    """TransactionBase-validated rows; failures are appended to errors with their file row number.
+
+    The chunk is validated as one list so pydantic's core does the per-row
+    work; rows it rejects are reported and the rest validated again.
+    """
+    dates = chunk["transaction_date"]
+    records = [
+        {"symbol": symbol, "transaction_type": kind, "shares": shares, "price": price, "transaction_date": when}
+        for symbol, kind, shares, price, when in zip(
+            _present(chunk["symbol"]), _present(chunk["transaction_type"]), _present(chunk["shares"]),
+            _present(chunk["price"]), _present(pd.Series(dates.array.to_pydatetime(), index=chunk.index, dtype=object)),
+        )
+    ]
+    names = _present(chunk["company_name"])
+
+    rejected: Dict[int, str] = {int(i): "transaction_date: unrecognized date" for i in np.flatnonzero(chunk["bad_date"].to_numpy())}
+    shares, prices = chunk["shares"].to_numpy(), chunk["price"].to_numpy()
+    for i in np.flatnonzero((shares <= 0) | (prices < 0)):
+        rejected.setdefault(int(i), "shares must be positive and price non-negative")
+
+    candidates = [i for i in range(len(records)) if i not in rejected]
+    try:
+        validated = transaction_list.validate_python([records[i] for i in candidates])
+    except ValidationError as e:
+        for err in e.errors():
+            index, *field = err['loc']
+            message = f"{'.'.join(map(str, field))}: {err['msg']}"
+            i = candidates[index]
+            rejected[i] = f"{rejected[i]}; {message}" if i in rejected else message
+        candidates = [i for i in candidates if i not in rejected]
+        validated = transaction_list.validate_python([records[i] for i in candidates])
+
+    errors.extend({"row": first_row + i, "error": rejected[i]} for i in sorted(rejected))
+    return [{**tx.model_dump(), "company_name": names[i]} for i, tx in zip(candidates, validated)]
+
+
+def _copy_rows(db: Session, rows: List[Dict]):
+    """PostgreSQL COPY ... FROM STDIN on the session's own connection and transaction"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[c].isoformat() if c == "transaction_date" else row[c] for c in INSERT_COLUMNS])
+    buffer.seek(0)
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY {transactions_table.name} ({', '.join(INSERT_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+
+def insert_rows(db: Session, rows: List[Dict]):
+    if not rows:
+        return
+    if db.get_bind().dialect.name == "postgresql":
+        _copy_rows(db, rows)
+    else:
+        db.execute(insert(transactions_table), rows)
+
+
+def import_transactions(db: Session, portfolio_id: int, source: Union[str, BinaryIO], fmt: str = "csv",
+                        chunk_rows: int = IMPORT_CHUNK_ROWS, ledger: Optional[Ledger] = None,
+                        progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Stream a broker export into a portfolio's ledger and rebuild its holdings once.
+
+    Invalid rows are skipped and reported. The import is one database
+    transaction: if the imported trades are inconsistent with the ledger
+    (e.g. selling shares never bought) nothing is written.
+    """
+    ledger = ledger or default_ledger
+    errors: List[Dict] = []
+    error_count = 0
+    rows_read = imported = 0
+    symbols, names = set(), {}
+    started = datetime.now(timezone.utc)
+    # Row numbers match what a spreadsheet shows, counting the CSV header as row 1
+    first_row = 2 if fmt == "csv" else 1
+
+    method = ledger.claim(db, portfolio_id)
+    try:
+        ledger.open_positions(db, portfolio_id)
+        for chunk in read_chunks(source, fmt, chunk_rows):
+            chunk_errors: List[Dict] = []
+            valid = validate_chunk(normalize_chunk(chunk), rows_read + first_row, chunk_errors)
+            rows_read += len(chunk)
+            error_count += len(chunk_errors)
+            errors.extend(chunk_errors[:max(0, IMPORT_MAX_ERRORS - len(errors))])
+
+            rows = []
+            for tx in valid:
+                symbols.add(tx['symbol'])
+                if tx['company_name']:
+                    names.setdefault(tx['symbol'], tx['company_name'])
+                rows.append({
+                    "portfolio_id": portfolio_id,
+                    "symbol": tx['symbol'],
+                    "transaction_type": tx['transaction_type'],
+                    "shares": tx['shares'],
+                    "price": tx['price'],
+                    "total_amount": tx['shares'] * tx['price'],
+                    "transaction_date": tx['transaction_date'] or started,
+                })
+            insert_rows(db, rows)
+            imported += len(rows)
+            if progress:
+                progress({"rows_read": rows_read, "imported": imported, "errors": error_count})
+
+        positions = ledger.sync(db, portfolio_id, method, sorted(symbols), names=names) if symbols else 0
+    except ValueError as e:
+        # LedgerError, unreadable files and unknown formats
+        db.rollback()
+        return {"error": str(e), "rows_read": rows_read, "imported": 0, "error_count": error_count, "errors": errors}
+    except Exception:
+        db.rollback()
+        raise
+    db.commit()
+
+    return {
+        "rows_read": rows_read,
+        "imported": imported,
+        "symbols": len(symbols),
+        "positions": positions,
+        "error_count": error_count,
+        "errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Import a CSV or Parquet broker export into a portfolio")
+    parser.add_argument("portfolio_id", type=int)
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=FORMATS, default=None, help="Defaults to the file extension")
+    parser.add_argument("--chunk-rows", type=int, default=IMPORT_CHUNK_ROWS)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        summary = import_transactions(
+            db, args.portfolio_id, args.path, args.format or detect_format(args.path), args.chunk_rows,
+            progress=lambda p: print(json.dumps(p)),
+        )
+    finally:
+        db.close()
+    print(json.dumps(summary, indent=2, default=str))
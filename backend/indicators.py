@@ -0,0 +1,205 @@
+import math
+import threading
+import numpy as np
+import pandas as pd
+from collections import deque
+from typing import Dict, Optional, Tuple
+from numpy.lib.stride_tricks import sliding_window_view
+
+from bar_store import BAR_COLUMNS
+
+FEATURE_COLUMNS = ['ma_5', 'ma_10', 'ma_20', 'rsi', 'bb_width',
+                   'volume_ratio', 'high_low_ratio', 'close_open_ratio']
+
+RSI_WINDOW = 14
+BB_WINDOW = 20
+VOLUME_WINDOW = 10
+# Bars needed before every feature is defined
+WARMUP_BARS = max(BB_WINDOW, RSI_WINDOW + 1, VOLUME_WINDOW)
+
+OPEN, HIGH, LOW, CLOSE, VOLUME = (BAR_COLUMNS.index(field) for field in ('open', 'high', 'low', 'close', 'volume'))
+
+
+def _rolling(values: np.ndarray, window: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Windows along the date axis (axis 0), NaN-padded to the input length"""
+    view = sliding_window_view(values, window, axis=0)
+    return view, np.full((window - 1,) + values.shape[1:], np.nan)
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    view, pad = _rolling(values, window)
+    return np.concatenate([pad, view.mean(axis=-1)])
+
+
+def rolling_std(values: np.ndarray, window: int) -> np.ndarray:
+    view, pad = _rolling(values, window)
+    return np.concatenate([pad, view.std(axis=-1, ddof=1)])
+
+
+def rsi(close: np.ndarray, window: int = RSI_WINDOW) -> np.ndarray:
+    """Simple-average RSI along the date axis, NaN until the window is full"""
+    delta = np.empty_like(close)
+    delta[0] = np.nan
+    delta[1:] = close[1:] - close[:-1]
+    # NaN compares False, so the first bar counts as no move, as in pandas' where()
+    gain = rolling_mean(np.where(delta > 0, delta, 0.0), window)
+    loss = rolling_mean(np.where(delta < 0, -delta, 0.0), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return 100 - 100 / (1 + gain / loss)
+
+
+def compute_features(bars: np.ndarray) -> np.ndarray:
+    """Batch mode: features for many symbols at once.
+
+    bars is (fields, dates) or (fields, dates, symbols) in BAR_COLUMNS order,
+    e.g. a PriceMatrix block. Returns (features, dates[, symbols]) in
+    FEATURE_COLUMNS order with NaN until each window is full.
+    """
+    bars = np.asarray(bars, dtype=np.float64)
+    close, volume = bars[CLOSE], bars[VOLUME]
+    if close.shape[0] < WARMUP_BARS:
+        return np.full((len(FEATURE_COLUMNS),) + close.shape, np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        features = [
+            rolling_mean(close, 5),
+            rolling_mean(close, 10),
+            rolling_mean(close, BB_WINDOW),
+            rsi(close),
+            # Upper minus lower Bollinger band: (ma + 2 std) - (ma - 2 std)
+            4 * rolling_std(close, BB_WINDOW),
+            volume / rolling_mean(volume, VOLUME_WINDOW),
+            bars[HIGH] / bars[LOW],
+            close / bars[OPEN],
+        ]
+    return np.stack(features)
+
+
+def feature_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Copy of an OHLCV frame with the feature columns added; the input is left untouched"""
+    features = compute_features(df[BAR_COLUMNS].to_numpy(dtype=np.float64).T)
+    return df.assign(**dict(zip(FEATURE_COLUMNS, features)))
+
+
+class IndicatorState:
+    """Incremental mode: rolling state for one symbol, updated in O(1) per daily bar"""
+
+    # Running sums are re-added exactly this often so float error cannot build up
+    RESYNC_EVERY = 256
+
+    def __init__(self):
+        self._closes = deque(maxlen=BB_WINDOW)
+        self._volumes = deque(maxlen=VOLUME_WINDOW)
+        self._gains = deque(maxlen=RSI_WINDOW)
+        self._losses = deque(maxlen=RSI_WINDOW)
+        self._sums = {"close": 0.0, "close_sq": 0.0, "volume": 0.0, "gain": 0.0, "loss": 0.0}
+        self._prev_close: Optional[float] = None
+        self._updates = 0
+        self.last_date = None
+        self.features: Optional[Dict[str, float]] = None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "IndicatorState":
+        """Seed from the tail of an OHLCV frame; only the last WARMUP_BARS rows are read"""
+        state = cls()
+        for row in df[BAR_COLUMNS].iloc[-WARMUP_BARS:].itertuples():
+            state.update(row.open, row.high, row.low, row.close, row.volume, row.Index)
+        return state
+
+    @property
+    def ready(self) -> bool:
+        return self.features is not None
+
+    def _push(self, buffer: deque, key: str, value: float, squared: Optional[str] = None):
+        if len(buffer) == buffer.maxlen:
+            old = buffer[0]
+            self._sums[key] -= old
+            if squared:
+                self._sums[squared] -= old * old
+        buffer.append(value)
+        self._sums[key] += value
+        if squared:
+            self._sums[squared] += value * value
+
+    def _resync(self):
+        self._sums["close"] = math.fsum(self._closes)
+        self._sums["close_sq"] = math.fsum(c * c for c in self._closes)
+        self._sums["volume"] = math.fsum(self._volumes)
+        self._sums["gain"] = math.fsum(self._gains)
+        self._sums["loss"] = math.fsum(self._losses)
+
+    def update(self, open_: float, high: float, low: float, close: float, volume: float,
+               bar_date=None) -> Optional[Dict[str, float]]:
+        """Add the next daily bar and return the features as of that bar (None during warm-up)"""
+        delta = 0.0 if self._prev_close is None else close - self._prev_close
+        self._prev_close = close
+        self._push(self._gains, "gain", max(delta, 0.0))
+        self._push(self._losses, "loss", max(-delta, 0.0))
+        self._push(self._closes, "close", close, "close_sq")
+        self._push(self._volumes, "volume", volume)
+        self.last_date = bar_date
+
+        self._updates += 1
+        if self._updates % self.RESYNC_EVERY == 0:
+            self._resync()
+
+        if len(self._closes) < BB_WINDOW or len(self._gains) < RSI_WINDOW or len(self._volumes) < VOLUME_WINDOW:
+            return None
+
+        n = BB_WINDOW
+        variance = max((self._sums["close_sq"] - self._sums["close"] ** 2 / n) / (n - 1), 0.0)
+        gain, loss = self._sums["gain"] / RSI_WINDOW, self._sums["loss"] / RSI_WINDOW
+        if loss > 0:
+            rsi = 100 - 100 / (1 + gain / loss)
+        else:
+            rsi = 100.0 if gain > 0 else float('nan')
+        closes = list(self._closes)
+        volume_ma = self._sums["volume"] / VOLUME_WINDOW
+
+        self.features = {
+            'ma_5': math.fsum(closes[-5:]) / 5,
+            'ma_10': math.fsum(closes[-10:]) / 10,
+            'ma_20': self._sums["close"] / n,
+            'rsi': rsi,
+            'bb_width': 4 * math.sqrt(variance),
+            'volume_ratio': volume / volume_ma if volume_ma else float('nan'),
+            'high_low_ratio': high / low if low else float('nan'),
+            'close_open_ratio': close / open_ if open_ else float('nan'),
+        }
+        return self.features
+
+    def row(self) -> pd.DataFrame:
+        """Current features as a one-row frame in FEATURE_COLUMNS order"""
+        return pd.DataFrame([self.features], columns=FEATURE_COLUMNS, index=[self.last_date])
+
+
+class IndicatorBook:
+    """IndicatorState per symbol, advanced only by bars newer than the last one seen"""
+
+    def __init__(self):
+        self._states: Dict[str, IndicatorState] = {}
+        self._lock = threading.Lock()
+
+    def get(self, symbol: str) -> Optional[IndicatorState]:
+        return self._states.get(symbol)
+
+    def advance(self, symbol: str, df: pd.DataFrame) -> IndicatorState:
+        with self._lock:
+            return self._advance(symbol, df)
+
+    def _advance(self, symbol: str, df: pd.DataFrame) -> IndicatorState:
+        state = self._states.get(symbol)
+        if state is None or state.last_date is None or state.last_date not in df.index:
+            # Unknown symbol, or a gap larger than the frame: seed from the tail
+            state = IndicatorState.from_frame(df)
+        else:
+            new_rows = df[BAR_COLUMNS].loc[df.index > state.last_date]
+            for row in new_rows.itertuples():
+                state.update(row.open, row.high, row.low, row.close, row.volume, row.Index)
+        self._states[symbol] = state
+        return state
+
+
+def latest_features(bars: np.ndarray) -> np.ndarray:
+    """Newest feature row per symbol (symbols x features) from a (fields, dates, symbols) block"""
+    return compute_features(bars[:, -WARMUP_BARS:])[:, -1].T
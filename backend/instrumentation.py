@@ -0,0 +1,267 @@
+import os
+import re
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import ContextDecorator, contextmanager
+from typing import Dict, Iterable, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+load_dotenv()
+
+# Spans, query timings and request histograms; cheap enough to leave on
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Debug: attach a Server-Timing header with the per-stage breakdown to every response
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() == "true"
+
+PROMETHEUS_MEDIA_TYPE = "text/plain; version=0.0.4"
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, help: str, label_names: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.label_names, labels)} {value}" for labels, value in values]
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram per label set, rendered with cumulative buckets"""
+
+    def __init__(self, name: str, help: str, label_names: Iterable[str] = (), buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + (le,))} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {round(total, 6)}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}")
+        return lines
+
+
+request_duration = Histogram("http_request_duration_seconds", "API request latency", ("method", "route", "status"))
+stage_duration = Histogram("stage_duration_seconds", "Time spent in an instrumented stage of request handling", ("stage",))
+query_duration = Histogram("db_query_duration_seconds", "SQL statement execution time", ("operation",))
+upstream_requests = Counter("upstream_requests_total", "Market data provider requests", ("function", "outcome"))
+errors = Counter("errors_total", "Errors handled by falling back instead of failing the request", ("component", "error"))
+METRICS = [request_duration, stage_duration, query_duration, upstream_requests, errors]
+
+
+class Timings:
+    """Per-stage totals for one request (or one job run in a worker process)"""
+
+    def __init__(self, keep_samples: bool = False):
+        self.stages: Dict[str, List[float]] = {}
+        self.samples: Optional[List[Tuple[str, float]]] = [] if keep_samples else None
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float):
+        with self._lock:
+            total = self.stages.get(stage)
+            if total is None:
+                self.stages[stage] = [seconds, 1]
+            else:
+                total[0] += seconds
+                total[1] += 1
+            if self.samples is not None:
+                self.samples.append((stage, seconds))
+
+    def server_timing(self, total: float) -> str:
+        """Server-Timing header value; stages can nest, so they need not add up to the total"""
+        with self._lock:
+            stages = sorted(self.stages.items())
+        entries = [f'{stage};dur={seconds * 1000:.2f};desc="{count}x"' for stage, (seconds, count) in stages]
+        entries.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(entries)
+
+
+# Timings of the request being handled; copied into threads started with to_thread or run_in_threadpool
+_current: contextvars.ContextVar[Optional[Timings]] = contextvars.ContextVar("timings", default=None)
+
+
+def record(stage: str, seconds: float):
+    stage_duration.observe(seconds, stage)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+
+class span(ContextDecorator):
+    """Time a block (or, as a decorator, every call of a function) as one stage"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self._start = 0.0
+
+    def _recreate_cm(self):
+        # A fresh instance per call, so concurrent calls of a decorated function do not share a start time
+        return span(self.stage)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        if METRICS_ENABLED:
+            record(self.stage, time.perf_counter() - self._start)
+        return False
+
+
+@contextmanager
+def collect():
+    """Gather every stage recorded inside the block, e.g. in a worker process, to merge() elsewhere"""
+    timings = Timings(keep_samples=True)
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def merge(samples: Iterable[Tuple[str, float]]):
+    """Record stages timed in another process as if they ran here"""
+    for stage, seconds in samples:
+        record(stage, seconds)
+
+
+def count_error(component: str, error: BaseException):
+    errors.inc(component, type(error).__name__)
+
+
+def count_upstream(function: str, outcome: str):
+    upstream_requests.inc(function or "unknown", outcome)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    seconds = time.perf_counter() - starts.pop()
+    if METRICS_ENABLED:
+        query_duration.observe(seconds, statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER")
+        record("db", seconds)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    # A failed statement never reaches after_cursor_execute
+    if context.connection is not None:
+        starts = context.connection.info.get("query_start")
+        if starts:
+            starts.pop()
+
+
+class TimingMiddleware:
+    """ASGI middleware timing every HTTP request by route template and status"""
+
+    def __init__(self, app, server_timing: bool = SERVER_TIMING_ENABLED):
+        self.app = app
+        self.server_timing = server_timing
+        self._routes: Optional[Dict] = None
+
+    def _route(self, scope) -> str:
+        # Label by the route's path template, never the raw path, to keep series bounded
+        if self._routes is None:
+            self._routes = {route.endpoint: route.path for route in scope["app"].routes if hasattr(route, "endpoint")}
+        return self._routes.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        timings = Timings()
+        token = _current.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    MutableHeaders(scope=message).append("Server-Timing", timings.server_timing(time.perf_counter() - start))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            request_duration.observe(time.perf_counter() - start, scope["method"], self._route(scope), str(status))
+
+
+def _gauges(prefix: str, stats: Dict) -> List[str]:
+    lines = []
+    for key, value in stats.items():
+        name = re.sub(r"[^a-zA-Z0-9_]", "_", f"{prefix}_{key}")
+        if isinstance(value, dict):
+            lines += _gauges(name, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            lines += [f"# TYPE {name} gauge", f"{name} {value}"]
+    return lines
+
+
+def render_metrics(stats: Optional[Dict[str, Dict]] = None) -> str:
+    """Prometheus text exposition of every metric, plus numeric fields of stats dicts as gauges"""
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    for prefix, values in (stats or {}).items():
+        lines += _gauges(prefix, values)
+    return "\n".join(lines) + "\n"
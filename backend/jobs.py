@@ -0,0 +1,252 @@
+import os
+import time
+import uuid
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+import instrumentation
+from instrumentation import span
+
+load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", str(os.cpu_count() or 1)))
+# Queued or running jobs one user may have at a time
+JOB_MAX_PER_USER = int(os.getenv("JOB_MAX_PER_USER", "2"))
+# Seconds a finished job and its result stay available for polling
+JOB_RESULT_TTL = int(os.getenv("JOB_RESULT_TTL", "3600"))
+
+JOB_KINDS = ("simulate", "optimize", "predict", "train")
+ACTIVE_STATUSES = ("queued", "running")
+# Native thread pools numpy, scipy and sklearn size from the environment at import time
+THREAD_LIMIT_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+class JobLimitExceeded(RuntimeError):
+    """The user already has JOB_MAX_PER_USER jobs queued or running"""
+
+
+class Job:
+    def __init__(self, user_id: int, kind: str):
+        self.id = uuid.uuid4().hex
+        self.user_id = user_id
+        self.kind = kind
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+        # Called on cancel, for work that keeps running outside the task (e.g. in a thread)
+        self._on_cancel: Optional[Callable[[], None]] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ACTIVE_STATUSES
+
+    def as_dict(self) -> Dict:
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+class JobManager:
+    """Runs CPU-heavy work in a process pool so request threads and the event loop stay free.
+
+    Handlers either await work inline with run(), waiting for one of the
+    user's slots, or submit() it as a job that clients poll by id. Work is a
+    coroutine: it may fetch market data on the event loop before handing
+    the computation to the pool with call().
+
+    Cancelling a job that is still queued drops it from the pool; a
+    computation already running in a worker finishes there and its result
+    is discarded. Work running in a thread is told to stop through the
+    on_cancel callback given to submit().
+    """
+
+    def __init__(self, workers: int = JOB_WORKERS, max_per_user: int = JOB_MAX_PER_USER,
+                 result_ttl: int = JOB_RESULT_TTL):
+        self.workers = max(1, workers)
+        self.max_per_user = max_per_user
+        self.result_ttl = result_ttl
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._jobs: Dict[str, Job] = {}
+        self._slots: Dict[int, asyncio.Semaphore] = {}
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Spawned rather than forked: the API process has threads and open connections
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=_init_worker, initargs=(self.workers,))
+        return self._pool
+
+    async def call(self, fn: Callable, *args) -> Any:
+        """Run a module-level function in the pool and await its result"""
+        with span("job_pool"):
+            result, samples = await asyncio.wrap_future(self._executor().submit(_traced, fn, *args))
+        # Stages timed in the worker count towards this process's metrics and the current request
+        instrumentation.merge(samples)
+        return result
+
+    def _slot(self, user_id: int) -> asyncio.Semaphore:
+        return self._slots.setdefault(user_id, asyncio.Semaphore(self.max_per_user))
+
+    async def run(self, user_id: Optional[int], work: Awaitable) -> Any:
+        """Await work inline, at most max_per_user at a time per user"""
+        if user_id is None:
+            return await work
+        async with self._slot(user_id):
+            return await work
+
+    def submit(self, user_id: int, kind: str, work: Awaitable, on_cancel: Optional[Callable[[], None]] = None) -> Job:
+        self._purge()
+        if sum(1 for job in self._jobs.values() if job.user_id == user_id and job.active) >= self.max_per_user:
+            work.close()
+            raise JobLimitExceeded(f"At most {self.max_per_user} jobs may be queued or running at once")
+        job = Job(user_id, kind)
+        job._on_cancel = on_cancel
+        self._jobs[job.id] = job
+        job._task = asyncio.create_task(self._execute(job, work))
+        return job
+
+    async def _execute(self, job: Job, work: Awaitable):
+        try:
+            async with self._slot(job.user_id):
+                job.status = "running"
+                job.started_at = time.time()
+                result = await work
+            if isinstance(result, dict) and "error" in result:
+                job.status, job.error = "failed", str(result["error"])
+            else:
+                job.status, job.result = "succeeded", result
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status, job.error = "failed", str(e) or type(e).__name__
+        finally:
+            # A job cancelled while waiting for a slot never started its work
+            work.close()
+            job.finished_at = time.time()
+
+    def get(self, job_id: str, user_id: int) -> Optional[Job]:
+        self._purge()
+        job = self._jobs.get(job_id)
+        return job if job is not None and job.user_id == user_id else None
+
+    def list(self, user_id: int) -> List[Job]:
+        self._purge()
+        return sorted((job for job in self._jobs.values() if job.user_id == user_id), key=lambda job: job.created_at)
+
+    def cancel(self, job: Job) -> bool:
+        """Cancel a queued or running job; False when it already finished"""
+        if not job.active:
+            return False
+        job._task.cancel()
+        if job._on_cancel is not None:
+            job._on_cancel()
+        job.status = "cancelled"
+        return True
+
+    def _purge(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id in [job.id for job in self._jobs.values() if job.finished_at is not None and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        for job in self._jobs.values():
+            self.cancel(job)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def get_stats(self) -> Dict:
+        statuses: Dict[str, int] = {}
+        for job in self._jobs.values():
+            statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {"workers": self.workers, "max_per_user": self.max_per_user, "jobs": statuses}
+
+
+# Set in each worker process by _init_worker
+_predictor = None
+_simulator = None
+_optimizer = None
+_risk_analyzer = None
+_analytics = None
+
+
+def _worker_threads(workers: int) -> int:
+    """Native threads each worker may use so workers x threads stays within the CPU count"""
+    return max(1, (os.cpu_count() or 1) // max(workers, 1))
+
+
+def _init_worker(workers: int):
+    global _predictor, _simulator, _optimizer, _risk_analyzer, _analytics
+    # Must run before numpy is first imported in this process; an explicit setting wins
+    threads = str(_worker_threads(workers))
+    for name in THREAD_LIMIT_VARS:
+        os.environ.setdefault(name, threads)
+
+    from database import engine
+    from market_client import MarketDataClient
+    from portfolio_analytics import ALPHA_VANTAGE_API_KEY, PortfolioAnalytics
+    from request_scheduler import NoQuotaScheduler
+    from ml_models import RiskAnalyzer, StockPredictor
+    from monte_carlo import MonteCarloSimulator
+    from optimizer import PortfolioOptimizer
+
+    # Never reuse pooled connections that belong to the parent process
+    engine.dispose(close=False)
+    # The API process fetches every input and owns the whole provider quota; a
+    # worker only reads stored bars, so its calls can never exceed the limit
+    _analytics = PortfolioAnalytics(client=MarketDataClient(ALPHA_VANTAGE_API_KEY, scheduler=NoQuotaScheduler()))
+    _predictor = StockPredictor(_analytics)
+    _simulator = MonteCarloSimulator(_analytics)
+    _optimizer = PortfolioOptimizer(_analytics)
+    _risk_analyzer = RiskAnalyzer(_analytics)
+
+
+def _traced(fn: Callable, *args):
+    with instrumentation.collect() as timings:
+        result = fn(*args)
+    return result, timings.samples
+
+
+def predict(symbol: str, history) -> Dict:
+    return _predictor.predict_price(symbol, history=history)
+
+
+def train(symbol: str, history) -> Dict:
+    # Background retrain of a stale model, at the default batch priority
+    return _predictor.refresh_model(symbol, history=history)
+
+
+@span("simulation")
+def simulate(holdings: List[Dict], days: int, paths: int, seed: Optional[int], histories: Dict) -> Dict:
+    # The job pool is the parallelism; no nested simulation pool inside a worker
+    return _simulator.simulate_portfolio(holdings, days, paths, seed, 1, histories)
+
+
+@span("optimization")
+def optimize(portfolio_id: int, holdings: List[Dict], target: str, max_weight: float, points: int, histories: Dict) -> Dict:
+    return _optimizer.optimize(portfolio_id, holdings, target, max_weight, points, histories)
+
+
+def assess(holdings: List[Dict], histories: Dict, with_metrics: bool = True) -> Dict:
+    """Portfolio metrics (unless served from snapshots) and risk assessment for the analytics endpoint"""
+    return {
+        "metrics": _analytics.calculate_portfolio_metrics(holdings, histories) if with_metrics else None,
+        "risk_assessment": _risk_analyzer.assess_portfolio_risk(holdings, histories),
+    }
+
+
+# Shared by every handler in the API process
+default_job_manager = JobManager()
@@ -0,0 +1,388 @@
+import os
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, Iterable, List, Optional
+from sqlalchemy import bindparam, delete, func, insert, select, update
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from models import Holding, Portfolio, Transaction
+
+load_dotenv()
+
+COST_METHODS = ("fifo", "lifo", "average")
+LEDGER_MAX_RETRIES = int(os.getenv("LEDGER_MAX_RETRIES", "3"))
+# Shares below this are treated as a closed position
+SHARE_EPSILON = 1e-9
+
+holdings_table = Holding.__table__
+portfolios_table = Portfolio.__table__
+transactions_table = Transaction.__table__
+
+
+class LedgerError(ValueError):
+    """A transaction the ledger cannot accept, e.g. selling more shares than are held"""
+
+
+class LedgerConflict(RuntimeError):
+    """Another writer kept changing the portfolio's ledger; the caller may retry"""
+
+
+class Lot:
+    def __init__(self, shares: float, price: float, opened: Optional[datetime], transaction_id: Optional[int] = None):
+        self.shares = shares
+        self.price = price
+        self.opened = opened
+        self.transaction_id = transaction_id
+
+
+class Position:
+    """Open lots and realized gain for one symbol, built by replaying its transactions"""
+
+    def __init__(self, symbol: str, method: str = "average"):
+        self.symbol = symbol
+        self.method = method
+        self.lots: Deque[Lot] = deque()
+        self.realized_gain = 0.0
+        self.last_price: Optional[float] = None
+
+    @property
+    def shares(self) -> float:
+        return sum(lot.shares for lot in self.lots)
+
+    @property
+    def cost(self) -> float:
+        return sum(lot.shares * lot.price for lot in self.lots)
+
+    @property
+    def average_price(self) -> float:
+        shares = self.shares
+        return self.cost / shares if shares > SHARE_EPSILON else 0.0
+
+    def buy(self, shares: float, price: float, when: Optional[datetime] = None, transaction_id: Optional[int] = None):
+        self.last_price = price
+        if self.method == "average" and self.lots:
+            # One pooled lot at the running average cost
+            lot = self.lots[0]
+            lot.price = (lot.shares * lot.price + shares * price) / (lot.shares + shares)
+            lot.shares += shares
+        else:
+            self.lots.append(Lot(shares, price, when, transaction_id))
+
+    def sell(self, shares: float, price: float):
+        if shares > self.shares + SHARE_EPSILON:
+            raise LedgerError(f"Cannot sell {shares:g} {self.symbol}: only {self.shares:g} held")
+        self.last_price = price
+        remaining = shares
+        while remaining > SHARE_EPSILON:
+            lot = self.lots[-1] if self.method == "lifo" else self.lots[0]
+            matched = min(lot.shares, remaining)
+            self.realized_gain += matched * (price - lot.price)
+            lot.shares -= matched
+            remaining -= matched
+            if lot.shares <= SHARE_EPSILON:
+                self.lots.pop() if self.method == "lifo" else self.lots.popleft()
+
+    def apply(self, tx: Dict):
+        if tx['shares'] <= 0 or tx['price'] < 0:
+            raise LedgerError("Shares must be positive and price non-negative")
+        if tx['transaction_type'] == "BUY":
+            self.buy(tx['shares'], tx['price'], tx.get('transaction_date'), tx.get('id'))
+        elif tx['transaction_type'] == "SELL":
+            self.sell(tx['shares'], tx['price'])
+        else:
+            raise LedgerError(f"Unknown transaction type {tx['transaction_type']!r}")
+
+
+def replay(transactions: Iterable[Dict], method: str = "average") -> Dict[str, Position]:
+    """Positions after applying transactions in order"""
+    positions: Dict[str, Position] = {}
+    for tx in transactions:
+        position = positions.get(tx['symbol'])
+        if position is None:
+            position = positions[tx['symbol']] = Position(tx['symbol'], method)
+        position.apply(tx)
+    return positions
+
+
+def _ledger_rows(db: Session, portfolio_id: int, symbols: Optional[List[str]] = None) -> List[Dict]:
+    query = (
+        select(transactions_table.c.id, transactions_table.c.symbol, transactions_table.c.transaction_type,
+               transactions_table.c.shares, transactions_table.c.price, transactions_table.c.transaction_date)
+        .where(transactions_table.c.portfolio_id == portfolio_id)
+        .order_by(transactions_table.c.transaction_date, transactions_table.c.id)
+    )
+    if symbols is not None:
+        query = query.where(transactions_table.c.symbol.in_(symbols))
+    result = db.execute(query)
+    keys = list(result.keys())
+    return [dict(zip(keys, row)) for row in result]
+
+
+def _portfolio_symbols(db: Session, portfolio_id: int) -> List[str]:
+    """Every symbol the portfolio holds or has traded"""
+    return list(db.execute(
+        select(holdings_table.c.symbol).where(holdings_table.c.portfolio_id == portfolio_id)
+        .union(select(transactions_table.c.symbol).where(transactions_table.c.portfolio_id == portfolio_id))
+    ).scalars())
+
+
+def _holding_rows(db: Session, portfolio_id: int, symbols: List[str]) -> Dict[str, List]:
+    rows: Dict[str, List] = {}
+    for row in db.execute(
+        select(holdings_table.c.id, holdings_table.c.symbol, holdings_table.c.company_name,
+               holdings_table.c.shares, holdings_table.c.average_price, holdings_table.c.current_price,
+               holdings_table.c.created_at)
+        .where(holdings_table.c.portfolio_id == portfolio_id, holdings_table.c.symbol.in_(symbols))
+        .order_by(holdings_table.c.id)
+    ):
+        rows.setdefault(row.symbol, []).append(row)
+    return rows
+
+
+def _opening_rows(portfolio_id: int, holdings: Dict[str, List], history: List[Dict]) -> List[Dict]:
+    """Opening BUYs for shares held outside the ledger, so they survive a replay.
+
+    A holding may have been created directly (or predate the ledger) and
+    still have some transactions. Its symbol gets one BUY, dated before its
+    first transaction, for the shares the ledger does not account for: enough
+    to reach the stored holding and to cover any SELL the ledger could not
+    otherwise replay. Once written the ledger matches the holding, so calling
+    this again adds nothing. A holding smaller than its ledger is left to the
+    ledger, which is the source of truth.
+    """
+    traded: Dict[str, List[Dict]] = {}
+    for row in history:
+        traded.setdefault(row['symbol'], []).append(row)
+    openings = []
+    for symbol in set(holdings) | set(traded):
+        rows = holdings.get(symbol, [])
+        stored = sum(row.shares or 0.0 for row in rows)
+        net = lowest = 0.0
+        for tx in traded.get(symbol, []):
+            net += tx['shares'] if tx['transaction_type'] == "BUY" else -tx['shares']
+            lowest = min(lowest, net)
+        shares = max(stored - net, -lowest)
+        if shares <= SHARE_EPSILON:
+            continue
+        price = (sum((row.shares or 0.0) * (row.average_price or 0.0) for row in rows) / stored if stored > SHARE_EPSILON
+                 else traded[symbol][0]['price'])
+        dates = [row.created_at for row in rows if row.created_at is not None]
+        if symbol in traded:
+            dates.append(_naive(traded[symbol][0]['transaction_date']) - timedelta(microseconds=1))
+        openings.append({
+            "portfolio_id": portfolio_id,
+            "symbol": symbol,
+            "transaction_type": "BUY",
+            "shares": shares,
+            "price": price,
+            "total_amount": shares * price,
+            "transaction_date": min((_naive(when) for when in dates), default=_naive(datetime.now(timezone.utc))),
+        })
+    return openings
+
+
+def _write_holdings(db: Session, portfolio_id: int, positions: Dict[str, Position], holdings: Dict[str, List],
+                    prices: Dict[str, float], names: Dict[str, str]):
+    """Make the holdings rows for these symbols match the replayed positions, with set-based statements"""
+    updates, inserts, removed = [], [], []
+    for symbol, position in positions.items():
+        rows = holdings.get(symbol, [])
+        shares = position.shares
+        if shares <= SHARE_EPSILON:
+            removed.extend(row.id for row in rows)
+            continue
+        # Duplicate rows for one symbol collapse into the oldest
+        row = rows[0] if rows else None
+        removed.extend(extra.id for extra in rows[1:])
+        price = prices.get(symbol) or (row.current_price if row is not None else None) or position.last_price or 0.0
+        average = position.average_price
+        values = {
+            "shares": shares,
+            "average_price": average,
+            "current_price": price,
+            "market_value": shares * price,
+            "gain_loss": (price - average) * shares,
+            "gain_loss_percent": (price - average) / average * 100 if average > 0 else 0,
+        }
+        if row is not None:
+            updates.append({"holding_id": row.id, **values})
+        else:
+            inserts.append({"portfolio_id": portfolio_id, "symbol": symbol,
+                            "company_name": names.get(symbol, symbol), **values})
+
+    if updates:
+        db.execute(
+            update(holdings_table)
+            .where(holdings_table.c.id == bindparam("holding_id"))
+            .values({name: bindparam(name) for name in updates[0] if name != "holding_id"}),
+            updates,
+        )
+    if inserts:
+        db.execute(insert(holdings_table), inserts)
+    if removed:
+        db.execute(delete(holdings_table).where(holdings_table.c.id.in_(removed)))
+
+    total = (
+        select(func.coalesce(func.sum(holdings_table.c.market_value), 0.0))
+        .where(holdings_table.c.portfolio_id == portfolio_id)
+        .scalar_subquery()
+    )
+    db.execute(update(portfolios_table).where(portfolios_table.c.id == portfolio_id).values(total_value=total))
+
+
+class Ledger:
+    """Transactions are the source of truth; holdings are derived from them.
+
+    Every write starts by claiming the portfolio: it locks the row (SELECT
+    ... FOR UPDATE where the database supports it) and bumps
+    Portfolio.ledger_version with a compare-and-set, retrying when another
+    writer got there first. Shares a holding has beyond what its
+    transactions account for get an opening BUY the first time its symbol
+    is traded or the portfolio is rebuilt; until then the holding is left
+    as it is.
+    """
+
+    def __init__(self, max_retries: int = LEDGER_MAX_RETRIES):
+        self.max_retries = max_retries
+
+    def claim(self, db: Session, portfolio_id: int) -> str:
+        """Take the portfolio for a ledger write in the current transaction; returns its cost method"""
+        for _ in range(self.max_retries):
+            portfolio = db.execute(
+                select(portfolios_table.c.ledger_version, portfolios_table.c.cost_method)
+                .where(portfolios_table.c.id == portfolio_id)
+                .with_for_update()
+            ).one()
+            if self._bump_version(db, portfolio_id, portfolio.ledger_version):
+                return portfolio.cost_method
+            db.rollback()
+        raise LedgerConflict(f"Portfolio {portfolio_id} changed concurrently; try again")
+
+    def open_positions(self, db: Session, portfolio_id: int, symbols: Optional[List[str]] = None) -> int:
+        """Write opening BUYs for shares held outside the ledger; call after claim"""
+        if symbols is None:
+            symbols = _portfolio_symbols(db, portfolio_id)
+        if not symbols:
+            return 0
+        history = _ledger_rows(db, portfolio_id, symbols)
+        openings = _opening_rows(portfolio_id, _holding_rows(db, portfolio_id, symbols), history)
+        if openings:
+            db.execute(insert(transactions_table), openings)
+        return len(openings)
+
+    def sync(self, db: Session, portfolio_id: int, method: str, symbols: Optional[List[str]] = None,
+             prices: Optional[Dict[str, float]] = None, names: Optional[Dict[str, str]] = None) -> int:
+        """Replay the stored ledger and rewrite the holdings of the given symbols (default all); call after claim.
+
+        Raises LedgerError if the ledger is inconsistent; the caller rolls back.
+        """
+        positions = replay(_ledger_rows(db, portfolio_id, symbols), method)
+        holdings = _holding_rows(db, portfolio_id, list(positions))
+        _write_holdings(db, portfolio_id, positions, holdings, prices or {}, names or {})
+        return len(positions)
+
+    def record(self, db: Session, portfolio_id: int, transactions: List[Dict],
+               prices: Optional[Dict[str, float]] = None, names: Optional[Dict[str, str]] = None) -> List[int]:
+        """Validate and append transactions, then rebuild the affected holdings.
+
+        Any number of transactions goes in as one executemany INSERT. Raises
+        LedgerError if any of them is invalid against the ledger, in which
+        case nothing is written.
+        """
+        if not transactions:
+            return []
+        now = datetime.now(timezone.utc)
+        new_rows = [{
+            "portfolio_id": portfolio_id,
+            "symbol": tx['symbol'].upper(),
+            "transaction_type": tx['transaction_type'].upper(),
+            "shares": tx['shares'],
+            "price": tx['price'],
+            "total_amount": tx['shares'] * tx['price'],
+            "transaction_date": tx.get('transaction_date') or now,
+        } for tx in transactions]
+        symbols = list({row['symbol'] for row in new_rows})
+
+        method = self.claim(db, portfolio_id)
+        try:
+            self.open_positions(db, portfolio_id, symbols)
+            history = _ledger_rows(db, portfolio_id, symbols)
+            positions = replay(self._ordered(history + new_rows), method)
+        except LedgerError:
+            db.rollback()
+            raise
+
+        ids = db.execute(
+            insert(transactions_table).returning(transactions_table.c.id, sort_by_parameter_order=True),
+            new_rows,
+        ).scalars().all()
+        _write_holdings(db, portfolio_id, positions, _holding_rows(db, portfolio_id, symbols),
+                        prices or {}, names or {})
+        db.commit()
+        return list(ids)
+
+    def rebuild(self, db: Session, portfolio_id: int, cost_method: Optional[str] = None,
+                prices: Optional[Dict[str, float]] = None) -> int:
+        """Replay the whole ledger and rewrite the holdings of every symbol in it.
+
+        Passing cost_method switches the portfolio's lot matching first. Returns
+        the number of symbols replayed.
+        """
+        if cost_method is not None and cost_method not in COST_METHODS:
+            raise LedgerError(f"cost_method must be one of {', '.join(COST_METHODS)}")
+        current = self.claim(db, portfolio_id)
+        method = cost_method or current
+        if method != current:
+            db.execute(update(portfolios_table).where(portfolios_table.c.id == portfolio_id)
+                       .values(cost_method=method))
+        try:
+            self.open_positions(db, portfolio_id)
+            replayed = self.sync(db, portfolio_id, method, prices=prices)
+        except LedgerError:
+            db.rollback()
+            raise
+        db.commit()
+        return replayed
+
+    def positions(self, db: Session, portfolio_id: int, method: Optional[str] = None) -> Dict[str, Position]:
+        """Replayed positions (open lots and realized gains) without writing anything"""
+        if method is None:
+            method = db.execute(select(portfolios_table.c.cost_method).where(portfolios_table.c.id == portfolio_id)).scalar()
+        return replay(_ledger_rows(db, portfolio_id), method)
+
+    def positions_at(self, db: Session, portfolio_id: int, until: datetime, method: Optional[str] = None) -> Dict[str, Position]:
+        """Positions held just before until, without writing anything.
+
+        Shares held outside the ledger count from their opening date, as
+        open_positions would record them.
+        """
+        if method is None:
+            method = db.execute(select(portfolios_table.c.cost_method).where(portfolios_table.c.id == portfolio_id)).scalar()
+        history = _ledger_rows(db, portfolio_id)
+        openings = _opening_rows(portfolio_id, _holding_rows(db, portfolio_id, _portfolio_symbols(db, portfolio_id)), history)
+        until = _naive(until)
+        return replay((row for row in self._ordered(history + openings) if _naive(row['transaction_date']) < until), method)
+
+    @staticmethod
+    def _ordered(rows: List[Dict]) -> List[Dict]:
+        # Stored rows keep their order; new rows follow any stored row with the same timestamp
+        return sorted(rows, key=lambda row: (_naive(row['transaction_date']), 'id' not in row, row.get('id') or 0))
+
+    @staticmethod
+    def _bump_version(db: Session, portfolio_id: int, version: int) -> bool:
+        result = db.execute(
+            update(portfolios_table)
+            .where(portfolios_table.c.id == portfolio_id, portfolios_table.c.ledger_version == version)
+            .values(ledger_version=version + 1)
+        )
+        return result.rowcount == 1
+
+
+def _naive(when: Optional[datetime]) -> datetime:
+    if when is None:
+        return datetime.min
+    return when.replace(tzinfo=None) - when.utcoffset() if when.tzinfo is not None else when
+
+
+default_ledger = Ledger()
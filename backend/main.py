@@ -1,21 +1,93 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, File, HTTPException, Request, UploadFile, status
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from datetime import timedelta
-from typing import List
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from contextlib import asynccontextmanager
+import asyncio
+import json
+import logging
+import threading
+import pandas as pd
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Set
 
-from database import SessionLocal, engine, get_db
+from database import SessionLocal, dispose_engines, engine, get_async_read_db, get_db, get_read_db, missing_columns, pool_stats
 from models import Base, User as UserModel, Portfolio as PortfolioModel, Holding as HoldingModel, Transaction as TransactionModel
 import schemas
 from auth import *
 from portfolio_analytics import PortfolioAnalytics
-from ml_models import StockPredictor, RiskAnalyzer
+from ml_models import TRAINING_BARS, RiskAnalyzer
+from optimizer import MAX_FRONTIER_POINTS, OPTIMIZER_LOOKBACK_DAYS, TARGETS
+from ledger import COST_METHODS, LedgerConflict, LedgerError, default_ledger as ledger
+from importer import FORMATS as IMPORT_FORMATS, detect_format, import_transactions
+from backtester import BACKTEST_COST_BPS, STRATEGIES, EventBacktester, load_bars, replay_transactions, run_strategy, signal_orders
+from monte_carlo import MC_LOOKBACK_DAYS, MC_MAX_DAYS, MC_MAX_PATHS
+from revaluation import revalue_portfolios
+from bar_encoding import ARROW_MEDIA_TYPE, FORMATS as HISTORY_FORMATS, HISTORY_PAGE_LIMIT, NDJSON_MEDIA_TYPE, arrow_ipc, columnar_json, ndjson_lines, page
+from snapshots import snapshot_metrics, snapshot_series
+from analytics_cache import default_analytics_cache as analytics_cache, if_none_match
+from market_refresher import MARKET_REFRESH_ENABLED, MarketDataRefresher, MarketEventBroker
+import jobs
+from jobs import JobLimitExceeded, default_job_manager as job_manager
+from instrumentation import PROMETHEUS_MEDIA_TYPE, TimingMiddleware, count_error, render_metrics
+from train_models import RUN_ID_PATTERN, TRAIN_WORKERS, default_run_id, held_symbols, load_run, summarize, train_universe
 
-# Create tables
+MAX_BATCH_SYMBOLS = 200
+MAX_BACKTEST_SYMBOLS = 500
+MAX_TRANSACTION_BATCH = 10000
+
+logger = logging.getLogger(__name__)
+
+# Create tables; columns and indexes added to existing tables are applied by create_tables.py
 Base.metadata.create_all(bind=engine)
+_unmigrated = missing_columns(engine, Base.metadata)
+if _unmigrated:
+    logger.error("Database schema is behind the models (missing %s); run python create_tables.py",
+                 ", ".join(f"{table.name}.{column.name}" for table, column in _unmigrated))
+
+# Initialize services
+analytics = PortfolioAnalytics()
+risk_analyzer = RiskAnalyzer(analytics)
+market_events = MarketEventBroker()
+refresher = MarketDataRefresher(analytics, market_events)
+
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Jobs of the training runs started from the admin API, by run id
+training_jobs: Dict[str, jobs.Job] = {}
+# Run ids whose training thread is still running; a cancelled run stays here until its workers finish
+training_threads: Set[str] = set()
+
+# Background retrains of stale prediction models, by symbol
+retraining: Dict[str, asyncio.Task] = {}
 
-app = FastAPI(title="Smart Investment Analytics Platform", version="1.0.0")
+def training_active(run_id: str) -> bool:
+    job = training_jobs.get(run_id)
+    return run_id in training_threads or (job is not None and job.active)
+
+def run_training(symbols: List[str], workers: int, run_id: str, resume: bool, stop: threading.Event) -> Dict:
+    training_threads.add(run_id)
+    try:
+        return train_universe(symbols, workers, run_id, resume, stop=stop)
+    finally:
+        training_threads.discard(run_id)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MARKET_REFRESH_ENABLED:
+        refresher.start()
+    yield
+    await refresher.stop()
+    job_manager.shutdown()
+    await analytics.client.aclose()
+    analytics.client.close()
+    await dispose_engines()
+
+app = FastAPI(title="Smart Investment Analytics Platform", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -24,34 +96,35 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "Server-Timing"],
 )
-
-# Initialize services
-analytics = PortfolioAnalytics()
-predictor = StockPredictor()
-risk_analyzer = RiskAnalyzer()
+app.add_middleware(TimingMiddleware)
 
 # Authentication endpoints
 @app.post("/register", response_model=schemas.User)
-def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = db.query(UserModel).filter(UserModel.email == user.email).first()
+async def register_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
+    db_user = await run_in_threadpool(lambda: db.query(UserModel).filter(UserModel.email == user.email).first())
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await aget_password_hash(user.password)
     db_user = UserModel(
         username=user.username,
         email=user.email,
         hashed_password=hashed_password
     )
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    
+    def save():
+        db.add(db_user)
+        db.commit()
+        db.refresh(db_user)
+    
+    await run_in_threadpool(save)
     return db_user
 
 @app.post("/token", response_model=schemas.Token)
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = authenticate_user(db, form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
+    user = await aauthenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -64,13 +137,74 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(), db:
     )
     return {"access_token": access_token, "token_type": "bearer"}
 
+@app.delete("/user/account")
+def deactivate_account(current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    db.query(UserModel).filter(UserModel.id == current_user.id).update({UserModel.is_active: False})
+    db.commit()
+    invalidate_principal(current_user.username)
+    return {"message": "Account deactivated"}
+
+@app.get("/auth/stats")
+def get_auth_stats(reader: Optional[Principal] = Depends(get_stats_reader)):
+    return auth_stats()
+
 # Portfolio endpoints
 @app.get("/portfolios", response_model=List[schemas.Portfolio])
-def get_portfolios(current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_portfolios(current_user: Principal = Depends(get_current_user), db: Session = Depends(get_read_db)):
     return db.query(PortfolioModel).filter(PortfolioModel.user_id == current_user.id).all()
 
+@app.get("/overview", response_model=schemas.Overview)
+async def get_overview(current_user: Principal = Depends(get_current_user), db: AsyncSession = Depends(get_async_read_db)):
+    """Every portfolio of the user with its holdings and SQL-side totals, in three queries"""
+    portfolios = (await db.scalars(
+        select(PortfolioModel)
+        .options(selectinload(PortfolioModel.holdings))
+        .where(PortfolioModel.user_id == current_user.id)
+        .order_by(PortfolioModel.id)
+    )).all()
+    totals = {
+        row.portfolio_id: row for row in await db.execute(
+            select(
+                HoldingModel.portfolio_id,
+                func.count(HoldingModel.id).label("holdings_count"),
+                func.coalesce(func.sum(HoldingModel.market_value), 0.0).label("market_value"),
+                func.coalesce(func.sum(HoldingModel.shares * HoldingModel.average_price), 0.0).label("cost_basis"),
+                func.coalesce(func.sum(HoldingModel.gain_loss), 0.0).label("gain_loss"),
+            )
+            .join(PortfolioModel, PortfolioModel.id == HoldingModel.portfolio_id)
+            .where(PortfolioModel.user_id == current_user.id)
+            .group_by(HoldingModel.portfolio_id)
+        )
+    }
+    
+    summaries = []
+    for portfolio in portfolios:
+        row = totals.get(portfolio.id)
+        cost_basis = row.cost_basis if row else 0.0
+        gain_loss = row.gain_loss if row else 0.0
+        summaries.append({
+            **schemas.Portfolio.model_validate(portfolio).model_dump(),
+            "holdings": portfolio.holdings,
+            "holdings_count": row.holdings_count if row else 0,
+            "market_value": row.market_value if row else 0.0,
+            "cost_basis": cost_basis,
+            "total_gain_loss": gain_loss,
+            "total_gain_loss_percent": gain_loss / cost_basis * 100 if cost_basis > 0 else 0.0,
+        })
+    
+    total_value = sum(s["market_value"] for s in summaries)
+    total_cost = sum(s["cost_basis"] for s in summaries)
+    total_gain_loss = sum(s["total_gain_loss"] for s in summaries)
+    return {
+        "portfolios": summaries,
+        "total_value": total_value,
+        "total_cost": total_cost,
+        "total_gain_loss": total_gain_loss,
+        "total_gain_loss_percent": total_gain_loss / total_cost * 100 if total_cost > 0 else 0.0,
+    }
+
 @app.post("/portfolios", response_model=schemas.Portfolio)
-def create_portfolio(portfolio: schemas.PortfolioCreate, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+def create_portfolio(portfolio: schemas.PortfolioCreate, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     db_portfolio = PortfolioModel(**portfolio.dict(), user_id=current_user.id)
     db.add(db_portfolio)
     db.commit()
@@ -78,42 +212,60 @@ def create_portfolio(portfolio: schemas.PortfolioCreate, current_user: UserModel
     return db_portfolio
 
 @app.get("/portfolios/{portfolio_id}/holdings", response_model=List[schemas.Holding])
-def get_holdings(portfolio_id: int, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+def get_holdings(portfolio_id: int, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_read_db)):
     portfolio = db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == current_user.id).first()
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
     return db.query(HoldingModel).filter(HoldingModel.portfolio_id == portfolio_id).all()
 
 @app.post("/portfolios/{portfolio_id}/holdings", response_model=schemas.Holding)
-def add_holding(portfolio_id: int, holding: schemas.HoldingBase, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+def add_holding(portfolio_id: int, holding: schemas.HoldingBase, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     portfolio = db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == current_user.id).first()
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
     
-    # Get current stock price
-    stock_data = analytics.get_stock_price(holding.symbol)
-    current_price = stock_data['price']
-    
-    db_holding = HoldingModel(
-        **holding.dict(),
-        portfolio_id=portfolio_id,
-        current_price=current_price,
-        market_value=holding.shares * current_price,
-        gain_loss=(current_price - holding.average_price) * holding.shares,
-        gain_loss_percent=((current_price - holding.average_price) / holding.average_price) * 100 if holding.average_price > 0 else 0
-    )
-    db.add(db_holding)
-    db.commit()
-    db.refresh(db_holding)
-    return db_holding
+    # A holding is recorded as a BUY at its average price; the ledger derives the row
+    symbol = holding.symbol.upper()
+    stock_data = analytics.get_stock_price(symbol)
+    prices = {symbol: stock_data['price']} if stock_data['price'] is not None else {}
+    record_transactions(db, portfolio_id, [{
+        "symbol": symbol,
+        "transaction_type": "BUY",
+        "shares": holding.shares,
+        "price": holding.average_price,
+    }], prices, {symbol: holding.company_name})
+    return db.query(HoldingModel).filter(HoldingModel.portfolio_id == portfolio_id, HoldingModel.symbol == symbol).first()
 
 @app.get("/portfolios/{portfolio_id}/analytics")
-def get_portfolio_analytics(portfolio_id: int, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
-    portfolio = db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == current_user.id).first()
-    if not portfolio:
+async def get_portfolio_analytics(portfolio_id: int, request: Request, response: Response,
+                                  current_user: Principal = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    # Read before the holdings, so a price change committed meanwhile yields a new ETag next time
+    epochs = analytics_cache.epochs_snapshot()
+    
+    def load_holdings():
+        portfolio = db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == current_user.id).first()
+        if not portfolio:
+            return None, None
+        version = portfolio.ledger_version
+        holdings = db.query(HoldingModel).filter(HoldingModel.portfolio_id == portfolio_id).all()
+        # Hand the connection back to the pool before waiting on market data
+        db.close()
+        return version, holdings
+    
+    version, holdings = await run_in_threadpool(load_holdings)
+    if holdings is None:
         raise HTTPException(status_code=404, detail="Portfolio not found")
     
-    holdings = db.query(HoldingModel).filter(HoldingModel.portfolio_id == portfolio_id).all()
+    etag = analytics_cache.etag(portfolio_id, version, [h.symbol for h in holdings], epochs) if epochs is not None else None
+    if etag:
+        cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if if_none_match(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=cache_headers)
+        response.headers.update(cache_headers)
+        cached = analytics_cache.get(portfolio_id, etag)
+        if cached is not None:
+            return cached
+    
     holdings_data = [
         {
             "symbol": h.symbol,
@@ -124,77 +276,499 @@ def get_portfolio_analytics(portfolio_id: int, current_user: UserModel = Depends
         for h in holdings
     ]
     
-    metrics = analytics.calculate_portfolio_metrics(holdings_data)
+    # One concurrent fetch for every symbol and the risk benchmark, shared by metrics and risk
+    histories = await analytics.afetch_histories(risk_analyzer.history_symbols(holdings_data), 253)
+    # Stored daily snapshots when there are enough of them; otherwise compute from price history
+    metrics = await run_in_threadpool(snapshot_metrics, db, portfolio_id)
+    assessment = await job_manager.run(current_user.id, job_manager.call(jobs.assess, holdings_data, histories, metrics is None))
     recommendations = analytics.generate_recommendations(holdings_data)
-    risk_assessment = risk_analyzer.assess_portfolio_risk(holdings_data)
     
-    return {
-        "metrics": metrics,
+    result = {
+        "metrics": metrics or assessment["metrics"],
         "recommendations": recommendations,
-        "risk_assessment": risk_assessment,
+        "risk_assessment": assessment["risk_assessment"],
         "total_value": sum(h.market_value for h in holdings),
         "total_gain_loss": sum(h.gain_loss for h in holdings)
     }
+    if etag:
+        if all(df.attrs.get("status") == "ok" for df in histories.values()):
+            analytics_cache.set(portfolio_id, etag, result)
+        else:
+            # Computed from stale or missing bars: serve it, but let the next load recompute
+            del response.headers["ETag"]
+    return result
+
+@app.get("/portfolios/{portfolio_id}/snapshots")
+def get_portfolio_snapshots(portfolio_id: int, days: int = 252, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    portfolio = db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == current_user.id).first()
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    rows = snapshot_series(db, portfolio_id, days)
+    return {
+        "dates": [row.date.isoformat() for row in rows],
+        "total_value": [round(row.total_value, 2) for row in rows],
+        "cost_basis": [round(row.cost_basis, 2) for row in rows],
+        "daily_return": [row.daily_return for row in rows],
+        "drawdown": [round(row.drawdown * 100, 2) for row in rows]
+    }
+
+def portfolio_holdings(db: Session, portfolio_id: int, user_id: int) -> List[HoldingModel]:
+    portfolio = db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == user_id).first()
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    holdings = db.query(HoldingModel).filter(HoldingModel.portfolio_id == portfolio_id).all()
+    # Hand the connection back to the pool before waiting on market data
+    db.close()
+    return holdings
+
+def check_simulation(days: int, paths: int):
+    if not 1 <= days <= MC_MAX_DAYS or not 1 <= paths <= MC_MAX_PATHS:
+        raise HTTPException(status_code=400, detail=f"days must be 1-{MC_MAX_DAYS} and paths 1-{MC_MAX_PATHS}")
+
+def check_optimization(target: str, max_weight: float, points: int):
+    if target not in TARGETS:
+        raise HTTPException(status_code=400, detail=f"target must be one of {', '.join(TARGETS)}")
+    if not 0 < max_weight <= 1 or not 0 <= points <= MAX_FRONTIER_POINTS:
+        raise HTTPException(status_code=400, detail=f"max_weight must be in (0, 1] and points 0-{MAX_FRONTIER_POINTS}")
+
+async def simulation(holdings: List[HoldingModel], days: int, paths: int, seed: Optional[int]) -> Dict:
+    holdings_data = [{"symbol": h.symbol, "market_value": h.market_value} for h in holdings]
+    histories = await analytics.afetch_histories([h['symbol'] for h in holdings_data], MC_LOOKBACK_DAYS + 1)
+    return await job_manager.call(jobs.simulate, holdings_data, days, paths, seed, histories)
+
+async def optimization(portfolio_id: int, holdings: List[HoldingModel], target: str, max_weight: float, points: int) -> Dict:
+    holdings_data = [
+        {
+            "symbol": h.symbol,
+            "shares": h.shares,
+            "current_price": h.current_price,
+            "market_value": h.market_value
+        }
+        for h in holdings
+    ]
+    histories = await analytics.afetch_histories([h['symbol'] for h in holdings_data], OPTIMIZER_LOOKBACK_DAYS + 1)
+    return await job_manager.call(jobs.optimize, portfolio_id, holdings_data, target, max_weight, points, histories)
+
+@app.get("/portfolios/{portfolio_id}/simulate")
+async def simulate_portfolio(portfolio_id: int, days: int = 252, paths: int = 10000, seed: Optional[int] = None,
+                             current_user: Principal = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    check_simulation(days, paths)
+    holdings = await run_in_threadpool(portfolio_holdings, db, portfolio_id, current_user.id)
+    return await job_manager.run(current_user.id, simulation(holdings, days, paths, seed))
+
+@app.get("/portfolios/{portfolio_id}/optimize")
+async def optimize_portfolio(portfolio_id: int, target: str = "max_sharpe", max_weight: float = 1.0, points: int = 50,
+                             current_user: Principal = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    check_optimization(target, max_weight, points)
+    holdings = await run_in_threadpool(portfolio_holdings, db, portfolio_id, current_user.id)
+    return await job_manager.run(current_user.id, optimization(portfolio_id, holdings, target, max_weight, points))
+
+def series_payload(df: pd.DataFrame) -> Dict:
+    """Columnar JSON for a date-indexed frame"""
+    payload = {"dates": [d.strftime('%Y-%m-%d') for d in df.index]}
+    for column in df.columns:
+        payload[column] = [round(float(v), 2) for v in df[column]]
+    return payload
+
+@app.get("/portfolios/{portfolio_id}/backtest")
+async def backtest_portfolio(portfolio_id: int, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    def load_transactions():
+        portfolio = db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == current_user.id).first()
+        if not portfolio:
+            return None
+        transactions = [
+            {
+                "symbol": t.symbol,
+                "transaction_type": t.transaction_type,
+                "shares": t.shares,
+                "price": t.price,
+                "transaction_date": t.transaction_date
+            }
+            for t in db.query(TransactionModel).filter(TransactionModel.portfolio_id == portfolio_id).order_by(TransactionModel.transaction_date)
+        ]
+        db.close()
+        return transactions
+    
+    transactions = await run_in_threadpool(load_transactions)
+    if transactions is None:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    if not transactions:
+        return {"error": "Portfolio has no transactions to replay"}
+    
+    first = pd.Timestamp(transactions[0]['transaction_date']).tz_localize(None).normalize()
+    days = len(pd.bdate_range(first, pd.Timestamp.today())) + 1
+    symbols = list(dict.fromkeys(t['symbol'] for t in transactions))
+    histories = await analytics.afetch_histories(symbols, days)
+    
+    def replay():
+        closes = load_bars(analytics, symbols, days, histories=histories)
+        # Start on the first trading day of the history, or the latest bar if it has not closed yet
+        start = min(closes.index.searchsorted(first), len(closes) - 1)
+        return replay_transactions(transactions, closes.iloc[start:] if not closes.empty else closes)
+    
+    daily = await run_in_threadpool(replay)
+    if daily.empty:
+        return {"error": "No price history available"}
+    return {"series": series_payload(daily), "final": {k: round(float(v), 2) for k, v in daily.iloc[-1].items()}}
+
+@app.post("/backtest")
+async def backtest_strategy(request: schemas.BacktestRequest, current_user: Principal = Depends(get_current_user)):
+    if request.strategy not in STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"strategy must be one of {', '.join(sorted(STRATEGIES))}")
+    if not request.symbols or len(request.symbols) > MAX_BACKTEST_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"Between 1 and {MAX_BACKTEST_SYMBOLS} symbols per backtest")
+    if request.mode not in ("vectorized", "event"):
+        raise HTTPException(status_code=400, detail="mode must be vectorized or event")
+    
+    cost_bps = BACKTEST_COST_BPS if request.cost_bps is None else request.cost_bps
+    histories = None
+    if not (analytics.price_matrix.is_current() and analytics.price_matrix.covers(request.symbols)):
+        histories = await analytics.afetch_histories(request.symbols, request.days)
+    
+    def run():
+        closes = load_bars(analytics, request.symbols, request.days, histories=histories)
+        if closes.empty:
+            return None
+        if request.mode == "event":
+            opens = load_bars(analytics, list(closes.columns), request.days, 'open', histories=histories)
+            signals = STRATEGIES[request.strategy](closes.to_numpy(dtype=float), **request.params)
+            result = EventBacktester(opens, closes, slippage_bps=cost_bps).run(signal_orders(signals))
+        else:
+            result = run_strategy(closes, request.strategy, request.params, cost_bps)
+        result["equity"] = series_payload(result["equity"].to_frame("equity"))
+        result["symbols"] = list(closes.columns)
+        return result
+    
+    try:
+        result = await run_in_threadpool(run)
+    except TypeError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid strategy parameters: {e}")
+    if result is None:
+        return {"error": "No price history available"}
+    return result
+
+@app.post("/portfolios/revalue", response_model=schemas.Revaluation)
+async def revalue_user_portfolios(current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    portfolio_ids = await run_in_threadpool(
+        lambda: [row[0] for row in db.query(PortfolioModel.id).filter(PortfolioModel.user_id == current_user.id)]
+    )
+    return await revalue_portfolios(db, analytics, portfolio_ids)
+
+@app.post("/portfolios/{portfolio_id}/revalue", response_model=schemas.Revaluation)
+async def revalue_portfolio(portfolio_id: int, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    portfolio = await run_in_threadpool(
+        lambda: db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == current_user.id).first()
+    )
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    return await revalue_portfolios(db, analytics, [portfolio_id])
+
+@app.post("/stocks/quotes", response_model=schemas.QuoteBatch)
+async def get_stock_quotes(request: schemas.QuoteBatchRequest, current_user: Principal = Depends(get_current_user)):
+    symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in request.symbols))
+    if len(symbols) > MAX_BATCH_SYMBOLS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SYMBOLS} symbols per request")
+    return {"quotes": await analytics.aget_stock_prices(symbols)}
+
+@app.get("/stream/market")
+async def stream_market(request: Request, token: str):
+    # EventSource cannot send an Authorization header, so the token comes in the query string.
+    # A short-lived session is used so the stream does not pin a pooled connection.
+    def authenticate():
+        db = SessionLocal()
+        try:
+            return get_user_from_token(db, token)
+        finally:
+            db.close()
+    
+    user = await run_in_threadpool(authenticate)
+    queue = market_events.subscribe(user.id)
+    
+    async def events():
+        try:
+            yield f"retry: {STREAM_KEEPALIVE_SECONDS * 1000}\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            market_events.unsubscribe(user.id, queue)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.get("/market-data/cache/stats")
+def get_market_cache_stats(reader: Optional[Principal] = Depends(get_stats_reader)):
+    return analytics.cache.get_stats()
+
+@app.get("/analytics/cache/stats")
+def get_analytics_cache_stats(reader: Optional[Principal] = Depends(get_stats_reader)):
+    return analytics_cache.get_stats()
+
+@app.get("/metrics")
+def get_metrics(reader: Optional[Principal] = Depends(get_stats_reader)):
+    """Prometheus text exposition: latency histograms, counters, and cache, job, auth and pool stats as gauges"""
+    return Response(render_metrics({
+        "market_cache": analytics.cache.get_stats(),
+        "analytics_cache": analytics_cache.get_stats(),
+        "scheduler": analytics.client.scheduler.get_stats(),
+        "jobs": job_manager.get_stats(),
+        "auth": auth_stats(),
+        "db_pool": pool_stats(),
+    }), media_type=PROMETHEUS_MEDIA_TYPE)
+
+@app.get("/market-data/scheduler/stats")
+def get_market_scheduler_stats(reader: Optional[Principal] = Depends(get_stats_reader)):
+    return analytics.client.scheduler.get_stats()
+
+@app.post("/admin/models/train", response_model=schemas.TrainingRun, status_code=202)
+async def start_model_training(request: schemas.TrainingRequest, admin: Principal = Depends(get_current_admin)):
+    run_id = request.run_id or default_run_id()
+    if not RUN_ID_PATTERN.match(run_id):
+        raise HTTPException(status_code=400, detail="Run id may only contain letters, digits, '-' and '_'")
+    if training_active(run_id):
+        raise HTTPException(status_code=409, detail=f"Training run {run_id} is already in progress")
+    symbols = request.symbols or await run_in_threadpool(held_symbols)
+    
+    # train_universe runs its own process pool; the job's thread only waits on it
+    stop = threading.Event()
+    work = asyncio.to_thread(run_training, symbols, request.workers or TRAIN_WORKERS, run_id, request.resume, stop)
+    try:
+        job = training_jobs[run_id] = job_manager.submit(admin.id, "train", work, on_cancel=stop.set)
+    except JobLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return {"running": True, "job_id": job.id, **summarize(run_id, load_run(run_id) if request.resume else [])}
+
+@app.get("/admin/models/train/{run_id}", response_model=schemas.TrainingRun)
+def get_model_training(run_id: str, admin: Principal = Depends(get_current_admin)):
+    if not RUN_ID_PATTERN.match(run_id):
+        raise HTTPException(status_code=404, detail="Training run not found")
+    results = load_run(run_id)
+    if not results and run_id not in training_jobs:
+        raise HTTPException(status_code=404, detail="Training run not found")
+    job = training_jobs.get(run_id)
+    return {"running": training_active(run_id), "job_id": job.id if job else None, **summarize(run_id, results)}
 
 @app.get("/stock/{symbol}/price")
-def get_stock_price(symbol: str):
-    return analytics.get_stock_price(symbol)
+async def get_stock_price(symbol: str):
+    return await analytics.aget_stock_price(symbol)
+
+async def retrain(symbol: str, history):
+    try:
+        result = await job_manager.call(jobs.train, symbol, history)
+        if "error" in result:
+            logger.warning("Retraining model for %s failed: %s", symbol, result["error"])
+    except Exception as e:
+        logger.warning("Error retraining model for %s: %s", symbol, e)
+        count_error("retrain", e)
+    finally:
+        retraining.pop(symbol, None)
+
+async def prediction(symbol: str) -> Dict:
+    symbol = symbol.strip().upper()
+    # Fetched here, under this process's quota; pool workers never call the provider
+    history = await analytics.aget_historical_data(symbol, TRAINING_BARS)
+    result = await job_manager.call(jobs.predict, symbol, history)
+    if result.get("stale") and symbol not in retraining:
+        # The stale model answered this request; its replacement trains in the pool meanwhile
+        retraining[symbol] = asyncio.create_task(retrain(symbol, history))
+    return result
 
 @app.get("/stock/{symbol}/prediction")
-def get_stock_prediction(symbol: str):
-    return predictor.predict_price(symbol)
+async def get_stock_prediction(symbol: str):
+    return await prediction(symbol)
 
 @app.get("/stock/{symbol}/historical")
-def get_historical_data(symbol: str, days: int = 30):
-    data = analytics.get_historical_data(symbol, days)
+async def get_historical_data(symbol: str, response: Response, days: int = 30, start: Optional[date] = None, end: Optional[date] = None,
+                              cursor: Optional[date] = None, limit: int = HISTORY_PAGE_LIMIT, format: str = "records"):
+    if format not in HISTORY_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(HISTORY_FORMATS)}")
+    if not 1 <= limit <= HISTORY_PAGE_LIMIT or days < 1:
+        raise HTTPException(status_code=400, detail=f"limit must be 1-{HISTORY_PAGE_LIMIT} and days positive")
+    
+    # A date range or cursor pages through the full stored series; otherwise the last `days` bars
+    ranged = start is not None or end is not None or cursor is not None
+    data = await analytics.aget_historical_data(symbol, None if ranged else days)
     if data.empty:
-        return {"error": "No data available"}
+        return {"error": "No data available", "status": data.attrs.get("status", "unavailable")}
+    
+    rows, next_cursor = page(data, start, end, cursor, limit)
+    meta = {"symbol": symbol, "status": data.attrs.get("status", "ok"), "next_cursor": next_cursor}
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    if format == "columnar":
+        return Response(content=columnar_json(meta, rows), media_type="application/json", headers=headers)
+    if format == "arrow":
+        return Response(content=arrow_ipc(rows, meta), media_type=ARROW_MEDIA_TYPE, headers=headers)
+    if format == "ndjson":
+        return StreamingResponse(ndjson_lines(rows), media_type=NDJSON_MEDIA_TYPE, headers=headers)
     
+    response.headers.update(headers)
     return {
-        "symbol": symbol,
-        "data": data.reset_index().to_dict('records')
+        **meta,
+        "data": rows.reset_index().to_dict('records')
     }
 
+def record_transactions(db: Session, portfolio_id: int, transactions: List[Dict],
+                        prices: Optional[Dict[str, float]] = None, names: Optional[Dict[str, str]] = None) -> List[int]:
+    try:
+        ids = ledger.record(db, portfolio_id, transactions, prices, names)
+    except LedgerError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LedgerConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    analytics_cache.invalidate(portfolio_id)
+    return ids
+
 @app.post("/portfolios/{portfolio_id}/transactions", response_model=schemas.Transaction)
-def add_transaction(portfolio_id: int, transaction: schemas.TransactionBase, current_user: UserModel = Depends(get_current_user), db: Session = Depends(get_db)):
+def add_transaction(portfolio_id: int, transaction: schemas.TransactionBase, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
     portfolio = db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == current_user.id).first()
     if not portfolio:
         raise HTTPException(status_code=404, detail="Portfolio not found")
     
-    total_amount = transaction.shares * transaction.price
-    db_transaction = TransactionModel(
-        **transaction.dict(),
-        portfolio_id=portfolio_id,
-        total_amount=total_amount
-    )
-    db.add(db_transaction)
-    
-    # Update or create holding
-    holding = db.query(HoldingModel).filter(
-        HoldingModel.portfolio_id == portfolio_id,
-        HoldingModel.symbol == transaction.symbol
-    ).first()
-    
-    if holding:
-        if transaction.transaction_type == "BUY":
-            total_cost = (holding.shares * holding.average_price) + total_amount
-            holding.shares += transaction.shares
-            holding.average_price = total_cost / holding.shares
-        elif transaction.transaction_type == "SELL":
-            holding.shares -= transaction.shares
-            if holding.shares <= 0:
-                db.delete(holding)
-        
-        # Update current price and market value
-        stock_data = analytics.get_stock_price(transaction.symbol)
-        holding.current_price = stock_data['price']
-        holding.market_value = holding.shares * holding.current_price
-        holding.gain_loss = (holding.current_price - holding.average_price) * holding.shares
-        holding.gain_loss_percent = ((holding.current_price - holding.average_price) / holding.average_price) * 100 if holding.average_price > 0 else 0
+    symbol = transaction.symbol.upper()
+    stock_data = analytics.get_stock_price(symbol)
+    prices = {symbol: stock_data['price']} if stock_data['price'] is not None else {}
+    transaction_id, = record_transactions(db, portfolio_id, [transaction.dict()], prices)
+    return db.get(TransactionModel, transaction_id)
+
+@app.post("/portfolios/{portfolio_id}/transactions/bulk", response_model=schemas.TransactionBatchResult)
+def add_transactions(portfolio_id: int, batch: schemas.TransactionBatch, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    portfolio = db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == current_user.id).first()
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    if len(batch.transactions) > MAX_TRANSACTION_BATCH:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_TRANSACTION_BATCH} transactions per batch")
     
-    db.commit()
-    db.refresh(db_transaction)
-    return db_transaction
+    # No quote lookups here: holdings keep their stored price until the next revaluation
+    ids = record_transactions(db, portfolio_id, [t.dict() for t in batch.transactions])
+    return {"recorded": len(ids), "transaction_ids": ids}
+
+@app.post("/portfolios/{portfolio_id}/import")
+def import_portfolio_transactions(portfolio_id: int, file: UploadFile = File(...), format: Optional[str] = None, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    portfolio = db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == current_user.id).first()
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    if format is not None and format not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(IMPORT_FORMATS)}")
+    
+    # The upload is spooled to disk by Starlette and read back in chunks
+    try:
+        summary = import_transactions(db, portfolio_id, file.file, format or detect_format(file.filename), ledger=ledger)
+    except LedgerConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if "error" in summary:
+        raise HTTPException(status_code=400, detail=summary)
+    analytics_cache.invalidate(portfolio_id)
+    return summary
+
+@app.get("/portfolios/{portfolio_id}/lots")
+def get_lots(portfolio_id: int, method: Optional[str] = None, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    if method is not None and method not in COST_METHODS:
+        raise HTTPException(status_code=400, detail=f"method must be one of {', '.join(COST_METHODS)}")
+    portfolio = db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == current_user.id).first()
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    
+    positions = ledger.positions(db, portfolio_id, method)
+    return {
+        "cost_method": method or portfolio.cost_method,
+        "positions": [
+            {
+                "symbol": symbol,
+                "shares": round(position.shares, 6),
+                "average_price": round(position.average_price, 4),
+                "realized_gain": round(position.realized_gain, 2),
+                "lots": [
+                    {
+                        "shares": round(lot.shares, 6),
+                        "price": round(lot.price, 4),
+                        "opened": lot.opened,
+                        "transaction_id": lot.transaction_id,
+                    }
+                    for lot in position.lots
+                ],
+            }
+            for symbol, position in sorted(positions.items())
+        ],
+    }
+
+@app.post("/portfolios/{portfolio_id}/rebuild", response_model=schemas.Portfolio)
+def rebuild_portfolio(portfolio_id: int, cost_method: Optional[str] = None, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_db)):
+    portfolio = db.query(PortfolioModel).filter(PortfolioModel.id == portfolio_id, PortfolioModel.user_id == current_user.id).first()
+    if not portfolio:
+        raise HTTPException(status_code=404, detail="Portfolio not found")
+    
+    try:
+        ledger.rebuild(db, portfolio_id, cost_method)
+    except LedgerError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LedgerConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    analytics_cache.invalidate(portfolio_id)
+    db.refresh(portfolio)
+    return portfolio
+
+# Background jobs for CPU-heavy work
+@app.post("/jobs", response_model=schemas.Job, status_code=202)
+async def submit_job(request: schemas.JobRequest, current_user: Principal = Depends(get_current_user), db: Session = Depends(get_read_db)):
+    if request.kind == "predict":
+        if not request.symbol:
+            raise HTTPException(status_code=400, detail="symbol is required")
+        work = prediction(request.symbol)
+    else:
+        if request.portfolio_id is None:
+            raise HTTPException(status_code=400, detail="portfolio_id is required")
+        if request.kind == "simulate":
+            check_simulation(request.days, request.paths)
+        else:
+            check_optimization(request.target, request.max_weight, request.points)
+        holdings = await run_in_threadpool(portfolio_holdings, db, request.portfolio_id, current_user.id)
+        if request.kind == "simulate":
+            work = simulation(holdings, request.days, request.paths, request.seed)
+        else:
+            work = optimization(request.portfolio_id, holdings, request.target, request.max_weight, request.points)
+    
+    try:
+        return job_manager.submit(current_user.id, request.kind, work).as_dict()
+    except JobLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+@app.get("/jobs", response_model=List[schemas.Job])
+def list_jobs(current_user: Principal = Depends(get_current_user)):
+    return [job.as_dict() for job in job_manager.list(current_user.id)]
+
+@app.get("/jobs/stats")
+def get_job_stats(reader: Optional[Principal] = Depends(get_stats_reader)):
+    return job_manager.get_stats()
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+def get_job(job_id: str, current_user: Principal = Depends(get_current_user)):
+    job = job_manager.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.as_dict()
+
+@app.get("/jobs/{job_id}/result")
+def get_job_result(job_id: str, current_user: Principal = Depends(get_current_user)):
+    job = job_manager.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.active:
+        return Response(status_code=202, content=json.dumps(job.as_dict()), media_type="application/json")
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job {job.status}" + (f": {job.error}" if job.error else ""))
+    return job.result
+
+@app.delete("/jobs/{job_id}", response_model=schemas.Job)
+async def cancel_job(job_id: str, current_user: Principal = Depends(get_current_user)):
+    job = job_manager.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job_manager.cancel(job):
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return job.as_dict()
 
 @app.get("/")
 def read_root():
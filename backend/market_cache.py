@@ -0,0 +1,306 @@
+import os
+import logging
+import asyncio
+import pickle
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+from instrumentation import count_error
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MARKET_CACHE_BACKEND = os.getenv("MARKET_CACHE_BACKEND", "memory")  # memory, file, db
+MARKET_CACHE_DIR = os.getenv("MARKET_CACHE_DIR", ".market_cache")
+MARKET_CACHE_MAX_ENTRIES = int(os.getenv("MARKET_CACHE_MAX_ENTRIES", "2048"))
+QUOTE_TTL_SECONDS = int(os.getenv("QUOTE_CACHE_TTL", "60"))
+
+# US markets close at 16:00 New York time, roughly 21:00 UTC
+MARKET_CLOSE_UTC_HOUR = 21
+
+
+def seconds_until_market_close(now: Optional[datetime] = None) -> float:
+    """Seconds until the next daily close, when new end-of-day bars appear"""
+    now = now or datetime.now(timezone.utc)
+    close = now.replace(hour=MARKET_CLOSE_UTC_HOUR, minute=0, second=0, microsecond=0)
+    if close <= now:
+        close += timedelta(days=1)
+    return (close - now).total_seconds()
+
+
+DEFAULT_TTLS: Dict[str, Callable[[], float]] = {
+    "quote": lambda: QUOTE_TTL_SECONDS,
+    "daily": seconds_until_market_close,
+}
+
+
+class CacheStats:
+    """Lookup counters; updated from request threads and the event loop, so always through record()"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.persistent_hits = 0
+        self._lock = threading.Lock()
+
+    def record(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def as_dict(self) -> Dict:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+            counts = {"hits": hits, "misses": misses, "evictions": self.evictions,
+                      "expirations": self.expirations, "persistent_hits": self.persistent_hits}
+        lookups = hits + misses
+        return {**counts, "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with a per-entry expiry time"""
+
+    def __init__(self, max_entries: int = MARKET_CACHE_MAX_ENTRIES, stats: Optional[CacheStats] = None):
+        self.max_entries = max_entries
+        self.stats = stats or CacheStats()
+        self._entries: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, allow_stale: bool = False) -> Tuple[bool, Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires_at, value = entry
+            if expires_at < time.time() and not allow_stale:
+                # Kept for get(allow_stale=True) until replaced or evicted
+                self.stats.record("expirations")
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value, expires_at: float):
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.record("evictions")
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __contains__(self, key) -> bool:
+        """Whether key has an entry, expired or not"""
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileStore:
+    """Persistent tier that pickles entries into a local directory"""
+
+    def __init__(self, directory: str = MARKET_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, kind: str, key) -> str:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, f"{kind}-{digest}.pkl")
+
+    def get(self, kind: str, key) -> Optional[Tuple[float, Any]]:
+        try:
+            with open(self._path(kind, key), "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def set(self, kind: str, key, value, expires_at: float):
+        path = self._path(kind, key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump((expires_at, value), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+
+class MarketDataTableStore:
+    """Persistent tier for quotes backed by the MarketData table"""
+
+    def __init__(self, session_factory=None):
+        if session_factory is None:
+            from database import SessionLocal
+            session_factory = SessionLocal
+        self.session_factory = session_factory
+
+    def get(self, kind: str, key) -> Optional[Tuple[float, Any]]:
+        if kind != "quote":
+            return None
+        from models import MarketData
+
+        db = self.session_factory()
+        try:
+            row = db.query(MarketData).filter(MarketData.symbol == key).order_by(MarketData.timestamp.desc()).first()
+        finally:
+            db.close()
+        if row is None or row.timestamp is None:
+            return None
+
+        timestamp = row.timestamp
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+        pct = row.change_percent or 0.0
+        change = row.price * pct / (100 + pct) if pct != -100 else 0.0
+        expires_at = timestamp.timestamp() + QUOTE_TTL_SECONDS
+        return expires_at, {
+            "symbol": row.symbol,
+            "price": row.price,
+            "change": round(change, 4),
+            "change_percent": str(pct),
+        }
+
+    def set(self, kind: str, key, value, expires_at: float):
+        if kind != "quote":
+            return
+        from models import MarketData
+
+        db = self.session_factory()
+        try:
+            db.add(MarketData(
+                symbol=key,
+                price=value["price"],
+                volume=value.get("volume"),
+                change_percent=float(value.get("change_percent") or 0),
+                timestamp=datetime.now(timezone.utc),
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+
+class MarketDataCache:
+    """Two-tier cache: in-process LRU in front of an optional persistent store"""
+
+    def __init__(self, max_entries: int = MARKET_CACHE_MAX_ENTRIES, persistent=None, ttls: Optional[Dict] = None):
+        self.stats = CacheStats()
+        self.memory = LRUCache(max_entries, self.stats)
+        self.persistent = persistent
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+
+    def _expiry(self, kind: str) -> float:
+        ttl = self.ttls.get(kind, DEFAULT_TTLS["quote"])
+        return time.time() + (ttl() if callable(ttl) else ttl)
+
+    def get(self, kind: str, key) -> Tuple[bool, Any]:
+        found, value = self.memory.get((kind, key))
+        if found:
+            self.stats.record("hits")
+            return True, value
+
+        if self.persistent is not None:
+            try:
+                entry = self.persistent.get(kind, key)
+            except Exception as e:
+                logger.warning("Error reading persistent cache for %s:%s: %s", kind, key, e)
+                count_error("market_cache", e)
+                entry = None
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at >= time.time():
+                    self.memory.set((kind, key), value, expires_at)
+                    self.stats.record("hits")
+                    self.stats.record("persistent_hits")
+                    return True, value
+                if (kind, key) not in self.memory:
+                    # Otherwise the memory tier already counted this entry's expiry
+                    self.stats.record("expirations")
+
+        self.stats.record("misses")
+        return False, None
+
+    def set(self, kind: str, key, value):
+        expires_at = self._expiry(kind)
+        self.memory.set((kind, key), value, expires_at)
+        if self.persistent is not None:
+            try:
+                self.persistent.set(kind, key, value, expires_at)
+            except Exception as e:
+                logger.warning("Error writing persistent cache for %s:%s: %s", kind, key, e)
+                count_error("market_cache", e)
+
+    def get_stale(self, kind: str, key) -> Tuple[bool, Any]:
+        """Last known value regardless of expiry, for answering while upstream is limited"""
+        found, value = self.memory.get((kind, key), allow_stale=True)
+        if found or self.persistent is None:
+            return found, value
+        try:
+            entry = self.persistent.get(kind, key)
+        except Exception as e:
+            logger.warning("Error reading persistent cache for %s:%s: %s", kind, key, e)
+            count_error("market_cache", e)
+            entry = None
+        return (True, entry[1]) if entry is not None else (False, None)
+
+    def get_or_fetch(self, kind: str, key, fetch: Callable[[], Any], cacheable: Optional[Callable[[Any], bool]] = None):
+        """Return the cached value or call fetch; None results are not cached"""
+        found, value = self.get(kind, key)
+        if found:
+            return value
+        value = fetch()
+        if value is not None and (cacheable is None or cacheable(value)):
+            self.set(kind, key, value)
+        return value
+
+    async def aget_or_fetch(self, kind: str, key, fetch: Callable[[], Awaitable[Any]],
+                            cacheable: Optional[Callable[[Any], bool]] = None):
+        """Async get_or_fetch; persistent tier I/O runs in a worker thread"""
+        if self.persistent is None:
+            found, value = self.get(kind, key)
+        else:
+            found, value = await asyncio.to_thread(self.get, kind, key)
+        if found:
+            return value
+        value = await fetch()
+        if value is not None and (cacheable is None or cacheable(value)):
+            if self.persistent is None:
+                self.set(kind, key, value)
+            else:
+                await asyncio.to_thread(self.set, kind, key, value)
+        return value
+
+    def invalidate(self, kind: str, key):
+        self.memory.delete((kind, key))
+
+    def get_stats(self) -> Dict:
+        stats = self.stats.as_dict()
+        stats["entries"] = len(self.memory)
+        stats["backend"] = type(self.persistent).__name__ if self.persistent is not None else "memory"
+        return stats
+
+
+def build_default_cache() -> MarketDataCache:
+    persistent = None
+    if MARKET_CACHE_BACKEND == "file":
+        persistent = FileStore(MARKET_CACHE_DIR)
+    elif MARKET_CACHE_BACKEND == "db":
+        persistent = MarketDataTableStore()
+    return MarketDataCache(persistent=persistent)
+
+
+# Shared by every PortfolioAnalytics instance in the process
+default_cache = build_default_cache()
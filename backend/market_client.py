@@ -0,0 +1,116 @@
+import os
+import asyncio
+import threading
+import httpx
+import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from typing import Dict, Optional, Tuple
+from dotenv import load_dotenv
+
+from instrumentation import count_upstream, span
+from request_scheduler import Priority, RateLimited, RequestScheduler, default_scheduler
+
+load_dotenv()
+
+ALPHA_VANTAGE_URL = os.getenv("ALPHA_VANTAGE_URL", "https://www.alphavantage.co/query")
+MARKET_HTTP_TIMEOUT = float(os.getenv("MARKET_HTTP_TIMEOUT", "10"))
+MARKET_HTTP_MAX_CONNECTIONS = int(os.getenv("MARKET_HTTP_MAX_CONNECTIONS", "20"))
+MARKET_HTTP_CONCURRENCY = int(os.getenv("MARKET_HTTP_CONCURRENCY", "8"))
+
+
+class MarketDataClient:
+    """Pooled HTTP client for the market data provider, async with a sync fallback"""
+
+    def __init__(self, api_key: Optional[str], base_url: str = ALPHA_VANTAGE_URL,
+                 timeout: float = MARKET_HTTP_TIMEOUT, max_connections: int = MARKET_HTTP_MAX_CONNECTIONS,
+                 concurrency: int = MARKET_HTTP_CONCURRENCY, scheduler: Optional[RequestScheduler] = None):
+        self.api_key = api_key
+        self.scheduler = scheduler or default_scheduler
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.concurrency = concurrency
+        # One async client and semaphore per event loop; both are bound to the loop that created them
+        self._clients: Dict[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, asyncio.Semaphore]] = {}
+        self._clients_lock = threading.Lock()
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    def _async_client(self) -> Tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            entry = self._clients.get(loop)
+            if entry is None:
+                # A closed loop's connections went with it and its client can no longer be awaited
+                for closed in [other for other in self._clients if other.is_closed()]:
+                    del self._clients[closed]
+                client = httpx.AsyncClient(
+                    timeout=self.timeout,
+                    limits=httpx.Limits(max_connections=self.max_connections,
+                                        max_keepalive_connections=self.max_connections),
+                )
+                entry = self._clients[loop] = (client, asyncio.Semaphore(self.concurrency))
+        return entry
+
+    async def query(self, params: Dict, priority: Priority = Priority.INTERACTIVE) -> Dict:
+        """Send one provider query, bounded by the client's concurrency limit and the quota"""
+        client, semaphore = self._async_client()
+        # Queue for quota first so priority, not semaphore order, decides who goes next
+        with span("upstream_wait"):
+            await self.scheduler.aacquire(priority)
+        async with semaphore:
+            with self._counted(params), span("upstream_http"):
+                response = await client.get(self.base_url, params={**params, "apikey": self.api_key})
+                response.raise_for_status()
+                return self._check_quota(response.json())
+
+    def query_sync(self, params: Dict, priority: Priority = Priority.INTERACTIVE) -> Dict:
+        with span("upstream_wait"):
+            self.scheduler.acquire(priority)
+        with self._counted(params), span("upstream_http"):
+            response = self._session.get(self.base_url, params={**params, "apikey": self.api_key}, timeout=self.timeout)
+            response.raise_for_status()
+            return self._check_quota(response.json())
+
+    @staticmethod
+    @contextmanager
+    def _counted(params: Dict):
+        """Count a provider request by function and outcome"""
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        except RateLimited:
+            outcome = "rate_limited"
+            raise
+        finally:
+            count_upstream(params.get("function"), outcome)
+
+    def _check_quota(self, data: Dict) -> Dict:
+        # Quota rejections come back as HTTP 200 with only a "Note" or "Information" message
+        message = data.get("Note") or data.get("Information")
+        if message and len(data) == 1:
+            self.scheduler.report_quota_exceeded()
+            raise RateLimited(message)
+        return data
+
+    async def aclose(self):
+        """Close the async clients of every loop; those of other running loops are closed on their own loop"""
+        current = asyncio.get_running_loop()
+        with self._clients_lock:
+            clients, self._clients = self._clients, {}
+        for loop, (client, _) in clients.items():
+            if loop is current:
+                await client.aclose()
+            elif not loop.is_closed():
+                try:
+                    asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+                except RuntimeError:
+                    pass  # closed in the meantime
+
+    def close(self):
+        self._session.close()
@@ -0,0 +1,245 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Set
+from sqlalchemy import select
+from dotenv import load_dotenv
+
+from database import SessionLocal
+from models import Holding, Portfolio
+from bar_store import last_trading_day
+from instrumentation import count_error, errors
+from market_cache import MARKET_CACHE_DIR, MARKET_CLOSE_UTC_HOUR, QUOTE_TTL_SECONDS
+from portfolio_analytics import PortfolioAnalytics
+from request_scheduler import ALPHA_VANTAGE_CALLS_PER_DAY, ALPHA_VANTAGE_CALLS_PER_MINUTE, Priority
+from revaluation import apply_prices, holding_symbols
+from snapshots import take_snapshots
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks, assume a single process
+    fcntl = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Off by default: every refresh spends provider quota that interactive requests also need
+MARKET_REFRESH_ENABLED = os.getenv("MARKET_REFRESH_ENABLED", "false").lower() == "true"
+# Fraction of the provider budget the refresher may spend on quotes
+QUOTE_REFRESH_SHARE = float(os.getenv("QUOTE_REFRESH_SHARE", "0.5"))
+# Lower bound on the quote refresh interval; the budget usually asks for a longer one
+QUOTE_REFRESH_SECONDS = float(os.getenv("QUOTE_REFRESH_SECONDS", str(max(QUOTE_TTL_SECONDS, 60))))
+# Only the process holding this lock refreshes, so uvicorn workers do not each spend the quota
+MARKET_REFRESH_LOCK_FILE = os.getenv("MARKET_REFRESH_LOCK_FILE", os.path.join(MARKET_CACHE_DIR, "refresher.lock"))
+# Regular session opens 13:30 or 14:30 UTC depending on daylight saving
+MARKET_OPEN_UTC_HOUR = 13
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+def quote_refresh_interval(symbol_count: int) -> float:
+    """Seconds between refreshes of symbol_count quotes that keep within QUOTE_REFRESH_SHARE of the quota"""
+    interval = QUOTE_REFRESH_SECONDS
+    if ALPHA_VANTAGE_CALLS_PER_MINUTE > 0:
+        interval = max(interval, symbol_count * 60 / (ALPHA_VANTAGE_CALLS_PER_MINUTE * QUOTE_REFRESH_SHARE))
+    if ALPHA_VANTAGE_CALLS_PER_DAY > 0:
+        interval = max(interval, symbol_count * 86400 / (ALPHA_VANTAGE_CALLS_PER_DAY * QUOTE_REFRESH_SHARE))
+    return interval
+
+
+def market_open(now: datetime) -> bool:
+    return now.weekday() < 5 and MARKET_OPEN_UTC_HOUR <= now.hour < MARKET_CLOSE_UTC_HOUR
+
+
+def last_close(now: datetime) -> datetime:
+    return datetime.combine(last_trading_day(now), datetime.min.time(), timezone.utc).replace(hour=MARKET_CLOSE_UTC_HOUR)
+
+
+class RefreshLock:
+    """Non-blocking exclusive file lock, held until release or process exit"""
+
+    def __init__(self, path: str = MARKET_REFRESH_LOCK_FILE):
+        self.path = path
+        self._file = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        if fcntl is None or self._file is not None:
+            return True
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        f = open(self.path, "a")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class MarketEventBroker:
+    """In-process fan-out of price and portfolio events to streaming clients"""
+
+    def __init__(self):
+        self._subscribers: Dict[int, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, user_id: int) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: int, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def publish(self, event: Dict, user_ids: Optional[Set[int]] = None):
+        """Send to the given users, or to everyone connected when user_ids is None"""
+        targets = self._subscribers.keys() if user_ids is None else user_ids & self._subscribers.keys()
+        for user_id in list(targets):
+            for queue in self._subscribers.get(user_id, ()):
+                if queue.full():
+                    # A slow client loses its oldest update rather than stalling the refresher
+                    queue.get_nowait()
+                queue.put_nowait(event)
+
+    @property
+    def subscriber_count(self) -> int:
+        return sum(len(queues) for queues in self._subscribers.values())
+
+
+class MarketDataRefresher:
+    """Keeps quotes and daily bars current for every held symbol off the request path"""
+
+    def __init__(self, analytics: PortfolioAnalytics, broker: MarketEventBroker, session_factory=None, lock: Optional[RefreshLock] = None):
+        self.analytics = analytics
+        self.broker = broker
+        self.session_factory = session_factory or SessionLocal
+        self.lock = lock or RefreshLock()
+        self.interval = QUOTE_REFRESH_SECONDS
+        self._task: Optional[asyncio.Task] = None
+        self._last_prices: Dict[str, float] = {}
+        self._quoted_at: Dict[str, float] = {}
+        self._bars_as_of: Optional[date] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.lock.release()
+
+    async def _run(self):
+        while True:
+            # Retried every cycle, so another worker takes over when the lock holder exits
+            if self.lock.acquire():
+                try:
+                    await self.refresh_once()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("Error refreshing market data: %s", e)
+                    count_error("market_refresh", e)
+            await asyncio.sleep(self.interval)
+
+    async def refresh_once(self):
+        symbols = await asyncio.to_thread(self._query, holding_symbols)
+        if not symbols:
+            return
+        self.interval = quote_refresh_interval(len(symbols))
+        await self.refresh_quotes(self.stale_symbols(symbols))
+        if self._bars_as_of is None or self._bars_as_of < last_trading_day():
+            await self.refresh_bars(symbols)
+
+    def stale_symbols(self, symbols: List[str], now: Optional[float] = None) -> List[str]:
+        """Symbols whose quote may have moved since this refresher last fetched it"""
+        now = time.time() if now is None else now
+        moment = datetime.fromtimestamp(now, timezone.utc)
+        if market_open(moment):
+            # Refresh a little early so scheduling jitter does not skip a whole cycle
+            cutoff = now - self.interval * 0.9
+        else:
+            # Quotes do not change while the market is closed, so one after the last close is enough
+            cutoff = last_close(moment).timestamp()
+        return [symbol for symbol in symbols if self._quoted_at.get(symbol, 0.0) <= cutoff]
+
+    async def refresh_quotes(self, symbols: List[str]):
+        if not symbols:
+            return
+        quotes = await self.analytics.aget_stock_prices(symbols, Priority.BACKGROUND)
+        now = time.time()
+        self._quoted_at.update((symbol, now) for symbol, quote in quotes.items() if quote['status'] == "ok")
+        changed = {
+            symbol: quote for symbol, quote in quotes.items()
+            if quote['status'] == "ok" and quote['price'] != self._last_prices.get(symbol)
+        }
+        if not changed:
+            return
+
+        prices = {symbol: quote['price'] for symbol, quote in changed.items()}
+        self._last_prices.update(prices)
+        await asyncio.to_thread(self._query, apply_prices, prices)
+
+        for symbol, quote in changed.items():
+            self.broker.publish({
+                "type": "price",
+                "symbol": symbol,
+                "price": quote['price'],
+                "change": quote['change'],
+                "change_percent": quote['change_percent'],
+            })
+        for portfolio_id, user_id, total_value in await asyncio.to_thread(self._query, self._portfolio_totals, list(prices)):
+            self.broker.publish({
+                "type": "portfolio",
+                "portfolio_id": portfolio_id,
+                "total_value": total_value,
+            }, {user_id})
+
+    async def refresh_bars(self, symbols: List[str]):
+        histories = await self.analytics.afetch_histories(symbols, 1, Priority.BACKGROUND)
+        failed = {symbol: df.attrs.get("status") for symbol, df in histories.items() if df.attrs.get("status") != "ok"}
+        if failed:
+            # A delisted or unknown symbol must not hold back the rest; the rebuild leaves it out
+            logger.warning("Daily bars not current for %s", ", ".join(f"{s} ({status})" for s, status in sorted(failed.items())))
+            for status in failed.values():
+                errors.inc("market_refresh", f"bars_{status}")
+        written = await asyncio.to_thread(self.analytics.price_matrix.rebuild, self.analytics, symbols)
+        # Record each portfolio's daily snapshot even if some closes are missing; those
+        # holdings are valued at their current price, and a later cycle rewrites the day
+        await asyncio.to_thread(self._query, take_snapshots)
+        if written:
+            self._bars_as_of = last_trading_day()
+
+    def _query(self, fn, *args):
+        db = self.session_factory()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _portfolio_totals(db, symbols: List[str]):
+        held = select(Holding.portfolio_id).where(Holding.symbol.in_(symbols))
+        return db.execute(
+            select(Portfolio.id, Portfolio.user_id, Portfolio.total_value).where(Portfolio.id.in_(held))
+        ).all()
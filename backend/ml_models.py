@@ -4,49 +4,38 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import StandardScaler
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
-import joblib
-from typing import Dict, List, Tuple
+import time
+from typing import Dict, List, Optional, Tuple
 from portfolio_analytics import PortfolioAnalytics
+from request_scheduler import Priority
+from model_registry import MODEL_VERSION, ModelArtifact, ModelRegistry, default_registry
+from indicators import FEATURE_COLUMNS, IndicatorBook, feature_frame
+from risk_engine import RiskEngine
+from instrumentation import span
+
+# Bars a model is trained on, and the recent bars a prediction is made from
+TRAINING_BARS = 500
+PREDICTION_BARS = 100
+
 
 class StockPredictor:
-    def __init__(self):
-        self.model = RandomForestRegressor(n_estimators=100, random_state=42)
-        self.scaler = StandardScaler()
-        self.analytics = PortfolioAnalytics()
+    def __init__(self, analytics: Optional[PortfolioAnalytics] = None, registry: Optional[ModelRegistry] = None):
+        self.analytics = analytics or PortfolioAnalytics()
+        self.registry = registry or default_registry
+        self.indicators = IndicatorBook()
         
+    @span("feature_prep")
     def prepare_features(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Prepare technical indicators as features"""
-        # Moving averages
-        df['ma_5'] = df['close'].rolling(window=5).mean()
-        df['ma_10'] = df['close'].rolling(window=10).mean()
-        df['ma_20'] = df['close'].rolling(window=20).mean()
-        
-        # RSI
-        delta = df['close'].diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        df['rsi'] = 100 - (100 / (1 + rs))
-        
-        # Bollinger Bands
-        df['bb_upper'] = df['ma_20'] + (df['close'].rolling(window=20).std() * 2)
-        df['bb_lower'] = df['ma_20'] - (df['close'].rolling(window=20).std() * 2)
-        df['bb_width'] = df['bb_upper'] - df['bb_lower']
-        
-        # Volume indicators
-        df['volume_ma'] = df['volume'].rolling(window=10).mean()
-        df['volume_ratio'] = df['volume'] / df['volume_ma']
-        
-        # Price ratios
-        df['high_low_ratio'] = df['high'] / df['low']
-        df['close_open_ratio'] = df['close'] / df['open']
-        
-        return df
+        """Prepare technical indicators as features (returns a new frame)"""
+        return feature_frame(df)
     
-    def train_model(self, symbol: str) -> Dict:
-        """Train prediction model for a specific stock"""
+    def train_model(self, symbol: str, priority: Priority = Priority.BATCH, n_jobs: Optional[int] = None,
+                    history: Optional[pd.DataFrame] = None) -> Dict:
+        """Train prediction model for a specific stock and store it in the registry.
+        
+        history may hold bars already fetched by the caller."""
         # Get historical data
-        df = self.analytics.get_historical_data(symbol, 500)  # 2 years
+        df = history.tail(TRAINING_BARS) if history is not None else self.analytics.get_historical_data(symbol, TRAINING_BARS, priority)  # 2 years
         
         if df.empty or len(df) < 50:
             return {"error": "Insufficient data for training"}
@@ -57,80 +46,99 @@ class StockPredictor:
         
         if len(df) < 30:
             return {"error": "Insufficient data after feature preparation"}
+        last_bar = df.index[-1].date()
         
         # Prepare target (next day's closing price)
         df['target'] = df['close'].shift(-1)
         df = df.dropna()
         
-        # Select features
-        feature_columns = ['ma_5', 'ma_10', 'ma_20', 'rsi', 'bb_width', 
-                          'volume_ratio', 'high_low_ratio', 'close_open_ratio']
-        
-        X = df[feature_columns]
+        X = df[FEATURE_COLUMNS]
         y = df['target']
         
         # Split data
         X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
         
-        # Scale features
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        X_test_scaled = self.scaler.transform(X_test)
-        
-        # Train model
-        self.model.fit(X_train_scaled, y_train)
+        # Fresh estimators per call, so concurrent trainings never share fitted state
+        scaler = StandardScaler()
+        model = RandomForestRegressor(n_estimators=100, random_state=42, n_jobs=n_jobs)
         
-        # Predictions
-        y_pred = self.model.predict(X_test_scaled)
+        with span("model_fit"):
+            # Scale features
+            X_train_scaled = scaler.fit_transform(X_train)
+            X_test_scaled = scaler.transform(X_test)
+            
+            # Train model
+            model.fit(X_train_scaled, y_train)
+            
+            # Predictions
+            y_pred = model.predict(X_test_scaled)
         
         # Metrics
         mse = mean_squared_error(y_test, y_pred)
         r2 = r2_score(y_test, y_pred)
-        
-        return {
+        metrics = {
             "mse": round(mse, 4),
             "r2": round(r2, 4),
             "accuracy": round(r2 * 100, 2)
         }
+        
+        self.registry.save(symbol, ModelArtifact(scaler, model, {
+            "version": MODEL_VERSION,
+            "symbol": symbol,
+            "trained_at": time.time(),
+            "window_start": df.index[0].date().isoformat(),
+            "window_end": df.index[-1].date().isoformat(),
+            "last_bar": last_bar.isoformat(),
+            "samples": len(df),
+            "metrics": metrics,
+        }))
+        return metrics
+    
+    def refresh_model(self, symbol: str, priority: Priority = Priority.BATCH, history: Optional[pd.DataFrame] = None) -> Dict:
+        """Retrain symbol's model unless another worker or process already brought it up to date"""
+        latest_bar = history.index[-1].date() if history is not None and not history.empty else None
+        with self.registry.training_lock(symbol):
+            artifact = self.registry.reload(symbol)
+            if artifact is not None and not artifact.is_stale(latest_bar):
+                return artifact.metadata["metrics"]
+            return self.train_model(symbol, priority, history=history)
     
-    def predict_price(self, symbol: str, days_ahead: int = 1) -> Dict:
-        """Predict future price for a stock"""
+    def predict_price(self, symbol: str, days_ahead: int = 1, history: Optional[pd.DataFrame] = None) -> Dict:
+        """Predict future price for a stock using its registered model.
+        
+        history may hold at least TRAINING_BARS bars already fetched by the
+        caller, so a retrain needs no provider calls either."""
         try:
             # Get recent data
-            df = self.analytics.get_historical_data(symbol, 100)
+            df = history.tail(PREDICTION_BARS) if history is not None else self.analytics.get_historical_data(symbol, PREDICTION_BARS)
             
             if df.empty:
                 return {"error": "No data available"}
             
-            # Prepare features
-            df = self.prepare_features(df)
-            df = df.dropna()
-            
-            if df.empty:
+            # Only bars newer than the last prediction are folded into the indicators
+            with span("feature_prep"):
+                features = self.indicators.advance(symbol, df).row()
+            if features.isna().any(axis=None):
                 return {"error": "Insufficient data for prediction"}
             
-            # Get latest features
-            feature_columns = ['ma_5', 'ma_10', 'ma_20', 'rsi', 'bb_width', 
-                              'volume_ratio', 'high_low_ratio', 'close_open_ratio']
-            
-            latest_features = df[feature_columns].iloc[-1:].values
-            
-            # Quick train on recent data
-            df_train = df.copy()
-            df_train['target'] = df_train['close'].shift(-1)
-            df_train = df_train.dropna()
-            
-            if len(df_train) < 20:
-                return {"error": "Insufficient training data"}
-            
-            X_train = df_train[feature_columns]
-            y_train = df_train['target']
-            
-            X_train_scaled = self.scaler.fit_transform(X_train)
-            self.model.fit(X_train_scaled, y_train)
+            latest_bar = df.index[-1].date()
+            artifact = self.registry.get(symbol)
+            if artifact is not None and artifact.is_stale(latest_bar):
+                # Another worker may have retrained it since this one loaded it
+                artifact = self.registry.reload(symbol)
+            if artifact is None or artifact.metadata.get("version") != MODEL_VERSION:
+                # Nothing usable to serve, so this prediction waits for training
+                result = self.refresh_model(symbol, Priority.INTERACTIVE, history)
+                if "error" in result:
+                    return result
+                artifact = self.registry.get(symbol)
+            # A model behind the latest bars still answers; the caller queues its retrain
+            stale = artifact.is_stale(latest_bar)
             
             # Predict
-            latest_scaled = self.scaler.transform(latest_features)
-            predicted_price = self.model.predict(latest_scaled)[0]
+            with span("model_predict"):
+                latest_scaled = artifact.scaler.transform(features)
+                predicted_price = artifact.model.predict(latest_scaled)[0]
             
             current_price = df['close'].iloc[-1]
             change_percent = ((predicted_price - current_price) / current_price) * 100
@@ -140,15 +148,19 @@ class StockPredictor:
                 "predicted_price": round(predicted_price, 2),
                 "change_percent": round(change_percent, 2),
                 "prediction_for_days": days_ahead,
-                "confidence": "Medium"  # You can implement confidence calculation
+                "confidence": "Medium",  # You can implement confidence calculation
+                "model_trained_at": artifact.metadata["trained_at"],
+                "model_last_bar": artifact.metadata["last_bar"],
+                "stale": stale
             }
             
         except Exception as e:
             return {"error": f"Prediction failed: {str(e)}"}
 
 class RiskAnalyzer:
-    def __init__(self):
-        self.analytics = PortfolioAnalytics()
+    def __init__(self, analytics: Optional[PortfolioAnalytics] = None):
+        self.analytics = analytics or PortfolioAnalytics()
+        self.engine = RiskEngine(self.analytics)
     
     def calculate_var(self, returns: pd.Series, confidence_level: float = 0.05) -> float:
         """Calculate Value at Risk"""
@@ -156,36 +168,30 @@ class RiskAnalyzer:
     
     def calculate_beta(self, stock_returns: pd.Series, market_returns: pd.Series) -> float:
         """Calculate stock beta relative to market"""
-        covariance = np.cov(stock_returns, market_returns)[0][17]
-        market_variance = np.var(market_returns)
+        covariance = np.cov(stock_returns, market_returns)[0][1]
+        market_variance = np.var(market_returns, ddof=1)
         return covariance / market_variance if market_variance != 0 else 1
     
-    def assess_portfolio_risk(self, holdings: List[Dict]) -> Dict:
+    def history_symbols(self, holdings: List[Dict]) -> List[str]:
+        """Symbols to prefetch for assess_portfolio_risk, including the benchmark"""
+        return self.engine.history_symbols(holdings)
+    
+    @span("risk_assessment")
+    def assess_portfolio_risk(self, holdings: List[Dict], histories: Optional[Dict[str, pd.DataFrame]] = None) -> Dict:
         """Comprehensive risk assessment"""
         if not holdings:
             return {}
         
-        risk_metrics = {}
+        risk_metrics = self.engine.assess(holdings, histories)
         
-        # Concentration risk
+        # Concentration: largest position and the effective number of equal-weight holdings
         total_value = sum(h['market_value'] for h in holdings)
-        max_weight = max(h['market_value'] / total_value for h in holdings)
-        risk_metrics['concentration_risk'] = "High" if max_weight > 0.3 else "Medium" if max_weight > 0.2 else "Low"
+        if total_value > 0:
+            weights = np.array([h['market_value'] for h in holdings]) / total_value
+            risk_metrics['max_weight'] = round(float(weights.max()) * 100, 2)
+            risk_metrics['effective_holdings'] = round(float(1 / np.sum(weights ** 2)), 2)
         
         # Sector diversification (simplified)
         risk_metrics['diversification_score'] = min(len(holdings) / 10 * 100, 100)
         
-        # Volatility assessment
-        volatilities = []
-        for holding in holdings:
-            hist_data = self.analytics.get_historical_data(holding['symbol'], 30)
-            if not hist_data.empty:
-                returns = hist_data['close'].pct_change().dropna()
-                volatility = returns.std() * np.sqrt(252) * 100
-                volatilities.append(volatility)
-        
-        if volatilities:
-            avg_volatility = np.mean(volatilities)
-            risk_metrics['volatility_level'] = "High" if avg_volatility > 30 else "Medium" if avg_volatility > 20 else "Low"
-        
         return risk_metrics
@@ -0,0 +1,112 @@
+import os
+import logging
+import time
+import threading
+import joblib
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, Optional
+from dotenv import load_dotenv
+
+from instrumentation import count_error
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.getenv("MODEL_DIR", ".models")
+MODEL_MAX_AGE_DAYS = float(os.getenv("MODEL_MAX_AGE_DAYS", "7"))
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", "32"))
+
+# Bump when the feature set or target changes so older artifacts are retrained
+MODEL_VERSION = 1
+
+
+class ModelArtifact:
+    """A fitted scaler and model plus the metadata describing how they were trained"""
+
+    def __init__(self, scaler, model, metadata: Dict):
+        self.scaler = scaler
+        self.model = model
+        self.metadata = metadata
+
+    @property
+    def last_bar(self) -> Optional[date]:
+        value = self.metadata.get("last_bar")
+        return date.fromisoformat(value) if value else None
+
+    def is_stale(self, latest_bar: Optional[date], max_age_days: float = MODEL_MAX_AGE_DAYS) -> bool:
+        """True if newer bars exist, the model is too old, or it predates the current feature set"""
+        if self.metadata.get("version") != MODEL_VERSION:
+            return True
+        if time.time() - self.metadata.get("trained_at", 0) > max_age_days * 86400:
+            return True
+        return latest_bar is not None and (self.last_bar is None or latest_bar > self.last_bar)
+
+
+class ModelRegistry:
+    """Per-symbol model artifacts on disk with an LRU of warm models in memory"""
+
+    def __init__(self, directory: str = MODEL_DIR, max_warm: int = MODEL_CACHE_SIZE):
+        self.directory = directory
+        self.max_warm = max_warm
+        self._warm: "OrderedDict[str, ModelArtifact]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._training_locks: Dict[str, threading.Lock] = {}
+
+    def _path(self, symbol: str) -> str:
+        return os.path.join(self.directory, f"{symbol}.joblib")
+
+    def _remember(self, symbol: str, artifact: ModelArtifact):
+        with self._lock:
+            self._warm[symbol] = artifact
+            self._warm.move_to_end(symbol)
+            while len(self._warm) > self.max_warm:
+                self._warm.popitem(last=False)
+
+    def get(self, symbol: str) -> Optional[ModelArtifact]:
+        """Warm model if present, otherwise load it lazily from disk"""
+        with self._lock:
+            artifact = self._warm.get(symbol)
+            if artifact is not None:
+                self._warm.move_to_end(symbol)
+                return artifact
+
+        try:
+            stored = joblib.load(self._path(symbol))
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning("Error loading model for %s: %s", symbol, e)
+            count_error("model_registry", e)
+            return None
+        artifact = ModelArtifact(stored["scaler"], stored["model"], stored["metadata"])
+        self._remember(symbol, artifact)
+        return artifact
+
+    def reload(self, symbol: str) -> Optional[ModelArtifact]:
+        """Drop the warm copy and load from disk, picking up a model another process trained"""
+        with self._lock:
+            self._warm.pop(symbol, None)
+        return self.get(symbol)
+
+    def save(self, symbol: str, artifact: ModelArtifact):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(symbol)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        joblib.dump({"scaler": artifact.scaler, "model": artifact.model, "metadata": artifact.metadata}, tmp_path)
+        os.replace(tmp_path, path)
+        self._remember(symbol, artifact)
+
+    def training_lock(self, symbol: str) -> threading.Lock:
+        """Serializes retraining of one symbol so concurrent requests train it once"""
+        with self._lock:
+            return self._training_locks.setdefault(symbol, threading.Lock())
+
+    def metadata(self, symbol: str) -> Optional[Dict]:
+        artifact = self.get(symbol)
+        return artifact.metadata if artifact is not None else None
+
+
+# Shared by every StockPredictor in the process
+default_registry = ModelRegistry()
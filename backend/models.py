@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean, Text
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Boolean, Text, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -21,8 +21,12 @@ class Portfolio(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     description = Column(Text, nullable=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
     total_value = Column(Float, default=0.0)
+    # Lot matching for sells: fifo, lifo or average
+    cost_method = Column(String, nullable=False, default="average", server_default="average")
+    # Bumped on every ledger write; a writer that finds it changed retries
+    ledger_version = Column(Integer, nullable=False, default=0, server_default="0")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
@@ -47,6 +51,8 @@ class Holding(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     portfolio = relationship("Portfolio", back_populates="holdings")
+    
+    __table_args__ = (Index("ix_holdings_portfolio_symbol", "portfolio_id", "symbol"),)
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -61,6 +67,9 @@ class Transaction(Base):
     transaction_date = Column(DateTime(timezone=True), server_default=func.now())
     
     portfolio = relationship("Portfolio", back_populates="transactions")
+    
+    # Ledger replays read one portfolio's symbols in (date, id) order
+    __table_args__ = (Index("ix_transactions_portfolio_symbol_date", "portfolio_id", "symbol", "transaction_date"),)
 
 class MarketData(Base):
     __tablename__ = "market_data"
@@ -71,3 +80,32 @@ class MarketData(Base):
     volume = Column(Integer)
     change_percent = Column(Float)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
+
+class DailyBar(Base):
+    __tablename__ = "daily_bars"
+    __table_args__ = (UniqueConstraint("symbol", "date", name="uq_daily_bars_symbol_date"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    symbol = Column(String, index=True)
+    date = Column(Date, index=True)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
+    volume = Column(Float)
+
+class PortfolioSnapshot(Base):
+    __tablename__ = "portfolio_snapshots"
+    __table_args__ = (UniqueConstraint("portfolio_id", "date", name="uq_portfolio_snapshots_portfolio_date"),)
+    
+    id = Column(Integer, primary_key=True, index=True)
+    portfolio_id = Column(Integer, ForeignKey("portfolios.id"), index=True)
+    date = Column(Date)
+    total_value = Column(Float)
+    cost_basis = Column(Float)
+    # Time-weighted: net money added since the previous snapshot is excluded from the return
+    daily_return = Column(Float, nullable=True)
+    return_index = Column(Float)
+    peak_index = Column(Float)
+    drawdown = Column(Float)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -0,0 +1,147 @@
+import os
+import multiprocessing
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from portfolio_analytics import PortfolioAnalytics
+
+load_dotenv()
+
+# Upper bound on the working set of one batch of paths (dates x assets x paths of float64)
+MC_CHUNK_BYTES = int(os.getenv("MC_CHUNK_BYTES", str(32 * 1024 * 1024)))
+MC_MAX_PATHS = int(os.getenv("MC_MAX_PATHS", "200000"))
+MC_MAX_DAYS = int(os.getenv("MC_MAX_DAYS", "1260"))
+# Path counts at or above this are split across a process pool
+MC_PARALLEL_PATHS = int(os.getenv("MC_PARALLEL_PATHS", "50000"))
+MC_WORKERS = int(os.getenv("MC_WORKERS", str(os.cpu_count() or 1)))
+# Percentile bands over time are taken from this many paths; terminal statistics use all of them
+MC_BAND_PATHS = 2000
+MC_LOOKBACK_DAYS = 252
+
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+def cholesky_factor(cov: np.ndarray) -> np.ndarray:
+    """Lower Cholesky factor, adding diagonal jitter when the sample covariance is singular"""
+    jitter = 0.0
+    scale = max(float(np.trace(cov)) / len(cov), 1e-12)
+    for _ in range(8):
+        try:
+            return np.linalg.cholesky(cov + jitter * np.eye(len(cov)))
+        except np.linalg.LinAlgError:
+            jitter = scale * 1e-10 if jitter == 0 else jitter * 100
+    raise ValueError("Covariance matrix is not positive semi-definite")
+
+
+def chunk_size(days: int, assets: int, chunk_bytes: int = MC_CHUNK_BYTES) -> int:
+    return max(1, chunk_bytes // (days * assets * 8))
+
+
+def _simulate_chunk(args) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+    """Terminal values, max drawdowns and (optionally) value paths for one batch of paths"""
+    seed, n_paths, drift, factor, values, days, keep_paths = args
+    rng = np.random.default_rng(seed)
+
+    # Correlated daily log returns, then buy-and-hold position values per day
+    # (paths * days, assets) so the correlation is one GEMM instead of one per path
+    shocks = rng.standard_normal((n_paths * days, len(values)))
+    log_returns = (shocks @ factor.T).reshape(n_paths, days, len(values))
+    del shocks
+    log_returns += drift
+    np.cumsum(log_returns, axis=1, out=log_returns)
+    np.exp(log_returns, out=log_returns)
+    paths = log_returns @ values
+
+    peaks = np.maximum.accumulate(np.maximum(paths, values.sum()), axis=1)
+    drawdowns = (paths / peaks - 1).min(axis=1)
+    return paths[:, -1], drawdowns, (paths if keep_paths else None)
+
+
+def simulate(drift: np.ndarray, cov: np.ndarray, values: np.ndarray, days: int, n_paths: int,
+             seed: Optional[int] = None, workers: int = 1) -> Dict:
+    """Simulate buy-and-hold portfolio values from multivariate normal daily log returns.
+
+    Paths are generated in batches of at most MC_CHUNK_BYTES, each with its
+    own child seed, so memory stays bounded and a seeded run gives the same
+    answer serially or across a process pool.
+    """
+    factor = cholesky_factor(cov)
+    values = np.asarray(values, dtype=np.float64)
+    initial_value = float(values.sum())
+
+    per_chunk = chunk_size(days, len(values))
+    sizes = [min(per_chunk, n_paths - start) for start in range(0, n_paths, per_chunk)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    band_chunks = -(-MC_BAND_PATHS // per_chunk)
+    tasks = [(seeds[i], size, drift, factor, values, days, i < band_chunks) for i, size in enumerate(sizes)]
+
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = list(pool.map(_simulate_chunk, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+    else:
+        results = [_simulate_chunk(task) for task in tasks]
+
+    terminal = np.concatenate([r[0] for r in results])
+    drawdowns = np.concatenate([r[1] for r in results])
+    band_paths = np.concatenate([r[2] for r in results if r[2] is not None])[:MC_BAND_PATHS]
+    bands = np.percentile(band_paths, PERCENTILES, axis=0)
+
+    return {
+        "initial_value": round(initial_value, 2),
+        "days": days,
+        "paths": n_paths,
+        "seed": seed,
+        "terminal_value": {
+            "mean": round(float(terminal.mean()), 2),
+            **{f"p{p}": round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(terminal, PERCENTILES))},
+        },
+        "probability_of_loss": round(float((terminal < initial_value).mean()), 4),
+        "max_drawdown": {
+            "mean": round(float(drawdowns.mean()) * 100, 2),
+            "p50": round(float(np.percentile(drawdowns, 50)) * 100, 2),
+            # Bad-case drawdown: only 5% of paths fall further
+            "p5": round(float(np.percentile(drawdowns, 5)) * 100, 2),
+        },
+        "bands": {
+            "day": list(range(1, days + 1)),
+            **{f"p{p}": np.round(band, 2).tolist() for p, band in zip(PERCENTILES, bands)},
+        },
+    }
+
+
+class MonteCarloSimulator:
+    """Forward projections of a portfolio from its holdings' historical returns"""
+
+    def __init__(self, analytics: Optional[PortfolioAnalytics] = None):
+        self.analytics = analytics or PortfolioAnalytics()
+
+    def simulate_portfolio(self, holdings: List[Dict], days: int = 252, n_paths: int = 10000,
+                           seed: Optional[int] = None, workers: Optional[int] = None,
+                           histories: Optional[Dict[str, pd.DataFrame]] = None) -> Dict:
+        values = pd.Series([h['market_value'] for h in holdings], index=[h['symbol'] for h in holdings])
+        values = values.groupby(level=0).sum()
+        values = values[values > 0]
+        if values.empty:
+            return {"error": "Portfolio has no market value to simulate"}
+
+        returns = self.analytics.get_returns(list(values.index), MC_LOOKBACK_DAYS, histories)
+        if len(returns) < 2:
+            return {"error": "Insufficient data for simulation"}
+        symbols = list(returns.columns)
+        log_returns = np.log1p(returns.to_numpy(dtype=np.float64))
+
+        if workers is None:
+            workers = MC_WORKERS if n_paths >= MC_PARALLEL_PATHS else 1
+        result = simulate(
+            log_returns.mean(axis=0),
+            np.atleast_2d(np.cov(log_returns, rowvar=False)),
+            values[symbols].to_numpy(),
+            days, n_paths, seed, workers,
+        )
+        result["observations"] = len(returns)
+        result["unpriced"] = sorted(set(values.index) - set(symbols))
+        return result
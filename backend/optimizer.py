@@ -0,0 +1,247 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from collections import OrderedDict
+from scipy.linalg import cho_factor, cho_solve
+from scipy.optimize import minimize
+from typing import Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from portfolio_analytics import PortfolioAnalytics
+
+load_dotenv()
+
+RISK_FREE_RATE = float(os.getenv("RISK_FREE_RATE", "0.0"))
+OPTIMIZER_LOOKBACK_DAYS = int(os.getenv("OPTIMIZER_LOOKBACK_DAYS", "252"))
+OPTIMIZER_CACHE_SIZE = int(os.getenv("OPTIMIZER_CACHE_SIZE", "128"))
+MAX_FRONTIER_POINTS = 100
+TRADING_DAYS = 252
+
+TARGETS = ("max_sharpe", "min_variance", "risk_parity")
+
+
+class OptimizationProblem:
+    """Annualized moments of one returns matrix plus the factorizations every solve reuses"""
+
+    def __init__(self, returns: pd.DataFrame):
+        self.symbols = list(returns.columns)
+        R = returns.to_numpy(dtype=np.float64)
+        self.mu = R.mean(axis=0) * TRADING_DAYS
+        centered = R - R.mean(axis=0)
+        self.cov = centered.T @ centered / (len(R) - 1) * TRADING_DAYS
+        n = len(self.symbols)
+        # A tiny ridge keeps the factorization defined when assets are collinear
+        self.chol = cho_factor(self.cov + np.eye(n) * 1e-10 * max(np.trace(self.cov) / n, 1e-12))
+        self.solutions: Dict[Tuple, Dict] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self.symbols)
+
+    def variance(self, w: np.ndarray) -> Tuple[float, np.ndarray]:
+        cov_w = self.cov @ w
+        return float(w @ cov_w), 2 * cov_w
+
+    def _start(self, direction: np.ndarray, max_weight: float) -> np.ndarray:
+        """Feasible starting point from an unconstrained closed form, e.g. inv(cov) @ 1"""
+        w = np.clip(cho_solve(self.chol, direction), 0, None)
+        w = w / w.sum() if w.sum() > 0 else np.full(self.size, 1 / self.size)
+        return _project(w, max_weight)
+
+    def _solve(self, objective, start: np.ndarray, max_weight: float, extra=()) -> np.ndarray:
+        constraints = [{"type": "eq", "fun": lambda w: w.sum() - 1, "jac": lambda w: np.ones_like(w)}, *extra]
+        result = minimize(objective, start, jac=True, method="SLSQP", bounds=[(0, max_weight)] * self.size,
+                          constraints=constraints, options={"maxiter": 200, "ftol": 1e-12})
+        return _project(np.clip(result.x, 0, max_weight), max_weight)
+
+    def min_variance(self, max_weight: float) -> np.ndarray:
+        return self._solve(self.variance, self._start(np.ones(self.size), max_weight), max_weight)
+
+    def max_sharpe(self, max_weight: float, risk_free_rate: float = RISK_FREE_RATE) -> np.ndarray:
+        excess = self.mu - risk_free_rate
+
+        def negative_sharpe(w):
+            var, var_grad = self.variance(w)
+            sd = np.sqrt(max(var, 1e-18))
+            ret = w @ excess
+            return -ret / sd, -(excess * sd - ret * var_grad / (2 * sd)) / var
+
+        start = self._start(excess, max_weight) if (excess > 0).any() else self.min_variance(max_weight)
+        return self._solve(negative_sharpe, start, max_weight)
+
+    def risk_parity(self, max_weight: float) -> np.ndarray:
+        """Equal risk contributions, from the convex log-barrier form, then capped if needed"""
+        sd = np.sqrt(np.diag(self.cov))
+
+        def barrier(y):
+            cov_y = self.cov @ y
+            return 0.5 * y @ cov_y - np.log(y).sum() / self.size, cov_y - 1 / (self.size * y)
+
+        y0 = 1 / np.where(sd > 0, sd, 1)
+        result = minimize(barrier, y0, jac=True, method="L-BFGS-B", bounds=[(1e-12, None)] * self.size)
+        w = result.x / result.x.sum()
+        if w.max() <= max_weight + 1e-9:
+            return w
+
+        def dispersion(w):
+            cov_w = self.cov @ w
+            total = w @ cov_w
+            share = w * cov_w / total - 1 / self.size
+            # d(share_i)/dw, used for the analytic gradient of sum(share^2)
+            jac = (np.diag(cov_w) + w[:, None] * self.cov) / total - np.outer(w * cov_w, 2 * cov_w) / total ** 2
+            return float(share @ share), 2 * jac.T @ share
+
+        return self._solve(dispersion, _project(w, max_weight), max_weight)
+
+    def frontier(self, max_weight: float, points: int, start: np.ndarray) -> List[np.ndarray]:
+        """Minimum-variance weights for evenly spaced target returns, each solve warm-started from the last"""
+        low = float(start @ self.mu)
+        high = _max_return(self.mu, max_weight)
+        weights, w = [], start
+        for target in np.linspace(low, high, points):
+            on_target = {"type": "eq", "fun": lambda w, t=target: w @ self.mu - t, "jac": lambda w: self.mu}
+            w = self._solve(self.variance, w, max_weight, (on_target,))
+            weights.append(w)
+        return weights
+
+    def stats(self, w: np.ndarray, risk_free_rate: float = RISK_FREE_RATE) -> Dict:
+        ret = float(w @ self.mu)
+        vol = float(np.sqrt(max(w @ self.cov @ w, 0.0)))
+        return {
+            "expected_return": round(ret * 100, 2),
+            "volatility": round(vol * 100, 2),
+            "sharpe_ratio": round((ret - risk_free_rate) / vol, 3) if vol > 0 else 0.0,
+        }
+
+
+def _project(w: np.ndarray, max_weight: float) -> np.ndarray:
+    """Nearest long-only, capped, fully invested weights by redistributing any excess"""
+    w = np.clip(w, 0, max_weight)
+    for _ in range(len(w)):
+        gap = 1 - w.sum()
+        if abs(gap) < 1e-12:
+            break
+        free = (w < max_weight) if gap > 0 else (w > 0)
+        if not free.any():
+            break
+        room = (max_weight - w) if gap > 0 else w
+        w = np.clip(w + gap * room * free / (room * free).sum(), 0, max_weight)
+    return w
+
+
+def _max_return(mu: np.ndarray, max_weight: float) -> float:
+    """Highest return reachable under the cap: fill the best assets first"""
+    remaining, total = 1.0, 0.0
+    for i in np.argsort(-mu):
+        take = min(max_weight, remaining)
+        total += take * mu[i]
+        remaining -= take
+        if remaining <= 1e-12:
+            break
+    return total
+
+
+def rebalance_trades(holdings: List[Dict], weights: Dict[str, float]) -> List[Dict]:
+    """Share changes that move current holdings to the target weights at current prices.
+
+    Holdings outside the optimized set (e.g. without price history) are left untouched.
+    """
+    current = {}
+    for h in holdings:
+        if h['symbol'] not in weights:
+            continue
+        entry = current.setdefault(h['symbol'], {"shares": 0.0, "price": h['current_price']})
+        entry["shares"] += h['shares']
+    total_value = sum(h['market_value'] for h in holdings if h['symbol'] in weights)
+
+    trades = []
+    for symbol, entry in current.items():
+        price = entry["price"]
+        if not price:
+            continue
+        target_shares = weights.get(symbol, 0.0) * total_value / price
+        delta = target_shares - entry["shares"]
+        if abs(delta) * price < 0.01:
+            continue
+        trades.append({
+            "symbol": symbol,
+            "action": "buy" if delta > 0 else "sell",
+            "shares": round(abs(delta), 4),
+            "current_shares": round(entry["shares"], 4),
+            "target_shares": round(target_shares, 4),
+            "value": round(abs(delta) * price, 2),
+        })
+    return sorted(trades, key=lambda t: -t["value"])
+
+
+class PortfolioOptimizer:
+    """Mean-variance and risk-parity targets for a portfolio's holdings.
+
+    The annualized moments, their Cholesky factorization and every solved
+    target are cached per portfolio until the return history changes.
+    """
+
+    def __init__(self, analytics: Optional[PortfolioAnalytics] = None, max_entries: int = OPTIMIZER_CACHE_SIZE):
+        self.analytics = analytics or PortfolioAnalytics()
+        self.max_entries = max_entries
+        self._problems: "OrderedDict[int, Tuple[Tuple, OptimizationProblem]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def problem(self, portfolio_id: int, returns: pd.DataFrame) -> OptimizationProblem:
+        signature = (tuple(returns.columns), returns.index[-1], len(returns))
+        with self._lock:
+            cached = self._problems.get(portfolio_id)
+            if cached is not None and cached[0] == signature:
+                self._problems.move_to_end(portfolio_id)
+                return cached[1]
+        problem = OptimizationProblem(returns)
+        with self._lock:
+            self._problems[portfolio_id] = (signature, problem)
+            self._problems.move_to_end(portfolio_id)
+            while len(self._problems) > self.max_entries:
+                self._problems.popitem(last=False)
+        return problem
+
+    def optimize(self, portfolio_id: int, holdings: List[Dict], target: str = "max_sharpe",
+                 max_weight: float = 1.0, points: int = 50,
+                 histories: Optional[Dict[str, pd.DataFrame]] = None) -> Dict:
+        symbols = list(dict.fromkeys(h['symbol'] for h in holdings))
+        returns = self.analytics.get_returns(symbols, OPTIMIZER_LOOKBACK_DAYS, histories)
+        if len(returns) < 2 or returns.shape[1] < 2:
+            return {"error": "Need return history for at least two holdings to optimize"}
+        if max_weight * returns.shape[1] < 1:
+            return {"error": f"max_weight {max_weight} is infeasible for {returns.shape[1]} assets"}
+
+        problem = self.problem(portfolio_id, returns)
+        key = (round(max_weight, 6), points)
+        solution = problem.solutions.get(key)
+        if solution is None:
+            min_variance = problem.min_variance(max_weight)
+            solution = {
+                "min_variance": min_variance,
+                "max_sharpe": problem.max_sharpe(max_weight),
+                "risk_parity": problem.risk_parity(max_weight),
+                "frontier": problem.frontier(max_weight, points, min_variance) if points else [],
+            }
+            if len(problem.solutions) >= 16:
+                problem.solutions.clear()
+            problem.solutions[key] = solution
+
+        def describe(w: np.ndarray) -> Dict:
+            return {
+                "weights": {symbol: round(float(x), 4) for symbol, x in zip(problem.symbols, w)},
+                **problem.stats(w),
+            }
+
+        portfolios = {name: describe(solution[name]) for name in TARGETS}
+        return {
+            "symbols": problem.symbols,
+            "unpriced": sorted(set(symbols) - set(problem.symbols)),
+            "observations": len(returns),
+            "max_weight": max_weight,
+            "portfolios": portfolios,
+            "frontier": [problem.stats(w) for w in solution["frontier"]],
+            "target": target,
+            "trades": rebalance_trades(holdings, portfolios[target]["weights"]),
+        }
@@ -1,72 +1,242 @@
-import requests
 import os
+import asyncio
+import logging
 import pandas as pd
 import numpy as np
-from typing import Dict, List
-from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
 
+from market_cache import MarketDataCache, default_cache
+from bar_store import BarStore, COMPACT_BARS, last_trading_day, missing_trading_days
+from price_matrix import PriceMatrix, default_price_matrix
+from market_client import MarketDataClient
+from instrumentation import count_error, span
+from request_scheduler import Priority, RateLimited
+
 load_dotenv()
 ALPHA_VANTAGE_API_KEY = os.getenv("ALPHA_VANTAGE_API_KEY")
 
+logger = logging.getLogger(__name__)
+
+def _is_current(df: pd.DataFrame) -> bool:
+    return df.attrs.get("status") == "ok"
+
 class PortfolioAnalytics:
-    def __init__(self):
+    def __init__(self, cache: Optional[MarketDataCache] = None, bar_store: Optional[BarStore] = None,
+                 price_matrix: Optional[PriceMatrix] = None, client: Optional[MarketDataClient] = None):
         self.api_key = ALPHA_VANTAGE_API_KEY
+        self.cache = cache or default_cache
+        self.bar_store = bar_store or BarStore()
+        self.price_matrix = price_matrix or default_price_matrix
+        self.client = client or MarketDataClient(self.api_key)
         
-    def get_stock_price(self, symbol: str) -> Dict:
-        """Get current stock price from Alpha Vantage"""
-        url = f"https://www.alphavantage.co/query"
-        params = {
-            "function": "GLOBAL_QUOTE",
-            "symbol": symbol,
-            "apikey": self.api_key
-        }
+    def get_stock_price(self, symbol: str, priority: Priority = Priority.INTERACTIVE) -> Dict:
+        """Get current stock price from Alpha Vantage.
         
+        status is "ok", "stale" (last known quote while upstream is rate limited),
+        "limited" (rate limited with nothing cached) or "unavailable"; price is
+        None unless a quote is known."""
+        fetch = lambda: self.client.scheduler.coalesce(("quote", symbol), lambda: self._fetch_quote(symbol, priority))
         try:
-            response = requests.get(url, params=params)
-            data = response.json()
-            
-            if "Global Quote" in data:
-                quote = data["Global Quote"]
-                return {
-                    "symbol": quote.get("01. symbol", symbol),
-                    "price": float(quote.get("05. price", 0)),
-                    "change": float(quote.get("09. change", 0)),
-                    "change_percent": quote.get("10. change percent", "0%").replace("%", "")
-                }
+            quote = self.cache.get_or_fetch("quote", symbol, fetch)
+        except RateLimited:
+            return self._limited_quote(symbol)
+        return self._quote_result(symbol, quote)
+    
+    async def aget_stock_price(self, symbol: str, priority: Priority = Priority.INTERACTIVE) -> Dict:
+        """Async variant of get_stock_price using the pooled client"""
+        fetch = lambda: self.client.scheduler.acoalesce(("quote", symbol), lambda: self._afetch_quote(symbol, priority))
+        try:
+            quote = await self.cache.aget_or_fetch("quote", symbol, fetch)
+        except RateLimited:
+            return self._limited_quote(symbol)
+        return self._quote_result(symbol, quote)
+    
+    async def aget_stock_prices(self, symbols: List[str], priority: Priority = Priority.INTERACTIVE) -> Dict[str, Dict]:
+        """Quotes for many symbols, each distinct symbol fetched once, concurrently; keyed by the upper-cased symbol"""
+        symbols = list(dict.fromkeys(symbol.strip().upper() for symbol in symbols))
+        quotes = await asyncio.gather(*(self.aget_stock_price(symbol, priority) for symbol in symbols))
+        return dict(zip(symbols, quotes))
+    
+    def get_historical_data(self, symbol: str, days: Optional[int] = 30, priority: Priority = Priority.INTERACTIVE) -> pd.DataFrame:
+        """Get the last `days` bars (all of them for None); df.attrs["status"] says whether it is current"""
+        if self.price_matrix.covers([symbol]):
+            return self.price_matrix.frame(symbol, days)
+        
+        fetch = lambda: self.client.scheduler.coalesce(("daily", symbol), lambda: self._load_daily(symbol, priority))
+        df = self.cache.get_or_fetch("daily", symbol, fetch, cacheable=_is_current)
+        return df.tail(days).copy() if days else df.copy()
+    
+    async def aget_historical_data(self, symbol: str, days: Optional[int] = 30, priority: Priority = Priority.INTERACTIVE) -> pd.DataFrame:
+        """Async variant of get_historical_data using the pooled client"""
+        if self.price_matrix.covers([symbol]):
+            return self.price_matrix.frame(symbol, days)
+        
+        fetch = lambda: self.client.scheduler.acoalesce(("daily", symbol), lambda: self._aload_daily(symbol, priority))
+        df = await self.cache.aget_or_fetch("daily", symbol, fetch, cacheable=_is_current)
+        return df.tail(days).copy() if days else df.copy()
+    
+    async def afetch_histories(self, symbols: List[str], days: int, priority: Priority = Priority.INTERACTIVE) -> Dict[str, pd.DataFrame]:
+        """Fetch history for all symbols in one concurrent fan-out"""
+        symbols = list(dict.fromkeys(symbols))
+        frames = await asyncio.gather(*(self.aget_historical_data(symbol, days, priority) for symbol in symbols))
+        return dict(zip(symbols, frames))
+    
+    def _quote_result(self, symbol: str, quote: Optional[Dict]) -> Dict:
+        if quote is None:
+            return {"symbol": symbol, "price": None, "change": None, "change_percent": None, "status": "unavailable"}
+        return {**quote, "status": "ok"}
+    
+    def _limited_quote(self, symbol: str) -> Dict:
+        found, quote = self.cache.get_stale("quote", symbol)
+        if found:
+            return {**quote, "status": "stale"}
+        return {"symbol": symbol, "price": None, "change": None, "change_percent": None, "status": "limited"}
+    
+    def _fetch_quote(self, symbol: str, priority: Priority = Priority.INTERACTIVE) -> Optional[Dict]:
+        try:
+            data = self.client.query_sync({"function": "GLOBAL_QUOTE", "symbol": symbol}, priority)
+            return self._parse_quote(data, symbol)
+        except RateLimited:
+            raise
         except Exception as e:
-            print(f"Error fetching data for {symbol}: {e}")
-            
-        return {"symbol": symbol, "price": 0, "change": 0, "change_percent": "0"}
-    
-    def get_historical_data(self, symbol: str, days: int = 30) -> pd.DataFrame:
-        """Get historical stock data"""
-        url = f"https://www.alphavantage.co/query"
-        params = {
-            "function": "TIME_SERIES_DAILY",
-            "symbol": symbol,
-            "apikey": self.api_key,
-            "outputsize": "compact"
-        }
+            logger.warning("Error fetching quote for %s: %s", symbol, e)
+            count_error("quote_fetch", e)
+        return None
+    
+    async def _afetch_quote(self, symbol: str, priority: Priority = Priority.INTERACTIVE) -> Optional[Dict]:
+        try:
+            data = await self.client.query({"function": "GLOBAL_QUOTE", "symbol": symbol}, priority)
+            return self._parse_quote(data, symbol)
+        except RateLimited:
+            raise
+        except Exception as e:
+            logger.warning("Error fetching quote for %s: %s", symbol, e)
+            count_error("quote_fetch", e)
+        return None
+    
+    def _load_daily(self, symbol: str, priority: Priority = Priority.INTERACTIVE) -> pd.DataFrame:
+        """Bring the local bar store up to date, then read the full series from it"""
+        status = "ok"
+        outputsize = self._daily_outputsize(self.bar_store.last_date(symbol))
+        if outputsize:
+            try:
+                fresh = self._fetch_daily(symbol, outputsize, priority)
+                self.bar_store.append(symbol, fresh)
+            except RateLimited:
+                status = "limited"
+            else:
+                if fresh is None:
+                    status = "stale"
+        
+        return self._with_status(self.bar_store.read(symbol), status)
+    
+    async def _aload_daily(self, symbol: str, priority: Priority = Priority.INTERACTIVE) -> pd.DataFrame:
+        # The bar store is synchronous, so keep its queries off the event loop
+        status = "ok"
+        outputsize = self._daily_outputsize(await asyncio.to_thread(self.bar_store.last_date, symbol))
+        if outputsize:
+            try:
+                fresh = await self._afetch_daily(symbol, outputsize, priority)
+                await asyncio.to_thread(self.bar_store.append, symbol, fresh)
+            except RateLimited:
+                status = "limited"
+            else:
+                if fresh is None:
+                    status = "stale"
         
+        return self._with_status(await asyncio.to_thread(self.bar_store.read, symbol), status)
+    
+    @staticmethod
+    def _with_status(df: pd.DataFrame, status: str) -> pd.DataFrame:
+        """status is "ok", "limited" (quota exhausted) or "stale" (the update failed) before looking at df"""
+        if df.empty:
+            status = "limited" if status == "limited" else "unavailable"
+        elif status != "ok":
+            status = "stale"
+        df.attrs["status"] = status
+        return df
+    
+    def _daily_outputsize(self, last: Optional[date]) -> Optional[str]:
+        """Which TIME_SERIES_DAILY size brings the store current, or None if it already is"""
+        expected = last_trading_day()
+        if last is not None and last >= expected:
+            return None
+        # Backfill everything once, afterwards only the bars since the last stored day
+        missing = COMPACT_BARS + 1 if last is None else missing_trading_days(last, expected)
+        return "full" if missing > COMPACT_BARS else "compact"
+    
+    def _fetch_daily(self, symbol: str, outputsize: str = "compact", priority: Priority = Priority.INTERACTIVE) -> Optional[pd.DataFrame]:
         try:
-            response = requests.get(url, params=params)
-            data = response.json()
-            
-            if "Time Series (Daily)" in data:
-                time_series = data["Time Series (Daily)"]
-                df = pd.DataFrame.from_dict(time_series, orient='index')
-                df.columns = ['open', 'high', 'low', 'close', 'volume']
-                df.index = pd.to_datetime(df.index)
-                df = df.astype(float)
-                df = df.sort_index()
-                return df.tail(days)
+            data = self.client.query_sync({"function": "TIME_SERIES_DAILY", "symbol": symbol, "outputsize": outputsize}, priority)
+            return self._parse_daily(data)
+        except RateLimited:
+            raise
         except Exception as e:
-            print(f"Error fetching historical data for {symbol}: {e}")
-            
-        return pd.DataFrame()
+            logger.warning("Error fetching daily bars for %s: %s", symbol, e)
+            count_error("daily_fetch", e)
+        return None
+    
+    async def _afetch_daily(self, symbol: str, outputsize: str = "compact", priority: Priority = Priority.INTERACTIVE) -> Optional[pd.DataFrame]:
+        try:
+            data = await self.client.query({"function": "TIME_SERIES_DAILY", "symbol": symbol, "outputsize": outputsize}, priority)
+            return self._parse_daily(data)
+        except RateLimited:
+            raise
+        except Exception as e:
+            logger.warning("Error fetching daily bars for %s: %s", symbol, e)
+            count_error("daily_fetch", e)
+        return None
+    
+    @staticmethod
+    def _parse_quote(data: Dict, symbol: str) -> Optional[Dict]:
+        if "Global Quote" not in data:
+            return None
+        quote = data["Global Quote"]
+        return {
+            "symbol": quote.get("01. symbol", symbol),
+            "price": float(quote.get("05. price", 0)),
+            "change": float(quote.get("09. change", 0)),
+            "change_percent": quote.get("10. change percent", "0%").replace("%", ""),
+            "volume": int(quote.get("06. volume", 0))
+        }
+    
+    @staticmethod
+    def _parse_daily(data: Dict) -> Optional[pd.DataFrame]:
+        if "Time Series (Daily)" not in data:
+            return None
+        time_series = data["Time Series (Daily)"]
+        df = pd.DataFrame.from_dict(time_series, orient='index')
+        df.columns = ['open', 'high', 'low', 'close', 'volume']
+        df.index = pd.to_datetime(df.index)
+        df = df.astype(float)
+        return df.sort_index()
+    
+    @span("returns")
+    def get_returns(self, symbols: List[str], days: int, histories: Optional[Dict[str, pd.DataFrame]] = None) -> pd.DataFrame:
+        """Aligned daily returns for symbols, one column per symbol with data.
+        
+        histories may hold frames already fetched with afetch_histories."""
+        symbols = list(dict.fromkeys(symbols))
+        if self.price_matrix.covers(symbols):
+            return self.price_matrix.returns(symbols, days)
+        
+        returns_data = {}
+        for symbol in symbols:
+            if histories is not None and symbol in histories:
+                hist_data = histories[symbol].tail(days + 1)
+            else:
+                hist_data = self.get_historical_data(symbol, days + 1)
+            if not hist_data.empty:
+                returns_data[symbol] = hist_data['close'].pct_change().dropna()
+        
+        if not returns_data:
+            return pd.DataFrame()
+        return pd.DataFrame(returns_data).dropna()
     
-    def calculate_portfolio_metrics(self, holdings: List[Dict]) -> Dict:
+    @span("portfolio_metrics")
+    def calculate_portfolio_metrics(self, holdings: List[Dict], histories: Optional[Dict[str, pd.DataFrame]] = None) -> Dict:
         """Calculate portfolio risk and return metrics"""
         if not holdings:
             return {}
@@ -76,26 +246,13 @@ class PortfolioAnalytics:
         total_value = sum(weights)
         weights = [w/total_value for w in weights]
         
-        # Get historical data for all holdings
-        returns_data = {}
-        for symbol in symbols:
-            hist_data = self.get_historical_data(symbol, 252)  # 1 year of data
-            if not hist_data.empty:
-                returns = hist_data['close'].pct_change().dropna()
-                returns_data[symbol] = returns
-        
-        if not returns_data:
-            return {}
-        
-        # Convert to DataFrame
-        returns_df = pd.DataFrame(returns_data)
-        returns_df = returns_df.dropna()
-        
+        returns_df = self.get_returns(symbols, 252, histories)  # 1 year of data
         if returns_df.empty:
             return {}
         
         # Calculate portfolio returns
-        portfolio_returns = (returns_df * weights).sum(axis=1)
+        weights = pd.Series(weights, index=symbols).groupby(level=0).sum()
+        portfolio_returns = returns_df @ weights[returns_df.columns]
         
         # Calculate metrics
         annual_return = portfolio_returns.mean() * 252
@@ -0,0 +1,244 @@
+import os
+import logging
+import sys
+import json
+import glob
+import time
+import threading
+import numpy as np
+import pandas as pd
+from datetime import datetime, time as dt_time, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from dotenv import load_dotenv
+
+from bar_store import BAR_COLUMNS, last_trading_day
+from instrumentation import count_error
+from market_cache import MARKET_CLOSE_UTC_HOUR
+from request_scheduler import Priority
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+PRICE_MATRIX_DIR = os.getenv("PRICE_MATRIX_DIR", ".price_matrix")
+PRICE_MATRIX_DTYPE = os.getenv("PRICE_MATRIX_DTYPE", "float64")
+PRICE_MATRIX_MAX_DAYS = int(os.getenv("PRICE_MATRIX_MAX_DAYS", "2520"))  # 10 years
+
+INDEX_FILE = "index.json"
+CLOSE = BAR_COLUMNS.index('close')
+
+
+class MatrixVersion(NamedTuple):
+    """One published build; readers take it whole so arrays and labels always match"""
+    data: Optional[np.ndarray]
+    symbols: List[str]
+    columns: Dict[str, int]
+    # Row of each symbol's first and last bar; dates outside that range are NaN
+    first_valid: Dict[str, int]
+    last_valid: Dict[str, int]
+    dates: pd.DatetimeIndex
+    built_at: float
+
+
+EMPTY_VERSION = MatrixVersion(None, [], {}, {}, {}, pd.DatetimeIndex([]), 0.0)
+
+
+class PriceMatrix:
+    """Aligned daily OHLCV bars for many symbols in one memory-mapped array.
+
+    The array has shape (fields, dates, symbols) in C order, so the close
+    plane is a contiguous dates x symbols matrix and any trailing window of
+    it is a zero-copy view. Writers publish a new versioned data file and then
+    atomically swap index.json, so every uvicorn worker can map the same file
+    read-only and pick up rebuilds without locking.
+    """
+
+    def __init__(self, directory: str = PRICE_MATRIX_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._index_mtime = None
+        self._version = EMPTY_VERSION
+
+    @property
+    def symbols(self) -> List[str]:
+        return self._current().symbols
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        return self._current().dates
+
+    @property
+    def built_at(self) -> float:
+        return self._current().built_at
+
+    def _current(self) -> MatrixVersion:
+        self._reload_if_changed()
+        return self._version
+
+    def _reload_if_changed(self):
+        index_path = os.path.join(self.directory, INDEX_FILE)
+        try:
+            mtime = os.stat(index_path).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._index_mtime:
+            return
+
+        with self._lock:
+            if mtime == self._index_mtime:
+                return
+            try:
+                with open(index_path) as f:
+                    index = json.load(f)
+                data = np.load(os.path.join(self.directory, index["data_file"]), mmap_mode='r')
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning("Error loading price matrix from %s: %s", self.directory, e)
+                count_error("price_matrix", e)
+                return
+            symbols = index["symbols"]
+            dates = pd.to_datetime(index["dates"])
+            # Indexes written before last_valid was recorded were filled to the end
+            last_valid = index.get("last_valid") or {symbol: len(dates) - 1 for symbol in symbols}
+            # A single assignment, so a concurrent reader sees either the old build or the new one
+            self._version = MatrixVersion(data, symbols, {symbol: i for i, symbol in enumerate(symbols)},
+                                          index["first_valid"], last_valid, dates, index["built_at"])
+            self._index_mtime = mtime
+
+    def is_current(self) -> bool:
+        """True if built after the most recent end-of-day bar was published"""
+        version = self._current()
+        if version.data is None:
+            return False
+        last_close = datetime.combine(last_trading_day(), dt_time(MARKET_CLOSE_UTC_HOUR), tzinfo=timezone.utc)
+        return version.built_at >= last_close.timestamp()
+
+    def covers(self, symbols: List[str]) -> bool:
+        columns = self._current().columns
+        return self.is_current() and all(symbol in columns for symbol in symbols)
+
+    def closes(self, symbols: Optional[List[str]] = None, days: Optional[int] = None) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+        """Trailing window of closes (dates x symbols).
+
+        The full-width window is a view of the mapped file; selecting a subset
+        of symbols is a view when they are adjacent columns and a gather of
+        only those columns otherwise. A symbol's closes are NaN before its
+        first and after its last bar.
+        """
+        version = self._current()
+        plane = version.data[CLOSE]
+        start = 0 if days is None else max(len(version.dates) - days, 0)
+        window = plane[start:]
+        if symbols is not None:
+            cols = [version.columns[symbol] for symbol in symbols]
+            if cols and cols == list(range(cols[0], cols[0] + len(cols))):
+                window = window[:, cols[0]:cols[0] + len(cols)]
+            else:
+                window = window[:, cols]
+        return version.dates[start:], window
+
+    def frame(self, symbol: str, days: Optional[int] = None) -> pd.DataFrame:
+        """OHLCV frame for one symbol whose columns are views of the mapped file"""
+        version = self._current()
+        col = version.columns[symbol]
+        start = version.first_valid[symbol]
+        end = version.last_valid[symbol] + 1
+        if days is not None:
+            start = max(start, end - days)
+        block = version.data[:, start:end, col]
+        df = pd.DataFrame(
+            {field: block[i] for i, field in enumerate(BAR_COLUMNS)},
+            index=version.dates[start:end],
+            copy=False,
+        )
+        df.attrs["status"] = "ok"
+        return df
+
+    def returns(self, symbols: List[str], days: int) -> pd.DataFrame:
+        """Daily simple returns over the last `days` bars, rows with gaps dropped"""
+        dates, closes = self.closes(symbols, days + 1)
+        returns = np.diff(closes, axis=0) / closes[:-1]
+        valid = ~np.isnan(returns).any(axis=1)
+        return pd.DataFrame(returns[valid], index=dates[1:][valid], columns=symbols)
+
+    def write(self, frames: Dict[str, pd.DataFrame]):
+        """Align per-symbol OHLCV frames on a shared calendar and publish them"""
+        frames = {symbol: df for symbol, df in frames.items() if not df.empty}
+        if not frames:
+            return
+        symbols = sorted(frames)
+        dates = pd.DatetimeIndex(sorted(set().union(*(df.index for df in frames.values()))))
+        if len(dates) > PRICE_MATRIX_MAX_DAYS:
+            dates = dates[-PRICE_MATRIX_MAX_DAYS:]
+
+        os.makedirs(self.directory, exist_ok=True)
+        data_file = f"bars-{int(time.time() * 1000)}-{os.getpid()}.npy"
+        data_path = os.path.join(self.directory, data_file)
+        data = np.lib.format.open_memmap(
+            data_path, mode='w+', dtype=PRICE_MATRIX_DTYPE, shape=(len(BAR_COLUMNS), len(dates), len(symbols))
+        )
+        first_valid, last_valid = {}, {}
+        for col, symbol in enumerate(symbols):
+            # Forward-fill gaps inside a symbol's history only: dates before its first bar and
+            # after its last (delisted or halted) stay NaN rather than repeating a flat price
+            bars = frames[symbol][BAR_COLUMNS]
+            aligned = bars.reindex(dates).ffill()
+            aligned.loc[aligned.index > bars.index.max()] = np.nan
+            data[:, :, col] = aligned.to_numpy().T
+            valid = np.flatnonzero(~np.isnan(data[CLOSE, :, col]))
+            first_valid[symbol] = int(valid[0]) if valid.size else len(dates)
+            last_valid[symbol] = int(valid[-1]) if valid.size else -1
+        data.flush()
+        del data
+
+        index = {
+            "data_file": data_file,
+            "symbols": symbols,
+            "dates": [d.strftime('%Y-%m-%d') for d in dates],
+            "first_valid": first_valid,
+            "last_valid": last_valid,
+            "built_at": time.time(),
+        }
+        tmp_path = os.path.join(self.directory, f"{INDEX_FILE}.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, os.path.join(self.directory, INDEX_FILE))
+
+        # Readers that still map an older file keep it alive until they reload
+        for old_path in glob.glob(os.path.join(self.directory, "bars-*.npy")):
+            if os.path.basename(old_path) != data_file:
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+
+    def rebuild(self, analytics, symbols: List[str]) -> List[str]:
+        """Refresh bars for symbols through PortfolioAnalytics and republish the matrix.
+
+        Symbols whose bars are stale or missing are left out, so covers() is
+        false for them and readers keep fetching until a later rebuild.
+        Returns the symbols written.
+        """
+        frames = {symbol: analytics.get_historical_data(symbol, PRICE_MATRIX_MAX_DAYS, Priority.BACKGROUND) for symbol in symbols}
+        frames = {symbol: df for symbol, df in frames.items() if df.attrs.get("status") == "ok" and not df.empty}
+        self.write(frames)
+        return sorted(frames)
+
+
+# Shared by every PortfolioAnalytics instance in the process
+default_price_matrix = PriceMatrix()
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+    from models import Holding
+    from portfolio_analytics import PortfolioAnalytics
+
+    symbols = sys.argv[1:]
+    if not symbols:
+        db = SessionLocal()
+        try:
+            symbols = [row[0] for row in db.query(Holding.symbol).distinct()]
+        finally:
+            db.close()
+    written = default_price_matrix.rebuild(PortfolioAnalytics(price_matrix=default_price_matrix), symbols)
+    print(f"Price matrix built for {len(written)} of {len(symbols)} symbols in {PRICE_MATRIX_DIR}")
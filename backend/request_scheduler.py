@@ -0,0 +1,221 @@
+import os
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ALPHA_VANTAGE_CALLS_PER_MINUTE = int(os.getenv("ALPHA_VANTAGE_CALLS_PER_MINUTE", "5"))
+ALPHA_VANTAGE_CALLS_PER_DAY = int(os.getenv("ALPHA_VANTAGE_CALLS_PER_DAY", "500"))
+# Seconds a caller waits for quota before it gets a "limited" answer, per priority
+INTERACTIVE_WAIT_SECONDS = float(os.getenv("INTERACTIVE_WAIT_SECONDS", "2"))
+BACKGROUND_WAIT_SECONDS = float(os.getenv("BACKGROUND_WAIT_SECONDS", "60"))
+BATCH_WAIT_SECONDS = float(os.getenv("BATCH_WAIT_SECONDS", "900"))
+ASYNC_POLL_SECONDS = 0.05
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    BACKGROUND = 1
+    BATCH = 2
+
+
+DEFAULT_WAITS = {
+    Priority.INTERACTIVE: INTERACTIVE_WAIT_SECONDS,
+    Priority.BACKGROUND: BACKGROUND_WAIT_SECONDS,
+    Priority.BATCH: BATCH_WAIT_SECONDS,
+}
+
+
+class RateLimited(Exception):
+    """Upstream quota is exhausted for longer than the caller is willing to wait"""
+
+
+class TokenBucket:
+    def __init__(self, capacity: int, period: float):
+        self.capacity = float(capacity)
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until one token is available"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def drain(self, seconds: float):
+        """Empty the bucket so the next token appears after `seconds`"""
+        self.tokens = min(self.tokens, 1 - seconds * self.rate)
+
+
+class RequestScheduler:
+    """Shared upstream budget for the market data provider.
+
+    Callers take one token per upstream request from per-minute and per-day
+    buckets; waiting callers are served strictly by priority, so interactive
+    quotes overtake background refreshes and batch training. Identical
+    requests that are already in flight are coalesced onto one result.
+    Thread-safe, with async wrappers for the event loop.
+    """
+
+    def __init__(self, per_minute: int = ALPHA_VANTAGE_CALLS_PER_MINUTE, per_day: int = ALPHA_VANTAGE_CALLS_PER_DAY):
+        self._buckets = []
+        if per_minute > 0:
+            self._buckets.append(TokenBucket(per_minute, 60))
+        if per_day > 0:
+            self._buckets.append(TokenBucket(per_day, 86400))
+        self._cond = threading.Condition()
+        self._waiters = []
+        self._seq = itertools.count()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._in_flight_lock = threading.Lock()
+        self.stats = {"granted": 0, "limited": 0, "coalesced": 0, "quota_errors": 0}
+
+    def _try_take(self, entry, now: float) -> float:
+        """Grant a token to entry if it is first in line; otherwise seconds to wait (inf if not first)"""
+        if self._waiters[0] != entry:
+            return float("inf")
+        wait = max((bucket.wait_time(now) for bucket in self._buckets), default=0.0)
+        if wait <= 0:
+            for bucket in self._buckets:
+                bucket.take()
+            self.stats["granted"] += 1
+        return wait
+
+    def _leave(self, entry):
+        self._waiters.remove(entry)
+        heapq.heapify(self._waiters)
+        self._cond.notify_all()
+
+    def _limited(self, priority: Priority) -> RateLimited:
+        self.stats["limited"] += 1
+        return RateLimited(f"Market data quota exhausted (priority {priority.name.lower()})")
+
+    def acquire(self, priority: Priority = Priority.INTERACTIVE, timeout: Optional[float] = None):
+        """Block until a token is granted; raise RateLimited if that takes longer than timeout"""
+        deadline = time.monotonic() + (DEFAULT_WAITS[priority] if timeout is None else timeout)
+        entry = (int(priority), next(self._seq))
+
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = self._try_take(entry, now)
+                    if wait <= 0:
+                        return
+                    remaining = deadline - now
+                    if remaining <= 0 or wait != float("inf") and wait > remaining:
+                        raise self._limited(priority)
+                    self._cond.wait(min(wait, remaining))
+            finally:
+                self._leave(entry)
+
+    async def aacquire(self, priority: Priority = Priority.INTERACTIVE, timeout: Optional[float] = None):
+        """Event-loop version of acquire; polls instead of parking a thread per waiter"""
+        deadline = time.monotonic() + (DEFAULT_WAITS[priority] if timeout is None else timeout)
+        entry = (int(priority), next(self._seq))
+
+        with self._cond:
+            heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                now = time.monotonic()
+                with self._cond:
+                    wait = self._try_take(entry, now)
+                if wait <= 0:
+                    return
+                remaining = deadline - now
+                if remaining <= 0 or wait != float("inf") and wait > remaining:
+                    raise self._limited(priority)
+                await asyncio.sleep(min(wait, remaining, ASYNC_POLL_SECONDS))
+        finally:
+            with self._cond:
+                self._leave(entry)
+
+    def report_quota_exceeded(self, retry_after: float = 60.0):
+        """Provider rejected a call for quota; stop spending tokens for retry_after seconds"""
+        with self._cond:
+            for bucket in self._buckets:
+                bucket.drain(retry_after)
+            self.stats["quota_errors"] += 1
+
+    def _join(self, key: Hashable):
+        with self._in_flight_lock:
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future, False
+            future = Future()
+            self._in_flight[key] = future
+            return future, True
+
+    def _finish(self, key: Hashable, future: Future, result: Any = None, error: Optional[BaseException] = None):
+        with self._in_flight_lock:
+            self._in_flight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def coalesce(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        """Run fn once for all concurrent callers with the same key"""
+        future, owner = self._join(key)
+        if not owner:
+            return future.result()
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def acoalesce(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future, owner = self._join(key)
+        if not owner:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def get_stats(self) -> Dict:
+        with self._cond:
+            now = time.monotonic()
+            tokens = []
+            for bucket in self._buckets:
+                bucket.wait_time(now)
+                tokens.append(round(bucket.tokens, 2))
+            waiting = len(self._waiters)
+        return {**self.stats, "waiting": waiting, "tokens": tokens, "in_flight": len(self._in_flight)}
+
+
+class NoQuotaScheduler(RequestScheduler):
+    """Grants no provider calls, for processes that must only compute on data fetched elsewhere"""
+
+    def acquire(self, priority: Priority = Priority.INTERACTIVE, timeout: Optional[float] = None):
+        raise self._limited(priority)
+
+    async def aacquire(self, priority: Priority = Priority.INTERACTIVE, timeout: Optional[float] = None):
+        raise self._limited(priority)
+
+
+# One budget per process; size the quotas per worker when running several
+default_scheduler = RequestScheduler()
@@ -0,0 +1,88 @@
+import sys
+import asyncio
+from typing import Dict, List, Optional
+from sqlalchemy import bindparam, case, func, literal, select, update
+from sqlalchemy.orm import Session
+
+from analytics_cache import default_analytics_cache
+from models import Holding, Portfolio
+from portfolio_analytics import PortfolioAnalytics
+from request_scheduler import Priority
+
+holdings_table = Holding.__table__
+portfolios_table = Portfolio.__table__
+
+
+def holding_symbols(db: Session, portfolio_ids: Optional[List[int]] = None) -> List[str]:
+    """Distinct symbols held across the given portfolios (all portfolios if None)"""
+    query = select(holdings_table.c.symbol).distinct()
+    if portfolio_ids is not None:
+        query = query.where(holdings_table.c.portfolio_id.in_(portfolio_ids))
+    return [row[0] for row in db.execute(query)]
+
+
+def apply_prices(db: Session, prices: Dict[str, float], portfolio_ids: Optional[List[int]] = None) -> int:
+    """Reprice every matching holding with one executemany UPDATE, then roll up portfolio totals"""
+    if not prices:
+        return 0
+
+    price = bindparam("new_price")
+    stmt = (
+        update(holdings_table)
+        .where(holdings_table.c.symbol == bindparam("match_symbol"))
+        .values(
+            current_price=price,
+            market_value=holdings_table.c.shares * price,
+            gain_loss=(price - holdings_table.c.average_price) * holdings_table.c.shares,
+            gain_loss_percent=case(
+                (holdings_table.c.average_price > 0,
+                 (price - holdings_table.c.average_price) / holdings_table.c.average_price * 100),
+                else_=0,
+            ),
+        )
+    )
+    if portfolio_ids is not None:
+        # Plain binds rather than an expanding IN, which executemany cannot take
+        stmt = stmt.where(holdings_table.c.portfolio_id.in_([literal(pid) for pid in portfolio_ids]))
+    result = db.execute(stmt, [{"match_symbol": symbol, "new_price": p} for symbol, p in prices.items()])
+
+    total = (
+        select(func.coalesce(func.sum(holdings_table.c.market_value), 0.0))
+        .where(holdings_table.c.portfolio_id == portfolios_table.c.id)
+        .scalar_subquery()
+    )
+    totals = update(portfolios_table).values(total_value=total)
+    if portfolio_ids is not None:
+        totals = totals.where(portfolios_table.c.id.in_(portfolio_ids))
+    db.execute(totals)
+    db.commit()
+    default_analytics_cache.market_changed(prices)
+    return result.rowcount
+
+
+async def revalue_portfolios(db: Session, analytics: PortfolioAnalytics, portfolio_ids: Optional[List[int]] = None,
+                             priority: Priority = Priority.INTERACTIVE) -> Dict:
+    """Fetch each distinct symbol once and bulk-update the holdings of the given portfolios"""
+    symbols = await asyncio.to_thread(holding_symbols, db, portfolio_ids)
+    quotes = await analytics.aget_stock_prices(symbols, priority)
+    prices = {symbol: quote['price'] for symbol, quote in quotes.items() if quote['price'] is not None}
+    updated = await asyncio.to_thread(apply_prices, db, prices, portfolio_ids)
+    return {
+        "symbols": len(symbols),
+        "priced": len(prices),
+        "unpriced": sorted(set(symbols) - set(prices)),
+        "holdings_updated": updated,
+    }
+
+
+if __name__ == "__main__":
+    # Nightly revaluation of every portfolio: python revaluation.py [PORTFOLIO_ID...]
+    from database import SessionLocal
+
+    portfolio_ids = [int(arg) for arg in sys.argv[1:]] or None
+    db = SessionLocal()
+    try:
+        summary = asyncio.run(revalue_portfolios(db, PortfolioAnalytics(), portfolio_ids, Priority.BATCH))
+    finally:
+        db.close()
+    print(summary)
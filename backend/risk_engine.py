@@ -0,0 +1,149 @@
+import os
+import numpy as np
+import pandas as pd
+from statistics import NormalDist
+from typing import Dict, List, Optional, Sequence
+from dotenv import load_dotenv
+
+from portfolio_analytics import PortfolioAnalytics
+
+load_dotenv()
+
+RISK_BENCHMARK_SYMBOL = os.getenv("RISK_BENCHMARK_SYMBOL", "SPY")
+RISK_LOOKBACK_DAYS = int(os.getenv("RISK_LOOKBACK_DAYS", "252"))
+CONFIDENCE_LEVELS = (0.95, 0.99)
+# VaR horizons in trading days; longer horizons use square-root-of-time scaling
+VAR_HORIZONS = (1, 30)
+TRADING_DAYS = 252
+
+_normal = NormalDist()
+
+
+def _round(value, digits: int = 4):
+    return None if value is None or not np.isfinite(value) else round(float(value), digits)
+
+
+def compute_risk(returns: pd.DataFrame, weights: pd.Series, portfolio_value: float,
+                 benchmark: Optional[pd.Series] = None,
+                 confidence_levels: Sequence[float] = CONFIDENCE_LEVELS,
+                 horizons: Sequence[int] = VAR_HORIZONS) -> Dict:
+    """Portfolio risk from one aligned returns matrix (dates x symbols).
+
+    The covariance matrix is built once and every other figure (volatility,
+    parametric VaR/CVaR, marginal and component contributions, betas) is
+    derived from it with matrix products. VaR and CVaR are positive dollar
+    losses at the given confidence and horizon.
+    """
+    symbols = list(returns.columns)
+    R = returns.to_numpy(dtype=np.float64)
+    w = weights.reindex(symbols).fillna(0.0).to_numpy(dtype=np.float64)
+    T = R.shape[0]
+    if T < 2 or not symbols:
+        return {}
+
+    mean = R.mean(axis=0)
+    centered = R - mean
+    cov = centered.T @ centered / (T - 1)
+
+    port = R @ w
+    port_mean = float(mean @ w)
+    cov_w = cov @ w
+    sigma = float(np.sqrt(max(w @ cov_w, 0.0)))
+    asset_sigma = np.sqrt(np.diag(cov))
+
+    # Euler decomposition: component contributions sum to portfolio volatility
+    marginal = cov_w / sigma if sigma > 0 else np.zeros_like(w)
+    component = w * marginal
+
+    beta = correlation = None
+    asset_beta = np.full(len(symbols), np.nan)
+    if benchmark is not None:
+        b = benchmark.reindex(returns.index).to_numpy(dtype=np.float64)
+        if np.isfinite(b).all():
+            bc = b - b.mean()
+            b_var = bc @ bc / (T - 1)
+            if b_var > 0:
+                asset_beta = (centered.T @ bc) / (T - 1) / b_var
+                beta = float(w @ asset_beta)
+                port_bc = (port - port_mean) @ bc / (T - 1)
+                correlation = port_bc / (sigma * np.sqrt(b_var)) if sigma > 0 else None
+
+    var = []
+    sorted_port = np.sort(port)
+    for confidence in confidence_levels:
+        tail = 1 - confidence
+        z = _normal.inv_cdf(tail)
+        # Historical: empirical tail of the realised portfolio returns
+        cutoff = max(int(np.floor(tail * T)), 1)
+        hist_var = -np.quantile(port, tail)
+        hist_cvar = -sorted_port[:cutoff].mean()
+        for horizon in horizons:
+            scale = np.sqrt(horizon)
+            mu, sd = port_mean * horizon, sigma * scale
+            var.append({
+                "confidence": confidence,
+                "horizon_days": horizon,
+                "historical_var": _round(hist_var * scale * portfolio_value, 2),
+                "historical_cvar": _round(hist_cvar * scale * portfolio_value, 2),
+                "parametric_var": _round(-(mu + z * sd) * portfolio_value, 2),
+                "parametric_cvar": _round(-(mu - sd * _normal.pdf(z) / tail) * portfolio_value, 2),
+            })
+
+    holdings = [
+        {
+            "symbol": symbol,
+            "weight": _round(w[i]),
+            "annual_volatility": _round(asset_sigma[i] * np.sqrt(TRADING_DAYS) * 100, 2),
+            "beta": _round(asset_beta[i]),
+            "marginal_contribution": _round(marginal[i] * np.sqrt(TRADING_DAYS) * 100, 4),
+            "component_contribution": _round(component[i] * np.sqrt(TRADING_DAYS) * 100, 4),
+            "contribution_percent": _round(component[i] / sigma * 100 if sigma > 0 else 0.0, 2),
+        }
+        for i, symbol in enumerate(symbols)
+    ]
+
+    return {
+        "observations": T,
+        "daily_volatility": _round(sigma * 100, 4),
+        "annual_volatility": _round(sigma * np.sqrt(TRADING_DAYS) * 100, 2),
+        "beta": _round(beta),
+        "correlation": _round(correlation),
+        "var": var,
+        "holdings": holdings,
+    }
+
+
+class RiskEngine:
+    """Builds the returns matrix for a portfolio once and runs compute_risk on it"""
+
+    def __init__(self, analytics: Optional[PortfolioAnalytics] = None, benchmark: str = RISK_BENCHMARK_SYMBOL,
+                 lookback_days: int = RISK_LOOKBACK_DAYS):
+        self.analytics = analytics or PortfolioAnalytics()
+        self.benchmark = benchmark
+        self.lookback_days = lookback_days
+
+    def history_symbols(self, holdings: List[Dict]) -> List[str]:
+        """Symbols whose history assess needs, benchmark included"""
+        return list(dict.fromkeys([h['symbol'] for h in holdings] + [self.benchmark]))
+
+    def assess(self, holdings: List[Dict], histories: Optional[Dict[str, pd.DataFrame]] = None) -> Dict:
+        total_value = sum(h['market_value'] for h in holdings)
+        if not holdings or total_value <= 0:
+            return {}
+
+        weights = pd.Series([h['market_value'] for h in holdings], index=[h['symbol'] for h in holdings])
+        weights = weights.groupby(level=0).sum() / total_value
+
+        returns = self.analytics.get_returns(self.history_symbols(holdings), self.lookback_days, histories)
+        if returns.empty:
+            return {}
+        # A held benchmark stays in the matrix and also serves as the market series
+        market = returns[self.benchmark] if self.benchmark in returns else None
+        returns = returns[[symbol for symbol in weights.index if symbol in returns]]
+        if returns.empty:
+            return {}
+
+        report = compute_risk(returns, weights, total_value, market)
+        report["benchmark"] = self.benchmark if market is not None else None
+        report["unpriced"] = sorted(set(weights.index) - set(returns.columns))
+        return report
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, EmailStr
 from datetime import datetime
-from typing import Optional, List
+from typing import Dict, Literal, Optional, List, Union
 
 class UserBase(BaseModel):
     username: str
@@ -20,6 +20,7 @@ class User(UserBase):
 class PortfolioBase(BaseModel):
     name: str
     description: Optional[str] = None
+    cost_method: Literal["fifo", "lifo", "average"] = "average"
 
 class PortfolioCreate(PortfolioBase):
     pass
@@ -55,11 +56,27 @@ class Holding(HoldingBase):
     class Config:
         from_attributes = True
 
+class PortfolioSummary(Portfolio):
+    holdings: List[Holding]
+    holdings_count: int
+    market_value: float
+    cost_basis: float
+    total_gain_loss: float
+    total_gain_loss_percent: float
+
+class Overview(BaseModel):
+    portfolios: List[PortfolioSummary]
+    total_value: float
+    total_cost: float
+    total_gain_loss: float
+    total_gain_loss_percent: float
+
 class TransactionBase(BaseModel):
     symbol: str
-    transaction_type: str
+    transaction_type: Literal["BUY", "SELL"]
     shares: float
     price: float
+    transaction_date: Optional[datetime] = None
 
 class TransactionCreate(TransactionBase):
     portfolio_id: int
@@ -73,6 +90,68 @@ class Transaction(TransactionBase):
     class Config:
         from_attributes = True
 
+class TransactionBatch(BaseModel):
+    transactions: List[TransactionBase]
+
+class TransactionBatchResult(BaseModel):
+    recorded: int
+    transaction_ids: List[int]
+
+class QuoteBatchRequest(BaseModel):
+    symbols: List[str]
+
+class QuoteBatch(BaseModel):
+    quotes: Dict[str, Dict]
+
+class Revaluation(BaseModel):
+    symbols: int
+    priced: int
+    unpriced: List[str]
+    holdings_updated: int
+
+class BacktestRequest(BaseModel):
+    symbols: List[str]
+    strategy: str = "ma_crossover"
+    params: Dict[str, Union[int, float]] = {}
+    days: int = 2520
+    cost_bps: Optional[float] = None
+    mode: str = "vectorized"  # vectorized or event
+
+class TrainingRequest(BaseModel):
+    symbols: Optional[List[str]] = None
+    workers: Optional[int] = None
+    run_id: Optional[str] = None
+    resume: bool = True
+
+class TrainingRun(BaseModel):
+    run_id: str
+    running: bool
+    job_id: Optional[str] = None
+    counts: Dict[str, int]
+    results: List[Dict]
+
+class JobRequest(BaseModel):
+    kind: Literal["simulate", "optimize", "predict"]
+    portfolio_id: Optional[int] = None
+    symbol: Optional[str] = None
+    # simulate
+    days: int = 252
+    paths: int = 10000
+    seed: Optional[int] = None
+    # optimize
+    target: str = "max_sharpe"
+    max_weight: float = 1.0
+    points: int = 50
+
+class Job(BaseModel):
+    id: str
+    kind: str
+    status: str  # queued, running, succeeded, failed or cancelled
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
 class Token(BaseModel):
     access_token: str
     token_type: str
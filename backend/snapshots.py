@@ -0,0 +1,229 @@
+import os
+import sys
+import logging
+import numpy as np
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from analytics_cache import default_analytics_cache
+from instrumentation import count_error
+from ledger import SHARE_EPSILON, LedgerError, default_ledger
+from models import DailyBar, Holding, Portfolio, PortfolioSnapshot, Transaction
+from bar_store import last_trading_day
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Stored observations needed before analytics are served from snapshots
+SNAPSHOT_MIN_DAYS = int(os.getenv("SNAPSHOT_MIN_DAYS", "20"))
+TRADING_DAYS = 252
+
+
+def closing_prices(db: Session, symbols: List[str], as_of: date) -> Dict[str, float]:
+    """Latest stored close on or before as_of for each symbol, in one query"""
+    if not symbols:
+        return {}
+    latest = (
+        select(DailyBar.symbol, func.max(DailyBar.date).label("date"))
+        .where(DailyBar.symbol.in_(symbols), DailyBar.date <= as_of)
+        .group_by(DailyBar.symbol)
+        .subquery()
+    )
+    rows = db.execute(
+        select(DailyBar.symbol, DailyBar.close)
+        .join(latest, (DailyBar.symbol == latest.c.symbol) & (DailyBar.date == latest.c.date))
+    )
+    return {symbol: close for symbol, close in rows}
+
+
+def _previous_snapshots(db: Session, portfolio_ids: List[int], as_of: date) -> Dict[int, PortfolioSnapshot]:
+    latest = (
+        select(PortfolioSnapshot.portfolio_id, func.max(PortfolioSnapshot.date).label("date"))
+        .where(PortfolioSnapshot.portfolio_id.in_(portfolio_ids), PortfolioSnapshot.date < as_of)
+        .group_by(PortfolioSnapshot.portfolio_id)
+        .subquery()
+    )
+    rows = db.scalars(
+        select(PortfolioSnapshot).join(
+            latest,
+            (PortfolioSnapshot.portfolio_id == latest.c.portfolio_id) & (PortfolioSnapshot.date == latest.c.date),
+        )
+    )
+    return {snapshot.portfolio_id: snapshot for snapshot in rows}
+
+
+def _day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def _utc_naive(when: datetime) -> datetime:
+    return when.astimezone(timezone.utc).replace(tzinfo=None) if when.tzinfo is not None else when
+
+
+def net_flows(db: Session, previous: Dict[int, PortfolioSnapshot], as_of: date) -> Dict[int, float]:
+    """Money put into each portfolio since its previous snapshot: buy amounts minus sell proceeds, from the ledger"""
+    if not previous:
+        return {}
+    starts = {portfolio_id: _day_start(snapshot.date + timedelta(days=1)) for portfolio_id, snapshot in previous.items()}
+    end = _day_start(as_of + timedelta(days=1))
+    rows = db.execute(
+        select(Transaction.portfolio_id, Transaction.transaction_type, Transaction.total_amount, Transaction.transaction_date)
+        .where(Transaction.portfolio_id.in_(list(previous)),
+               Transaction.transaction_date >= min(starts.values()), Transaction.transaction_date < end)
+    )
+    flows: Dict[int, float] = {}
+    for portfolio_id, transaction_type, amount, when in rows:
+        when = _utc_naive(when)
+        if when < starts[portfolio_id] or when >= end:
+            continue
+        flow = (amount or 0.0) if transaction_type == "BUY" else -(amount or 0.0)
+        flows[portfolio_id] = flows.get(portfolio_id, 0.0) + flow
+    return flows
+
+
+def _positions(db: Session, portfolio_ids: List[int], as_of: date) -> Dict[int, Dict[str, Tuple[float, float, float]]]:
+    """(shares, cost, fallback price) per symbol held by each portfolio at the close of as_of.
+
+    Portfolios traded after as_of are replayed from the ledger up to that
+    day; the others are read from their current holdings.
+    """
+    end = _day_start(as_of + timedelta(days=1))
+    rows = db.execute(
+        select(Transaction.portfolio_id, Transaction.transaction_date)
+        .where(Transaction.portfolio_id.in_(portfolio_ids), Transaction.transaction_date >= _day_start(as_of))
+    )
+    traded_since = {portfolio_id for portfolio_id, when in rows if _utc_naive(when) >= end}
+
+    positions: Dict[int, Dict[str, Tuple[float, float, float]]] = {portfolio_id: {} for portfolio_id in portfolio_ids}
+    current_prices: Dict[str, float] = {}
+    for h in db.execute(select(Holding.portfolio_id, Holding.symbol, Holding.shares, Holding.average_price, Holding.current_price)
+                        .where(Holding.portfolio_id.in_(portfolio_ids))):
+        current_prices[h.symbol] = h.current_price or current_prices.get(h.symbol, 0.0)
+        if h.portfolio_id not in traded_since:
+            positions[h.portfolio_id][h.symbol] = (h.shares, h.shares * h.average_price, h.current_price or 0.0)
+
+    for portfolio_id in traded_since:
+        try:
+            replayed = default_ledger.positions_at(db, portfolio_id, end)
+        except LedgerError as e:
+            logger.warning("Cannot replay portfolio %s to %s, skipping its snapshot: %s", portfolio_id, as_of, e)
+            count_error("snapshots", e)
+            del positions[portfolio_id]
+            continue
+        positions[portfolio_id] = {
+            symbol: (position.shares, position.cost, current_prices.get(symbol, 0.0))
+            for symbol, position in replayed.items() if position.shares > SHARE_EPSILON
+        }
+    return positions
+
+
+def take_snapshots(db: Session, as_of: Optional[date] = None, portfolio_ids: Optional[List[int]] = None) -> int:
+    """Write one snapshot per portfolio for as_of (default: the last trading day).
+
+    Holdings are those at the close of as_of, so past days can be
+    backfilled; portfolios holding nothing get a zero-value row. Values use
+    stored closes for the day, falling back to each holding's current price.
+    Each row only needs the previous snapshot and the day's transactions, so
+    the job is incremental; rerunning it for the same day replaces that day's rows.
+    """
+    as_of = as_of or last_trading_day()
+    query = select(Portfolio.id)
+    if portfolio_ids is not None:
+        query = query.where(Portfolio.id.in_(portfolio_ids))
+    ids = list(db.scalars(query))
+    if not ids:
+        return 0
+
+    positions = _positions(db, ids, as_of)
+    prices = closing_prices(db, list({symbol for held in positions.values() for symbol in held}), as_of)
+    values: Dict[int, float] = {}
+    costs: Dict[int, float] = {}
+    for portfolio_id, held in positions.items():
+        values[portfolio_id] = sum(shares * (prices.get(symbol, fallback) or 0.0) for symbol, (shares, _, fallback) in held.items())
+        costs[portfolio_id] = sum(cost for _, cost, _ in held.values())
+
+    ids = list(values)
+    if not ids:
+        return 0
+    previous = _previous_snapshots(db, ids, as_of)
+    flows = net_flows(db, previous, as_of)
+    rows = []
+    for portfolio_id in ids:
+        value, cost = values[portfolio_id], costs[portfolio_id]
+        prev = previous.get(portfolio_id)
+        daily_return = None
+        if prev is not None and prev.total_value > 0:
+            # Return since the previous snapshot, net of money added: sells count at their proceeds, not their cost
+            daily_return = (value - flows.get(portfolio_id, 0.0)) / prev.total_value - 1
+        return_index = prev.return_index * (1 + daily_return) if daily_return is not None else (
+            prev.return_index if prev is not None else 1.0)
+        peak_index = max(prev.peak_index, return_index) if prev is not None else return_index
+        rows.append({
+            "portfolio_id": portfolio_id,
+            "date": as_of,
+            "total_value": value,
+            "cost_basis": cost,
+            "daily_return": daily_return,
+            "return_index": return_index,
+            "peak_index": peak_index,
+            "drawdown": return_index / peak_index - 1 if peak_index > 0 else 0.0,
+        })
+
+    db.execute(delete(PortfolioSnapshot).where(PortfolioSnapshot.portfolio_id.in_(ids), PortfolioSnapshot.date == as_of))
+    db.execute(insert(PortfolioSnapshot), rows)
+    db.commit()
+    # Analytics metrics are served from snapshots
+    default_analytics_cache.market_changed()
+    return len(rows)
+
+
+def snapshot_series(db: Session, portfolio_id: int, days: int = TRADING_DAYS) -> List:
+    """Latest snapshots for a portfolio, oldest first; one range scan of the (portfolio_id, date) index"""
+    rows = db.execute(
+        select(PortfolioSnapshot.date, PortfolioSnapshot.total_value, PortfolioSnapshot.cost_basis,
+               PortfolioSnapshot.daily_return, PortfolioSnapshot.return_index, PortfolioSnapshot.drawdown)
+        .where(PortfolioSnapshot.portfolio_id == portfolio_id)
+        .order_by(PortfolioSnapshot.date.desc())
+        .limit(days + 1)
+    ).all()
+    return rows[::-1]
+
+
+def snapshot_metrics(db: Session, portfolio_id: int, days: int = TRADING_DAYS) -> Optional[Dict]:
+    """The calculate_portfolio_metrics figures from stored snapshots, or None if too few are stored"""
+    rows = snapshot_series(db, portfolio_id, days)
+    returns = np.array([row.daily_return for row in rows[1:] if row.daily_return is not None])
+    if len(returns) < SNAPSHOT_MIN_DAYS:
+        return None
+
+    index = np.array([row.return_index for row in rows])
+    annual_return = returns.mean() * TRADING_DAYS
+    annual_volatility = returns.std(ddof=1) * np.sqrt(TRADING_DAYS)
+    sharpe_ratio = annual_return / annual_volatility if annual_volatility != 0 else 0
+    max_drawdown = (index / np.maximum.accumulate(index) - 1).min()
+
+    return {
+        "annual_return": round(float(annual_return) * 100, 2),
+        "annual_volatility": round(float(annual_volatility) * 100, 2),
+        "sharpe_ratio": round(float(sharpe_ratio), 2),
+        "max_drawdown": round(float(max_drawdown) * 100, 2),
+        "total_return": round(float(returns.sum()) * 100, 2),
+        "as_of": rows[-1].date.isoformat(),
+        "source": "snapshots",
+    }
+
+
+if __name__ == "__main__":
+    # Daily snapshot job: python snapshots.py [YYYY-MM-DD]
+    from database import SessionLocal
+
+    as_of = date.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else None
+    db = SessionLocal()
+    try:
+        print(f"Wrote {take_snapshots(db, as_of)} portfolio snapshots")
+    finally:
+        db.close()
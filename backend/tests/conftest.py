@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The app reads its settings at import; point everything at a scratch directory
+# before any backend module is imported, whatever the developer's .env says
+_workdir = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.update({
+    "DATABASE_URL": f"sqlite:///{os.path.join(_workdir, 'test.db')}",
+    "JWT_SECRET_KEY": "test",
+    "ALPHA_VANTAGE_API_KEY": "test",
+    "MARKET_REFRESH_ENABLED": "false",
+    "MARKET_CACHE_DIR": os.path.join(_workdir, "market_cache"),
+    "PRICE_MATRIX_DIR": os.path.join(_workdir, "price_matrix"),
+    "MODEL_DIR": os.path.join(_workdir, "models"),
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db():
+    """A session on a freshly created schema, dropped after the test"""
+    from database import SessionLocal, engine
+    from models import Base
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
+
+
+@pytest.fixture
+def portfolio(db):
+    from models import Portfolio, User
+
+    user = User(username="tester", email="tester@example.com", hashed_password="x")
+    db.add(user)
+    db.flush()
+    portfolio = Portfolio(name="Test", description="", user_id=user.id, total_value=0.0)
+    db.add(portfolio)
+    db.commit()
+    return portfolio
@@ -0,0 +1,39 @@
+import pytest
+from fastapi import HTTPException
+
+import auth
+from models import User
+
+
+@pytest.fixture
+def user(db):
+    user = User(username="alice", email="alice@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    auth.invalidate_principal("alice")
+    yield user
+    auth.invalidate_principal("alice")
+
+
+def test_principal_is_a_read_only_copy_shared_through_the_cache(db, user):
+    token = auth.create_access_token({"sub": "alice"})
+    first = auth.get_current_user(token)
+    second = auth.get_current_user(token)
+    assert (first.id, first.username, first.is_admin) == (user.id, "alice", False)
+    assert second is first
+    with pytest.raises(AttributeError):
+        first.username = "mallory"
+
+
+def test_get_current_user_leaves_the_handler_session_open(db, user):
+    token = auth.create_access_token({"sub": "alice"})
+    auth.get_current_user(token)
+    # The handler's session keeps its identity map and can still lazy-load
+    assert db.get(User, user.id).portfolios == []
+
+
+def test_admin_check_uses_the_cached_flag(db, user):
+    principal = auth.get_current_user(auth.create_access_token({"sub": "alice"}))
+    with pytest.raises(HTTPException) as excinfo:
+        auth.require_admin(principal)
+    assert excinfo.value.status_code == 403
@@ -0,0 +1,24 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from bar_encoding import columnar_json, ndjson_lines
+
+
+def frame():
+    return pd.DataFrame(
+        {"close": [1.5, np.nan, np.inf, -np.inf]},
+        index=pd.to_datetime(["2026-10-12", "2026-10-13", "2026-10-14", "2026-10-15"]),
+    )
+
+
+def test_ndjson_writes_non_finite_values_as_null():
+    lines = b"".join(ndjson_lines(frame(), block_rows=3)).decode().splitlines()
+    assert [json.loads(line)["close"] for line in lines] == [1.5, None, None, None]
+
+
+def test_columnar_writes_non_finite_values_as_null():
+    payload = json.loads(columnar_json({"symbol": "X"}, frame()))
+    assert payload["close"] == [1.5, None, None, None]
+    assert payload["dates"][0] == "2026-10-12"
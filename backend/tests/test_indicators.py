@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import FEATURE_COLUMNS, WARMUP_BARS, IndicatorBook, IndicatorState, feature_frame
+
+
+@pytest.fixture
+def bars():
+    rng = np.random.default_rng(7)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 400)))
+    open_ = close * (1 + rng.normal(0, 0.005, 400))
+    return pd.DataFrame({
+        "open": open_,
+        "high": np.maximum(open_, close) * 1.01,
+        "low": np.minimum(open_, close) * 0.99,
+        "close": close,
+        "volume": rng.integers(1_000, 10_000, 400).astype(float),
+    }, index=pd.bdate_range("2025-01-01", periods=400))
+
+
+def test_incremental_rsi_matches_batch_on_every_bar(bars):
+    batch = feature_frame(bars)["rsi"].to_numpy()
+    state = IndicatorState()
+    incremental = []
+    # 400 bars also crosses a RESYNC_EVERY boundary
+    for row in bars.itertuples():
+        features = state.update(row.open, row.high, row.low, row.close, row.volume, row.Index)
+        incremental.append(np.nan if features is None else features["rsi"])
+
+    incremental = np.array(incremental)
+    assert np.isnan(incremental[:WARMUP_BARS - 1]).all()
+    np.testing.assert_allclose(incremental[WARMUP_BARS - 1:], batch[WARMUP_BARS - 1:], rtol=1e-9)
+
+
+def test_book_advanced_by_new_bars_matches_batch_features(bars):
+    book = IndicatorBook()
+    book.advance("AAPL", bars.iloc[:200])
+    state = book.advance("AAPL", bars.iloc[100:])
+    assert state.last_date == bars.index[-1]
+    expected = feature_frame(bars)[FEATURE_COLUMNS].iloc[[-1]]
+    np.testing.assert_allclose(state.row().to_numpy(), expected.to_numpy(), rtol=1e-9)
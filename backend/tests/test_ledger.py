@@ -0,0 +1,115 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+
+from ledger import Ledger, LedgerConflict, LedgerError, replay
+from models import Holding, Portfolio, Transaction
+
+T0 = datetime(2026, 1, 5, 15, 0)
+
+
+def tx(kind, shares, price, day, symbol="AAPL"):
+    return {"symbol": symbol, "transaction_type": kind, "shares": shares, "price": price,
+            "transaction_date": T0 + timedelta(days=day)}
+
+
+TRADES = [tx("BUY", 10, 100.0, 0), tx("BUY", 10, 120.0, 1), tx("SELL", 15, 130.0, 2)]
+
+
+@pytest.mark.parametrize("method, lots, realized", [
+    # First lot closed, 5 of the second sold: 10 x 30 + 5 x 10
+    ("fifo", [(5, 120.0)], 350.0),
+    # Second lot closed, 5 of the first sold: 10 x 10 + 5 x 30
+    ("lifo", [(5, 100.0)], 250.0),
+    # One pooled lot at 110: 15 x 20
+    ("average", [(5, 110.0)], 300.0),
+])
+def test_lot_matching_per_cost_method(method, lots, realized):
+    position = replay(TRADES, method)["AAPL"]
+    assert [(lot.shares, lot.price) for lot in position.lots] == pytest.approx(lots)
+    assert position.realized_gain == pytest.approx(realized)
+    assert position.shares == pytest.approx(5)
+
+
+def test_replay_rejects_an_oversell():
+    with pytest.raises(LedgerError, match="only 10 held"):
+        replay([tx("BUY", 10, 100.0, 0), tx("SELL", 11, 100.0, 1)])
+
+
+def test_record_rejects_an_oversell_and_writes_nothing(db, portfolio):
+    ledger = Ledger()
+    ledger.record(db, portfolio.id, [tx("BUY", 10, 100.0, 0)])
+    with pytest.raises(LedgerError):
+        ledger.record(db, portfolio.id, [tx("SELL", 4, 110.0, 1), tx("SELL", 7, 110.0, 2)])
+
+    assert db.scalars(select(Transaction.transaction_type)).all() == ["BUY"]
+    assert db.scalars(select(Holding.shares)).all() == [10]
+    assert db.get(Portfolio, portfolio.id).ledger_version == 1
+
+
+def test_record_bumps_the_ledger_version(db, portfolio):
+    ledger = Ledger()
+    ledger.record(db, portfolio.id, [tx("BUY", 10, 100.0, 0)])
+    ledger.record(db, portfolio.id, [tx("SELL", 5, 110.0, 1)])
+    assert db.get(Portfolio, portfolio.id).ledger_version == 2
+
+
+def test_bump_version_fails_against_a_stale_version(db, portfolio):
+    assert not Ledger._bump_version(db, portfolio.id, 5)
+    assert Ledger._bump_version(db, portfolio.id, 0)
+    assert not Ledger._bump_version(db, portfolio.id, 0)
+
+
+def test_claim_retries_a_lost_compare_and_set(db, portfolio, monkeypatch):
+    outcomes = iter([False, True])
+    monkeypatch.setattr(Ledger, "_bump_version", staticmethod(lambda db, pid, version: next(outcomes)))
+    assert Ledger(max_retries=2).claim(db, portfolio.id) == "average"
+
+
+def test_claim_gives_up_after_max_retries(db, portfolio, monkeypatch):
+    attempts = []
+    monkeypatch.setattr(Ledger, "_bump_version", staticmethod(lambda db, pid, version: attempts.append(version)))
+    with pytest.raises(LedgerConflict):
+        Ledger(max_retries=3).claim(db, portfolio.id)
+    assert len(attempts) == 3
+
+
+def test_legacy_holding_gets_an_opening_buy_before_its_first_sale(db, portfolio):
+    db.add(Holding(portfolio_id=portfolio.id, symbol="AAPL", company_name="Apple", shares=10,
+                   average_price=100.0, current_price=100.0, created_at=T0 - timedelta(days=30)))
+    db.commit()
+
+    Ledger().record(db, portfolio.id, [tx("SELL", 4, 130.0, 0)])
+
+    rows = db.execute(select(Transaction.transaction_type, Transaction.shares, Transaction.price)
+                      .order_by(Transaction.transaction_date)).all()
+    assert [tuple(row) for row in rows] == [("BUY", 10, 100.0), ("SELL", 4, 130.0)]
+    holding = db.scalars(select(Holding)).one()
+    assert (holding.shares, holding.average_price) == (6, 100.0)
+
+
+def test_rebuild_reconciles_only_the_shares_the_ledger_misses(db, portfolio):
+    ledger = Ledger()
+    ledger.record(db, portfolio.id, [tx("BUY", 5, 100.0, 0)])
+    # Edited outside the ledger: 5 more shares than its transactions explain
+    db.scalars(select(Holding)).one().shares = 10
+    db.commit()
+
+    ledger.rebuild(db, portfolio.id)
+    ledger.rebuild(db, portfolio.id)
+
+    buys = db.scalars(select(Transaction.shares).where(Transaction.transaction_type == "BUY")
+                      .order_by(Transaction.transaction_date)).all()
+    assert buys == [5, 5]
+    assert db.scalars(select(Holding.shares)).all() == [10]
+
+
+def test_rebuild_switches_the_cost_method(db, portfolio):
+    ledger = Ledger()
+    ledger.record(db, portfolio.id, TRADES)
+    ledger.rebuild(db, portfolio.id, "fifo")
+    assert db.get(Portfolio, portfolio.id).cost_method == "fifo"
+    assert db.scalars(select(Holding.average_price)).one() == pytest.approx(120.0)
+    with pytest.raises(LedgerError):
+        ledger.rebuild(db, portfolio.id, "hifo")
@@ -0,0 +1,47 @@
+import threading
+import time
+
+from market_cache import CacheStats, FileStore, LRUCache, MarketDataCache
+
+
+def test_expired_entry_counts_as_expiration_and_stays_available_stale():
+    cache = LRUCache(10)
+    cache.set("a", 1, time.time() - 1)
+    assert cache.get("a") == (False, None)
+    assert cache.stats.expirations == 1
+    assert cache.get("a", allow_stale=True) == (True, 1)
+    assert cache.stats.expirations == 1
+
+
+def test_evictions_are_counted():
+    cache = LRUCache(2)
+    for key in "abc":
+        cache.set(key, key, time.time() + 60)
+    assert cache.stats.evictions == 1
+    assert cache.get("a") == (False, None)
+
+
+def test_two_tier_expiry_is_counted_once(tmp_path):
+    cache = MarketDataCache(persistent=FileStore(str(tmp_path)), ttls={"quote": -1})
+    cache.set("quote", "AAPL", {"price": 1.0})
+    assert cache.get("quote", "AAPL") == (False, None)
+    stats = cache.get_stats()
+    assert stats["expirations"] == 1
+    assert stats["misses"] == 1
+
+
+def test_concurrent_updates_are_not_lost():
+    stats = CacheStats()
+
+    def hammer():
+        for _ in range(10000):
+            stats.record("hits")
+            stats.record("misses")
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert stats.as_dict()["hits"] == 80000
+    assert stats.as_dict()["hit_rate"] == 0.5
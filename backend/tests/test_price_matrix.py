@@ -0,0 +1,56 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from bar_store import BAR_COLUMNS
+from price_matrix import PriceMatrix
+
+
+def bars(dates, closes):
+    df = pd.DataFrame({field: closes for field in BAR_COLUMNS}, index=pd.to_datetime(dates), dtype=float)
+    df.attrs["status"] = "ok"
+    return df
+
+
+def test_gaps_are_filled_only_inside_a_symbols_history(tmp_path):
+    matrix = PriceMatrix(str(tmp_path))
+    matrix.write({
+        "LIVE": bars(["2026-10-12", "2026-10-13", "2026-10-14", "2026-10-15"], [1.0, 2.0, 3.0, 4.0]),
+        # Starts late, misses a day, then is delisted before the last date
+        "GONE": bars(["2026-10-13", "2026-10-15"], [10.0, 11.0]),
+        "OLD": bars(["2026-10-12", "2026-10-13"], [5.0, 6.0]),
+    })
+    dates, closes = matrix.closes(["GONE", "OLD"])
+    assert list(dates.strftime("%m-%d")) == ["10-12", "10-13", "10-14", "10-15"]
+    np.testing.assert_array_equal(closes[:, 0], [np.nan, 10.0, 10.0, 11.0])
+    np.testing.assert_array_equal(closes[:, 1], [5.0, 6.0, np.nan, np.nan])
+
+    old = matrix.frame("OLD")
+    assert list(old["close"]) == [5.0, 6.0]
+    assert list(matrix.frame("GONE", days=2)["close"]) == [10.0, 11.0]
+    # A delisted symbol has no flat run of zero returns after its last bar
+    assert matrix.returns(["LIVE", "OLD"], 3).shape[0] == 1
+
+
+def test_readers_never_mix_builds(tmp_path):
+    writer = PriceMatrix(str(tmp_path))
+    reader = PriceMatrix(str(tmp_path))
+    writer.write({"A": bars(["2026-10-12"], [1.0])})
+    errors = []
+
+    def read():
+        for _ in range(300):
+            try:
+                dates, closes = reader.closes(["A"])
+                assert len(dates) == closes.shape[0]
+            except Exception as e:  # pragma: no cover - reported below
+                errors.append(e)
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    for n in range(2, 30):
+        days = pd.bdate_range("2026-01-01", periods=n)
+        writer.write({"A": bars(days, np.arange(n, dtype=float))})
+    thread.join()
+    assert errors == []
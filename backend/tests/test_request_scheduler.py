@@ -0,0 +1,36 @@
+import threading
+import time
+
+import pytest
+
+from request_scheduler import Priority, RateLimited, RequestScheduler
+
+
+def test_waiting_interactive_call_overtakes_earlier_batch_call():
+    scheduler = RequestScheduler(per_minute=600, per_day=0)
+    # Out of quota: the next token appears in 0.3s, then one every 0.1s
+    scheduler.report_quota_exceeded(0.3)
+    granted = []
+
+    def call(priority):
+        scheduler.acquire(priority, timeout=5)
+        granted.append(priority)
+
+    batch = threading.Thread(target=call, args=(Priority.BATCH,))
+    batch.start()
+    time.sleep(0.05)
+    interactive = threading.Thread(target=call, args=(Priority.INTERACTIVE,))
+    interactive.start()
+    batch.join()
+    interactive.join()
+
+    assert granted == [Priority.INTERACTIVE, Priority.BATCH]
+    assert scheduler.get_stats()["granted"] == 2
+
+
+def test_call_that_cannot_get_quota_in_time_is_limited():
+    scheduler = RequestScheduler(per_minute=1, per_day=0)
+    scheduler.acquire(Priority.INTERACTIVE, timeout=0)
+    with pytest.raises(RateLimited):
+        scheduler.acquire(Priority.INTERACTIVE, timeout=0.1)
+    assert scheduler.get_stats()["limited"] == 1
@@ -0,0 +1,38 @@
+from sqlalchemy import select
+
+from create_tables import normalize_symbols
+from database import engine
+from models import Holding, Portfolio, Transaction
+from revaluation import apply_prices, holding_symbols
+
+
+def add_holding(db, portfolio, symbol, shares, average_price):
+    db.add(Holding(portfolio_id=portfolio.id, symbol=symbol, company_name=symbol, shares=shares,
+                   average_price=average_price, current_price=average_price))
+    db.commit()
+
+
+def test_mixed_case_holding_is_repriced_after_normalizing(db, portfolio):
+    # Stored as typed, before symbols were upper-cased on write
+    add_holding(db, portfolio, "aapl ", 10, 100.0)
+    add_holding(db, portfolio, "MSFT", 5, 200.0)
+    db.add(Transaction(portfolio_id=portfolio.id, symbol="Aapl", transaction_type="BUY", shares=10, price=100.0, total_amount=1000.0))
+    db.commit()
+
+    assert normalize_symbols(engine) == 2
+    assert sorted(holding_symbols(db)) == ["AAPL", "MSFT"]
+    assert db.scalars(select(Transaction.symbol)).all() == ["AAPL"]
+
+    assert apply_prices(db, {"AAPL": 150.0, "MSFT": 210.0}) == 2
+    db.expire_all()
+    aapl = db.scalars(select(Holding).where(Holding.symbol == "AAPL")).one()
+    assert aapl.current_price == 150.0
+    assert aapl.market_value == 1500.0
+    assert aapl.gain_loss == 500.0
+    assert db.get(Portfolio, portfolio.id).total_value == 1500.0 + 1050.0
+
+
+def test_normalizing_twice_changes_nothing(db, portfolio):
+    add_holding(db, portfolio, "msft", 1, 10.0)
+    assert normalize_symbols(engine) == 1
+    assert normalize_symbols(engine) == 0
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+import pytest
+from statistics import NormalDist
+
+from risk_engine import compute_risk
+
+
+def risk(returns, value=1000.0):
+    frame = pd.DataFrame({"AAA": returns})
+    result = compute_risk(frame, pd.Series({"AAA": 1.0}), value, confidence_levels=(0.95,), horizons=(1, 4))
+    return {row["horizon_days"]: row for row in result["var"]}
+
+
+def test_historical_var_and_cvar_of_an_evenly_spaced_sample():
+    # Returns -5.0% .. +4.9% in 0.1% steps; the 5% tail is the five worst days
+    var = risk((np.arange(100) - 50) / 1000)
+    assert var[1]["historical_var"] == pytest.approx(45.05)
+    assert var[1]["historical_cvar"] == pytest.approx(48.0)
+    # Square-root-of-time scaling
+    assert var[4]["historical_var"] == pytest.approx(2 * 45.05)
+
+
+def test_var_and_cvar_of_normal_returns_match_the_closed_form():
+    sd = 0.01
+    returns = np.random.default_rng(11).normal(0, sd, 200_000)
+    z = NormalDist().inv_cdf(0.05)
+    expected_var = -z * sd * 1000
+    expected_cvar = sd * NormalDist().pdf(z) / 0.05 * 1000
+
+    var = risk(returns)[1]
+    assert var["parametric_var"] == pytest.approx(expected_var, rel=0.01)
+    assert var["parametric_cvar"] == pytest.approx(expected_cvar, rel=0.01)
+    assert var["historical_var"] == pytest.approx(expected_var, rel=0.02)
+    assert var["historical_cvar"] == pytest.approx(expected_cvar, rel=0.02)
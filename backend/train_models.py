@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+from dotenv import load_dotenv
+
+from model_registry import MODEL_DIR
+from request_scheduler import ALPHA_VANTAGE_CALLS_PER_DAY, ALPHA_VANTAGE_CALLS_PER_MINUTE, Priority
+
+load_dotenv()
+
+TRAIN_WORKERS = int(os.getenv("TRAIN_WORKERS", str(os.cpu_count() or 1)))
+TRAIN_RUNS_DIR = os.getenv("TRAIN_RUNS_DIR", os.path.join(MODEL_DIR, "runs"))
+RUN_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Set in each worker process by _init_worker
+_predictor = None
+_forest_jobs = 1
+
+
+def forest_jobs(workers: int) -> int:
+    """Cores each worker's RandomForest may use so workers x n_jobs stays within the CPU count"""
+    return max(1, (os.cpu_count() or 1) // max(workers, 1))
+
+
+def _init_worker(workers: int):
+    global _predictor, _forest_jobs
+    from database import engine
+    from market_client import MarketDataClient
+    from portfolio_analytics import ALPHA_VANTAGE_API_KEY, PortfolioAnalytics
+    from request_scheduler import RequestScheduler
+    from ml_models import StockPredictor
+
+    # Never reuse pooled connections that belong to the parent process
+    engine.dispose(close=False)
+    # Split the provider quota so all workers together stay within it
+    scheduler = RequestScheduler(
+        max(1, ALPHA_VANTAGE_CALLS_PER_MINUTE // workers) if ALPHA_VANTAGE_CALLS_PER_MINUTE > 0 else 0,
+        max(1, ALPHA_VANTAGE_CALLS_PER_DAY // workers) if ALPHA_VANTAGE_CALLS_PER_DAY > 0 else 0,
+    )
+    analytics = PortfolioAnalytics(client=MarketDataClient(ALPHA_VANTAGE_API_KEY, scheduler=scheduler))
+    _predictor = StockPredictor(analytics)
+    _forest_jobs = forest_jobs(workers)
+
+
+def _train_one(symbol: str) -> Dict:
+    try:
+        result = _predictor.train_model(symbol, Priority.BATCH, n_jobs=_forest_jobs)
+    except Exception as e:
+        return {"symbol": symbol, "status": "failed", "error": str(e)}
+    if "error" in result:
+        return {"symbol": symbol, "status": "skipped", **result}
+    return {"symbol": symbol, "status": "trained", **result}
+
+
+def default_run_id() -> str:
+    # One run per UTC day, so restarting an interrupted nightly job resumes it
+    return datetime.now(timezone.utc).strftime("%Y%m%d")
+
+
+def _checkpoint_path(run_id: str) -> str:
+    if not RUN_ID_PATTERN.match(run_id):
+        raise ValueError(f"Invalid run id: {run_id!r}")
+    return os.path.join(TRAIN_RUNS_DIR, f"{run_id}.jsonl")
+
+
+def load_run(run_id: str) -> List[Dict]:
+    """Per-symbol results recorded so far for a run"""
+    try:
+        with open(_checkpoint_path(run_id)) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+def summarize(run_id: str, results: List[Dict]) -> Dict:
+    counts = {}
+    for result in results:
+        counts[result["status"]] = counts.get(result["status"], 0) + 1
+    return {"run_id": run_id, "counts": counts, "results": results}
+
+
+def held_symbols() -> List[str]:
+    from database import SessionLocal
+    from revaluation import holding_symbols
+
+    db = SessionLocal()
+    try:
+        return holding_symbols(db)
+    finally:
+        db.close()
+
+
+def train_universe(symbols: List[str], workers: int = TRAIN_WORKERS, run_id: Optional[str] = None,
+                   resume: bool = True, progress: Optional[Callable[[Dict], None]] = None,
+                   stop: Optional[threading.Event] = None) -> Dict:
+    """Train and register models for symbols across a process pool.
+
+    Every finished symbol is appended to the run's checkpoint file, so a
+    resumed run only trains what is left. Failures are recorded per symbol
+    and retried on the next resume. Workers are spawned rather than forked
+    so this is safe to call from the threaded API server. Setting stop
+    drops the symbols not yet started; the ones in progress finish and are
+    checkpointed before this returns.
+    """
+    run_id = run_id or default_run_id()
+    os.makedirs(TRAIN_RUNS_DIR, exist_ok=True)
+
+    done = {r["symbol"]: r for r in load_run(run_id) if r["status"] != "failed"} if resume else {}
+    if not resume and os.path.exists(_checkpoint_path(run_id)):
+        os.remove(_checkpoint_path(run_id))
+    pending = [symbol for symbol in dict.fromkeys(symbols) if symbol not in done]
+
+    results = list(done.values())
+    if pending and not (stop is not None and stop.is_set()):
+        workers = max(1, min(workers, len(pending)))
+        with open(_checkpoint_path(run_id), "a") as checkpoint, \
+                ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                    initializer=_init_worker, initargs=(workers,)) as pool:
+            # At most one symbol per worker in flight, so a stop leaves nothing queued in the pool
+            queue = iter(pending)
+            futures = {}
+            while True:
+                while len(futures) < workers and not (stop is not None and stop.is_set()):
+                    symbol = next(queue, None)
+                    if symbol is None:
+                        break
+                    futures[pool.submit(_train_one, symbol)] = symbol
+                if not futures:
+                    break
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    symbol = futures.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        # The worker process itself died; record it and carry on with the rest
+                        result = {"symbol": symbol, "status": "failed", "error": str(e)}
+                    checkpoint.write(json.dumps(result) + "\n")
+                    checkpoint.flush()
+                    results.append(result)
+                    if progress is not None:
+                        progress(result)
+
+    return summarize(run_id, results)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train StockPredictor models for many symbols")
+    parser.add_argument("symbols", nargs="*", help="Symbols to train (default: every symbol held in a portfolio)")
+    parser.add_argument("--workers", type=int, default=TRAIN_WORKERS)
+    parser.add_argument("--run-id", default=None, help="Checkpoint name; defaults to today's date")
+    parser.add_argument("--no-resume", action="store_true", help="Retrain symbols already finished in this run")
+    args = parser.parse_args()
+
+    symbols = args.symbols or held_symbols()
+    summary = train_universe(
+        symbols, args.workers, args.run_id, resume=not args.no_resume,
+        progress=lambda r: print(json.dumps(r)),
+    )
+    print(f"Run {summary['run_id']}: {summary['counts']}")
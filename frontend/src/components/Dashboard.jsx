@@ -46,7 +46,12 @@ import {
   Legend,
   ArcElement,
 } from "chart.js";
-import { portfolioAPI, stockAPI } from "../services/api";
+import {
+  portfolioAPI,
+  stockAPI,
+  subscribeMarketStream,
+  applyPriceUpdate,
+} from "../services/api";
 import toast from "react-hot-toast";
 
 ChartJS.register(
@@ -64,6 +69,7 @@ const Dashboard = () => {
   const [portfolios, setPortfolios] = useState([]);
   const [selectedPortfolio, setSelectedPortfolio] = useState(null);
   const [holdings, setHoldings] = useState([]);
+  const holdingSymbols = holdings.map((holding) => holding.symbol).join(",");
   const [analytics, setAnalytics] = useState({});
   const [openPortfolioDialog, setOpenPortfolioDialog] = useState(false);
   const [openHoldingDialog, setOpenHoldingDialog] = useState(false);
@@ -85,9 +91,29 @@ const Dashboard = () => {
     loadPortfolios();
   }, []);
 
+  useEffect(
+    () =>
+      subscribeMarketStream({
+        onPrice: (update) =>
+          setHoldings((current) =>
+            current.map((holding) => applyPriceUpdate(holding, update))
+          ),
+        onPortfolio: (update) =>
+          setPortfolios((current) =>
+            current.map((portfolio) =>
+              portfolio.id === update.portfolio_id
+                ? { ...portfolio, total_value: update.total_value }
+                : portfolio
+            )
+          ),
+      }),
+    []
+  );
+
   useEffect(() => {
     if (selectedPortfolio) {
-      loadHoldings();
+      // The overview already carries each portfolio's holdings
+      setHoldings(selectedPortfolio.holdings || []);
       loadAnalytics();
     }
   }, [selectedPortfolio]);
@@ -96,29 +122,27 @@ const Dashboard = () => {
     if (holdings.length > 0) {
       loadPredictions();
     }
-  }, [holdings]);
+    // Streamed price updates change holdings but not which symbols are held
+  }, [holdingSymbols]);
 
   const loadPortfolios = async () => {
     try {
-      const response = await portfolioAPI.getPortfolios();
-      setPortfolios(response.data);
-      if (response.data.length > 0 && !selectedPortfolio) {
-        setSelectedPortfolio(response.data[0]);
+      const response = await portfolioAPI.getOverview();
+      const overview = response.data.portfolios;
+      setPortfolios(overview);
+      const selected =
+        selectedPortfolio &&
+        overview.find((portfolio) => portfolio.id === selectedPortfolio.id);
+      if (selected) {
+        setHoldings(selected.holdings);
+      } else if (overview.length > 0) {
+        setSelectedPortfolio(overview[0]);
       }
     } catch (error) {
       toast.error("Failed to load portfolios");
     }
   };
 
-  const loadHoldings = async () => {
-    try {
-      const response = await portfolioAPI.getHoldings(selectedPortfolio.id);
-      setHoldings(response.data);
-    } catch (error) {
-      toast.error("Failed to load holdings");
-    }
-  };
-
   const loadAnalytics = async () => {
     try {
       const response = await portfolioAPI.getAnalytics(selectedPortfolio.id);
@@ -168,7 +192,7 @@ const Dashboard = () => {
         shares: "",
         average_price: "",
       });
-      loadHoldings();
+      loadPortfolios();
       loadAnalytics();
       toast.success("Holding added successfully!");
     } catch (error) {
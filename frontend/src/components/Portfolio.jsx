@@ -31,13 +31,19 @@ import {
 } from "@mui/material";
 import { ArrowBack, Add, TrendingUp, TrendingDown } from "@mui/icons-material";
 import { Line, Bar } from "react-chartjs-2";
-import { portfolioAPI, stockAPI } from "../services/api";
+import {
+  portfolioAPI,
+  stockAPI,
+  subscribeMarketStream,
+  applyPriceUpdate,
+} from "../services/api";
 import toast from "react-hot-toast";
 
 const Portfolio = () => {
   const { id } = useParams();
   const [portfolio, setPortfolio] = useState(null);
   const [holdings, setHoldings] = useState([]);
+  const holdingSymbols = holdings.map((holding) => holding.symbol).join(",");
   const [analytics, setAnalytics] = useState({});
   const [tabValue, setTabValue] = useState(0);
   const [openTransactionDialog, setOpenTransactionDialog] = useState(false);
@@ -54,11 +60,29 @@ const Portfolio = () => {
     loadPortfolioData();
   }, [id]);
 
+  useEffect(
+    () =>
+      subscribeMarketStream({
+        onPrice: (update) =>
+          setHoldings((current) =>
+            current.map((holding) => applyPriceUpdate(holding, update))
+          ),
+        onPortfolio: (update) =>
+          setPortfolio((current) =>
+            current && current.id === update.portfolio_id
+              ? { ...current, total_value: update.total_value }
+              : current
+          ),
+      }),
+    []
+  );
+
   useEffect(() => {
     if (holdings.length > 0) {
       loadHistoricalData();
     }
-  }, [holdings]);
+    // Streamed price updates change holdings but not which symbols are held
+  }, [holdingSymbols]);
 
   const loadPortfolioData = async () => {
     try {
@@ -379,8 +403,10 @@ const Portfolio = () => {
                   {analytics.metrics?.max_drawdown || 0}%
                 </Typography>
                 <Typography variant="body1">
-                  <strong>Risk Level:</strong>{" "}
-                  {analytics.risk_assessment?.volatility_level || "Unknown"}
+                  <strong>1-Day VaR (95%):</strong>{" "}
+                  {analytics.risk_assessment?.var?.length
+                    ? `$${analytics.risk_assessment.var[0].historical_var.toLocaleString()}`
+                    : "Unknown"}
                 </Typography>
               </Box>
             </Paper>
@@ -58,6 +58,7 @@ const RiskDashboard = () => {
   const [selectedPortfolio, setSelectedPortfolio] = useState("");
   const [holdings, setHoldings] = useState([]);
   const [analytics, setAnalytics] = useState({});
+  const [simulation, setSimulation] = useState(null);
   const [tabValue, setTabValue] = useState(0);
 
   useEffect(() => {
@@ -93,6 +94,17 @@ const RiskDashboard = () => {
     } catch (error) {
       toast.error("Failed to load risk data");
     }
+    try {
+      const simulationResponse = await portfolioAPI.simulate(
+        selectedPortfolio,
+        { days: 30, paths: 10000 }
+      );
+      setSimulation(
+        simulationResponse.data.error ? null : simulationResponse.data
+      );
+    } catch (error) {
+      setSimulation(null);
+    }
   };
 
   // Risk Score Calculation
@@ -161,52 +173,61 @@ const RiskDashboard = () => {
   };
 
   // Volatility chart data
+  const holdingRisk = analytics.risk_assessment?.holdings || [];
+  const volatilityColor = (volatility, alpha) =>
+    volatility > 40
+      ? `rgba(244, 67, 54, ${alpha})`
+      : volatility > 25
+      ? `rgba(255, 193, 7, ${alpha})`
+      : `rgba(76, 175, 80, ${alpha})`;
   const volatilityData = {
-    labels: holdings.map((h) => h.symbol),
+    labels: holdingRisk.map((h) => h.symbol),
     datasets: [
       {
-        label: "Volatility (%)",
-        data: holdings.map((h) => Math.abs(h.gain_loss_percent) || 0),
-        backgroundColor: holdings.map((h) =>
-          Math.abs(h.gain_loss_percent) > 15
-            ? "rgba(244, 67, 54, 0.8)"
-            : Math.abs(h.gain_loss_percent) > 10
-            ? "rgba(255, 193, 7, 0.8)"
-            : "rgba(76, 175, 80, 0.8)"
+        label: "Annualized Volatility (%)",
+        data: holdingRisk.map((h) => h.annual_volatility || 0),
+        backgroundColor: holdingRisk.map((h) =>
+          volatilityColor(h.annual_volatility, 0.8)
         ),
-        borderColor: holdings.map((h) =>
-          Math.abs(h.gain_loss_percent) > 15
-            ? "rgba(244, 67, 54, 1)"
-            : Math.abs(h.gain_loss_percent) > 10
-            ? "rgba(255, 193, 7, 1)"
-            : "rgba(76, 175, 80, 1)"
+        borderColor: holdingRisk.map((h) =>
+          volatilityColor(h.annual_volatility, 1)
         ),
         borderWidth: 1,
       },
     ],
   };
 
+  // Value at Risk from the risk engine, in dollars
+  const findVar = (confidence, horizonDays) =>
+    (analytics.risk_assessment?.var || []).find(
+      (v) => v.confidence === confidence && v.horizon_days === horizonDays
+    ) || {};
+  const formatLoss = (value) =>
+    value == null ? "N/A" : `$${value.toLocaleString()}`;
+  const formatRatio = (value) => (value == null ? "N/A" : value.toFixed(2));
+
   // VaR simulation data (simplified)
+  const simulationBands = simulation?.bands || { day: [] };
+  const simulationBand = (label, key, color, fill) => ({
+    label,
+    data: simulationBands[key] || [],
+    borderColor: color,
+    backgroundColor: "rgba(75, 192, 192, 0.1)",
+    tension: 0.4,
+    fill,
+  });
   const varData = {
-    labels: Array.from({ length: 30 }, (_, i) => `Day ${i + 1}`),
+    labels: simulationBands.day.map((day) => `Day ${day}`),
     datasets: [
-      {
-        label: "Portfolio Value",
-        data: Array.from({ length: 30 }, (_, i) => {
-          const baseValue = analytics.total_value || 10000;
-          const dailyReturn = (Math.random() - 0.5) * 0.04; // Random daily return
-          return baseValue * (1 + (dailyReturn * (i + 1)) / 30);
-        }),
-        borderColor: "rgb(75, 192, 192)",
-        backgroundColor: "rgba(75, 192, 192, 0.1)",
-        tension: 0.4,
-        fill: true,
-      },
+      simulationBand("95th Percentile", "p95", "rgba(76, 175, 80, 1)", false),
+      simulationBand("Median Portfolio Value", "p50", "rgb(75, 192, 192)", "-1"),
+      simulationBand("5th Percentile", "p5", "rgba(244, 67, 54, 1)", "-1"),
       {
         label: "95% VaR Threshold",
-        data: Array.from(
-          { length: 30 },
-          () => (analytics.total_value || 10000) * 0.95
+        data: simulationBands.day.map(
+          () =>
+            (analytics.total_value || 0) -
+            (findVar(0.95, 1).historical_var || 0)
         ),
         borderColor: "rgba(255, 99, 132, 1)",
         backgroundColor: "transparent",
@@ -387,7 +408,7 @@ const RiskDashboard = () => {
                   <Box sx={{ mt: 2 }}>
                     <Typography variant="body1" sx={{ mb: 1 }}>
                       <strong>Beta:</strong>{" "}
-                      {(Math.random() * 1.5 + 0.5).toFixed(2)}
+                      {formatRatio(analytics.risk_assessment?.beta)}
                     </Typography>
                     <Typography variant="body1" sx={{ mb: 1 }}>
                       <strong>Alpha:</strong>{" "}
@@ -395,7 +416,7 @@ const RiskDashboard = () => {
                     </Typography>
                     <Typography variant="body1" sx={{ mb: 1 }}>
                       <strong>Correlation with Market:</strong>{" "}
-                      {(Math.random() * 0.8 + 0.2).toFixed(2)}
+                      {formatRatio(analytics.risk_assessment?.correlation)}
                     </Typography>
                     <Typography variant="body1" sx={{ mb: 1 }}>
                       <strong>Information Ratio:</strong>{" "}
@@ -604,7 +625,11 @@ const RiskDashboard = () => {
                         plugins: {
                           title: {
                             display: true,
-                            text: "30-Day Portfolio Value Simulation",
+                            text: simulation
+                              ? `30-Day Monte Carlo Simulation (${(
+                                  simulation.probability_of_loss * 100
+                                ).toFixed(1)}% chance of loss)`
+                              : "30-Day Portfolio Value Simulation",
                           },
                         },
                         scales: {
@@ -628,7 +653,7 @@ const RiskDashboard = () => {
                       1-Day VaR (95%)
                     </Typography>
                     <Typography variant="h4" color="error.main">
-                      ${((analytics.total_value || 0) * 0.025).toLocaleString()}
+                      {formatLoss(findVar(0.95, 1).historical_var)}
                     </Typography>
                     <Typography variant="body2" color="textSecondary">
                       Maximum expected loss in 1 day (95% confidence)
@@ -644,7 +669,7 @@ const RiskDashboard = () => {
                       30-Day VaR (99%)
                     </Typography>
                     <Typography variant="h4" color="error.main">
-                      ${((analytics.total_value || 0) * 0.15).toLocaleString()}
+                      {formatLoss(findVar(0.99, 30).historical_var)}
                     </Typography>
                     <Typography variant="body2" color="textSecondary">
                       Maximum expected loss in 30 days (99% confidence)
@@ -33,10 +33,20 @@ import { Line } from "react-chartjs-2"; // Removed Candlestick
 import { stockAPI } from "../services/api";
 import toast from "react-hot-toast";
 
+// Columnar bars from /stock/{symbol}/historical?format=columnar
+const EMPTY_HISTORY = {
+  dates: [],
+  open: [],
+  high: [],
+  low: [],
+  close: [],
+  volume: [],
+};
+
 const StockAnalysis = () => {
   const { symbol } = useParams();
   const [stockData, setStockData] = useState(null);
-  const [historicalData, setHistoricalData] = useState([]);
+  const [historicalData, setHistoricalData] = useState(EMPTY_HISTORY);
   const [prediction, setPrediction] = useState(null);
   const [tabValue, setTabValue] = useState(0);
   const [loading, setLoading] = useState(true);
@@ -51,13 +61,13 @@ const StockAnalysis = () => {
       const [priceResponse, historicalResponse, predictionResponse] =
         await Promise.all([
           stockAPI.getPrice(symbol),
-          stockAPI.getHistorical(symbol, 90),
+          stockAPI.getHistorical(symbol, 90, { format: "columnar" }),
           stockAPI.getPrediction(symbol),
         ]);
 
       setStockData(priceResponse.data);
-      if (historicalResponse.data && historicalResponse.data.data) {
-        setHistoricalData(historicalResponse.data.data);
+      if (historicalResponse.data && historicalResponse.data.dates) {
+        setHistoricalData(historicalResponse.data);
       }
       setPrediction(predictionResponse.data);
     } catch (error) {
@@ -69,13 +79,13 @@ const StockAnalysis = () => {
 
   // Price chart data
   const priceChartData = {
-    labels: historicalData
+    labels: historicalData.dates
       .slice(-30)
-      .map((d) => new Date(d["1. timestamp"]).toLocaleDateString()),
+      .map((d) => new Date(`${d}T00:00:00`).toLocaleDateString()),
     datasets: [
       {
         label: "Close Price",
-        data: historicalData.slice(-30).map((d) => parseFloat(d["4. close"])),
+        data: historicalData.close.slice(-30),
         borderColor: "rgb(75, 192, 192)",
         backgroundColor: "rgba(75, 192, 192, 0.1)",
         tension: 0.4,
@@ -83,9 +93,9 @@ const StockAnalysis = () => {
       },
       {
         label: "Volume (scaled)",
-        data: historicalData
+        data: historicalData.volume
           .slice(-30)
-          .map((d) => parseFloat(d["5. volume"]) / 1000000),
+          .map((v) => v / 1000000),
         borderColor: "rgba(255, 99, 132, 0.5)",
         backgroundColor: "rgba(255, 99, 132, 0.1)",
         type: "bar",
@@ -96,7 +106,7 @@ const StockAnalysis = () => {
 
   // Technical indicators
   const calculateSMA = (data, period) => {
-    const prices = data.map((d) => parseFloat(d["4. close"]));
+    const prices = data.close;
     const sma = [];
     for (let i = period - 1; i < prices.length; i++) {
       const sum = prices
@@ -108,7 +118,7 @@ const StockAnalysis = () => {
   };
 
   const calculateRSI = (data, period = 14) => {
-    const prices = data.map((d) => parseFloat(d["4. close"]));
+    const prices = data.close;
     const changes = [];
     for (let i = 1; i < prices.length; i++) {
       changes.push(prices[i] - prices[i - 1]);
@@ -135,13 +145,13 @@ const StockAnalysis = () => {
 
   // Technical analysis chart
   const technicalChartData = {
-    labels: historicalData
+    labels: historicalData.dates
       .slice(-30)
-      .map((d) => new Date(d["1. timestamp"]).toLocaleDateString()),
+      .map((d) => new Date(`${d}T00:00:00`).toLocaleDateString()),
     datasets: [
       {
         label: "Price",
-        data: historicalData.slice(-30).map((d) => parseFloat(d["4. close"])),
+        data: historicalData.close.slice(-30),
         borderColor: "rgb(75, 192, 192)",
         backgroundColor: "rgba(75, 192, 192, 0.1)",
         tension: 0.4,
@@ -245,7 +255,7 @@ const StockAnalysis = () => {
                 Price & Volume (Last 30 Days)
               </Typography>
               <Box sx={{ height: 400 }}>
-                {historicalData.length > 0 && (
+                {historicalData.dates.length > 0 && (
                   <Line
                     data={priceChartData}
                     options={{
@@ -278,30 +288,30 @@ const StockAnalysis = () => {
                 <Typography variant="h6" gutterBottom>
                   Daily Statistics
                 </Typography>
-                {historicalData.length > 0 && (
+                {historicalData.dates.length > 0 && (
                   <Box>
                     <Typography variant="body1">
                       <strong>Open:</strong> $
                       {parseFloat(
-                        historicalData[historicalData.length - 1]["1. open"]
+                        historicalData.open[historicalData.open.length - 1]
                       ).toFixed(2)}
                     </Typography>
                     <Typography variant="body1">
                       <strong>High:</strong> $
                       {parseFloat(
-                        historicalData[historicalData.length - 1]["2. high"]
+                        historicalData.high[historicalData.high.length - 1]
                       ).toFixed(2)}
                     </Typography>
                     <Typography variant="body1">
                       <strong>Low:</strong> $
                       {parseFloat(
-                        historicalData[historicalData.length - 1]["3. low"]
+                        historicalData.low[historicalData.low.length - 1]
                       ).toFixed(2)}
                     </Typography>
                     <Typography variant="body1">
                       <strong>Volume:</strong>{" "}
                       {parseInt(
-                        historicalData[historicalData.length - 1]["5. volume"]
+                        historicalData.volume[historicalData.volume.length - 1]
                       ).toLocaleString()}
                     </Typography>
                   </Box>
@@ -316,33 +326,26 @@ const StockAnalysis = () => {
                 <Typography variant="h6" gutterBottom>
                   Price Range (30 Days)
                 </Typography>
-                {historicalData.length > 0 && (
+                {historicalData.dates.length > 0 && (
                   <Box>
                     <Typography variant="body1">
                       <strong>Highest:</strong> $
                       {Math.max(
-                        ...historicalData
-                          .slice(-30)
-                          .map((d) => parseFloat(d["2. high"]))
+                        ...historicalData.high.slice(-30)
                       ).toFixed(2)}
                     </Typography>
                     <Typography variant="body1">
                       <strong>Lowest:</strong> $
                       {Math.min(
-                        ...historicalData
-                          .slice(-30)
-                          .map((d) => parseFloat(d["3. low"]))
+                        ...historicalData.low.slice(-30)
                       ).toFixed(2)}
                     </Typography>
                     <Typography variant="body1">
                       <strong>Average Volume:</strong>{" "}
                       {Math.round(
-                        historicalData
+                        historicalData.volume
                           .slice(-30)
-                          .reduce(
-                            (sum, d) => sum + parseInt(d["5. volume"]),
-                            0
-                          ) / 30
+                          .reduce((sum, v) => sum + v, 0) / 30
                       ).toLocaleString()}
                     </Typography>
                   </Box>
@@ -361,7 +364,7 @@ const StockAnalysis = () => {
                 Technical Indicators
               </Typography>
               <Box sx={{ height: 400 }}>
-                {historicalData.length > 0 && (
+                {historicalData.dates.length > 0 && (
                   <Line
                     data={technicalChartData}
                     options={{
@@ -441,17 +444,13 @@ const StockAnalysis = () => {
                 <Typography variant="body1">
                   <strong>Support:</strong> $
                   {Math.min(
-                    ...historicalData
-                      .slice(-20)
-                      .map((d) => parseFloat(d["3. low"]))
+                    ...historicalData.low.slice(-20)
                   ).toFixed(2)}
                 </Typography>
                 <Typography variant="body1">
                   <strong>Resistance:</strong> $
                   {Math.max(
-                    ...historicalData
-                      .slice(-20)
-                      .map((d) => parseFloat(d["2. high"]))
+                    ...historicalData.high.slice(-20)
                   ).toFixed(2)}
                 </Typography>
               </CardContent>
@@ -604,11 +603,9 @@ const StockAnalysis = () => {
                     <TableCell>52-Week High</TableCell>
                     <TableCell align="right">
                       $
-                      {historicalData.length > 0
+                      {historicalData.dates.length > 0
                         ? Math.max(
-                            ...historicalData.map((d) =>
-                              parseFloat(d["2. high"])
-                            )
+                            ...historicalData.high
                           ).toFixed(2)
                         : "N/A"}
                     </TableCell>
@@ -617,11 +614,9 @@ const StockAnalysis = () => {
                     <TableCell>52-Week Low</TableCell>
                     <TableCell align="right">
                       $
-                      {historicalData.length > 0
+                      {historicalData.dates.length > 0
                         ? Math.min(
-                            ...historicalData.map((d) =>
-                              parseFloat(d["3. low"])
-                            )
+                            ...historicalData.low
                           ).toFixed(2)
                         : "N/A"}
                     </TableCell>
@@ -629,14 +624,11 @@ const StockAnalysis = () => {
                   <TableRow>
                     <TableCell>Average Volume (30d)</TableCell>
                     <TableCell align="right">
-                      {historicalData.length > 0
+                      {historicalData.dates.length > 0
                         ? Math.round(
-                            historicalData
+                            historicalData.volume
                               .slice(-30)
-                              .reduce(
-                                (sum, d) => sum + parseInt(d["5. volume"]),
-                                0
-                              ) / 30
+                              .reduce((sum, v) => sum + v, 0) / 30
                           ).toLocaleString()
                         : "N/A"}
                     </TableCell>
@@ -39,6 +39,7 @@ export const authAPI = {
 
 export const portfolioAPI = {
   getPortfolios: () => api.get("/portfolios"),
+  getOverview: () => api.get("/overview"),
   createPortfolio: (data) => api.post("/portfolios", data),
   updatePortfolio: (id, data) => api.put(`/portfolios/${id}`, data),
   deletePortfolio: (id) => api.delete(`/portfolios/${id}`),
@@ -53,9 +54,33 @@ export const portfolioAPI = {
 
   getAnalytics: (portfolioId) =>
     api.get(`/portfolios/${portfolioId}/analytics`),
+  getSnapshots: (portfolioId, days = 252) =>
+    api.get(`/portfolios/${portfolioId}/snapshots`, { params: { days } }),
+  simulate: (portfolioId, params = {}) =>
+    api.get(`/portfolios/${portfolioId}/simulate`, { params }),
+  optimize: (portfolioId, params = {}) =>
+    api.get(`/portfolios/${portfolioId}/optimize`, { params }),
+  backtest: (portfolioId) => api.get(`/portfolios/${portfolioId}/backtest`),
+  backtestStrategy: (request) => api.post("/backtest", request),
+  revaluePortfolio: (portfolioId) =>
+    api.post(`/portfolios/${portfolioId}/revalue`),
+  revalueAll: () => api.post("/portfolios/revalue"),
 
   addTransaction: (portfolioId, data) =>
     api.post(`/portfolios/${portfolioId}/transactions`, data),
+  addTransactions: (portfolioId, transactions) =>
+    api.post(`/portfolios/${portfolioId}/transactions/bulk`, { transactions }),
+  importTransactions: (portfolioId, file) => {
+    const form = new FormData();
+    form.append("file", file);
+    return api.post(`/portfolios/${portfolioId}/import`, form);
+  },
+  getLots: (portfolioId, method) =>
+    api.get(`/portfolios/${portfolioId}/lots`, { params: { method } }),
+  rebuildPortfolio: (portfolioId, costMethod) =>
+    api.post(`/portfolios/${portfolioId}/rebuild`, null, {
+      params: { cost_method: costMethod },
+    }),
   getTransactions: (portfolioId) =>
     api.get(`/portfolios/${portfolioId}/transactions`),
   updateTransaction: (portfolioId, transactionId, data) =>
@@ -66,12 +91,58 @@ export const portfolioAPI = {
 
 export const stockAPI = {
   getPrice: (symbol) => api.get(`/stock/${symbol}/price`),
+  getQuotes: (symbols) => api.post("/stocks/quotes", { symbols }),
   getPrediction: (symbol) => api.get(`/stock/${symbol}/prediction`),
-  getHistorical: (symbol, days = 30) =>
-    api.get(`/stock/${symbol}/historical?days=${days}`),
+  getHistorical: (symbol, days = 30, params = {}) =>
+    api.get(`/stock/${symbol}/historical`, { params: { days, ...params } }),
   searchStocks: (query) => api.get(`/stock/search?q=${query}`),
 };
 
+// Server-sent price and portfolio-value updates; returns a function that closes the stream
+export const subscribeMarketStream = ({ onPrice, onPortfolio }) => {
+  const token = localStorage.getItem("token");
+  if (!token) {
+    return () => {};
+  }
+  const source = new EventSource(
+    `${API_BASE_URL}/stream/market?token=${encodeURIComponent(token)}`
+  );
+  if (onPrice) {
+    source.addEventListener("price", (e) => onPrice(JSON.parse(e.data)));
+  }
+  if (onPortfolio) {
+    source.addEventListener("portfolio", (e) => onPortfolio(JSON.parse(e.data)));
+  }
+  return () => source.close();
+};
+
+// Reprice a holding row from a streamed quote
+export const applyPriceUpdate = (holding, update) => {
+  if (holding.symbol !== update.symbol) {
+    return holding;
+  }
+  const marketValue = holding.shares * update.price;
+  return {
+    ...holding,
+    current_price: update.price,
+    market_value: marketValue,
+    gain_loss: (update.price - holding.average_price) * holding.shares,
+    gain_loss_percent:
+      holding.average_price > 0
+        ? ((update.price - holding.average_price) / holding.average_price) * 100
+        : 0,
+  };
+};
+
+// Long-running simulations, optimizations and predictions run as jobs polled by id
+export const jobAPI = {
+  submit: (request) => api.post("/jobs", request),
+  list: () => api.get("/jobs"),
+  get: (jobId) => api.get(`/jobs/${jobId}`),
+  getResult: (jobId) => api.get(`/jobs/${jobId}/result`),
+  cancel: (jobId) => api.delete(`/jobs/${jobId}`),
+};
+
 export const userAPI = {
   getProfile: () => api.get("/user/profile"),
   updateProfile: (data) => api.put("/user/profile", data),